@@ -12,6 +12,7 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 import plotly.express as px  # Ensure this is imported at top
 import os
@@ -19,9 +20,22 @@ import time
 import json
 import uuid
 import sys
+import sqlite3
+import threading
+import random
+import re
+import socket
+from html import escape
+from collections import deque, OrderedDict
 import plotly.graph_objects as go
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
+import receipts
+import metrics
+try:
+    import pyarrow as pa  # warm-start snapshots (ships with streamlit)
+except ImportError:
+    pa = None
 
 # ==========================================
 # 1. KERNEL SETUP
@@ -201,6 +215,14 @@ st.markdown("""
         color: #fff;
         text-shadow: 0 0 10px rgba(0, 255, 65, 0.5);
     }
+    /* Auto-dismiss in the browser (delay set inline), no server round trip */
+    .receipt-expire {
+        animation: receipt-out 0.8s ease forwards;
+        overflow: hidden;
+    }
+    @keyframes receipt-out {
+        to { opacity: 0; max-height: 0; padding: 0; margin: 0; border-width: 0; }
+    }
 
     /* --- NOTIFICATION BADGE --- */
     .notification-badge {
@@ -303,11 +325,968 @@ FILES = {
     "trans": "transactions_log"
 }
 
+VERSION_KEYS = ["data", "trans"]  # tables with a data version (fleet_meta rows)
+
+# Sheet columns per table + the column that identifies a row
+REQ_COLS = {
+    "data": ["Shift_ID", "Driver", "Car", "Status", "Approval_Status", 
+             "Start_Time", "End_Time", "Duration", "Total_Earnings", 
+             "Start_Wallet", "End_Wallet", "Cash_Collected", 
+             "Start_Fuel", "End_Fuel", "Rev"],
+    "trans": ["Trans_ID", "Date", "Driver", "Type", "Amount", 
+              "Method", "Notes", "Approval_Status", "Source", "Rev"]
+}
+ID_COLS = {"data": "Shift_ID", "trans": "Trans_ID"}
+REV_COL = "Rev"  # per-row revision, bumped by the storage layer on every update
+# History is partitioned by the month of this column ("shifts_log_2026-10", ...)
+PART_COLS = {"data": "Start_Time", "trans": "Date"}
+# Rows that can still change (everything else is append-only history)
+OPEN_STATES = {
+    "data": ("Status", ["Active", "Pending_Start", "Pending_End"]),
+    "trans": ("Approval_Status", ["Pending"])
+}
+HALALA = 100
+DATE_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"]
+# Typed in-memory schema: low-cardinality text -> category, money -> int halala
+SCHEMA = {
+    "data": {
+        "category": ["Driver", "Car", "Status", "Approval_Status"],
+        "datetime": {"Start_Time": "%Y-%m-%d %H:%M:%S", "End_Time": "%Y-%m-%d %H:%M:%S"},
+        "money": ["Total_Earnings", "Start_Wallet", "End_Wallet", "Cash_Collected"],
+        "hours": ["Duration"],
+        "small_int": ["Start_Fuel", "End_Fuel"],
+        "int": ["Rev"]
+    },
+    "trans": {
+        "category": ["Driver", "Type", "Method", "Approval_Status", "Source"],
+        "datetime": {"Date": "%Y-%m-%d %H:%M"},
+        "money": ["Amount"],
+        "int": ["Rev"]
+    }
+}
+NUM_COLS = ["Duration", "Total_Earnings", "Start_Wallet", "End_Wallet", "Cash_Collected",
+            "Start_Fuel", "End_Fuel", "Amount"]
+
 # ==========================================
-# 4. GOOGLE SHEETS DATABASE ENGINE (ANTI-DELETE & RETRY MODE)
+# 4. STORAGE ENGINE (GOOGLE SHEETS / SQLITE)
 # ==========================================
+# Backend secrets.toml ke [storage] se ya FLEET_* env vars se choose hota hai:
+#   [storage]
+#   backend = "sqlite"        # "sheets" (default) | "sqlite"
+#   sqlite_path = "fleet.db"
+def get_setting(name, default=None):
+    env = os.environ.get(f"FLEET_{name.upper()}")
+    if env is not None: return env
+    try:
+        return st.secrets.get("storage", {}).get(name, default)
+    except Exception:
+        return default
+
+def is_quota_error(e):
+    return "429" in str(e) or "Quota" in str(e)
+
+class QuotaExhausted(Exception):
+    pass
+
+def to_cell(v):
+    # DataFrame value -> plain value Google Sheets (RAW) / SQLite can store
+    if v is None: return ""
+    if isinstance(v, (pd.Timestamp, datetime)):
+        return "" if pd.isna(v) else v.strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        if pd.isna(v): return ""
+    except (TypeError, ValueError):
+        pass
+    if hasattr(v, "item"): return v.item()  # numpy -> python
+    return v
+
+def sar(halala):
+    # Money columns are kept as integer halala in memory -> SAR for display/maths
+    return halala / HALALA
+
+def parse_times(raw, fmt):
+    # Explicit formats only (fast path), then the other formats the app has written
+    s = raw.astype(str).str.strip()
+    out = pd.to_datetime(s, format=fmt, errors="coerce")
+    for alt in DATE_FORMATS:
+        miss = out.isna() & ~s.isin(["", "NaT", "nan", "None"])
+        if not miss.any(): break
+        if alt != fmt:
+            out[miss] = pd.to_datetime(s[miss], format=alt, errors="coerce")
+    return out
+
+def parse_hours(raw):
+    # Duration: decimal hours, or "H:MM:SS" from old hand-edited rows
+    num = pd.to_numeric(raw, errors="coerce")
+    s = raw.astype(str)
+    hms = num.isna() & s.str.contains(":")
+    if hms.any():
+        parts = s[hms].str.split(":", expand=True).apply(pd.to_numeric, errors="coerce").fillna(0)
+        num[hms] = sum(parts[i] / 60 ** i for i in parts.columns if i < 3)
+    return num.fillna(0).astype("float64")
+
+def normalise_frame(key, df):
+    # Raw sheet/SQL values -> canonical typed frame (done once, at load time)
+    spec = SCHEMA[key]
+    for c in REQ_COLS[key]:
+        if c not in df.columns: df[c] = ""
+    
+    for c in spec["money"]:
+        num = pd.to_numeric(df[c].astype(str).str.replace(",", ""), errors="coerce")
+        df[c] = (num.fillna(0) * HALALA).round().astype("int64")
+    for c in spec.get("hours", []):
+        df[c] = parse_hours(df[c])
+    for c in spec.get("small_int", []):
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0).round().astype("int16")
+    for c in spec.get("int", []):
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0).astype("int64")
+    for c, fmt in spec["datetime"].items():
+        df[c] = parse_times(df[c], fmt)
+    for c in spec["category"]:
+        df[c] = df[c].fillna("").astype(str).astype("category")
+    return df
+
+def concat_frames(key, frames, **kwargs):
+    # pd.concat that keeps category columns categorical (union of categories)
+    frames = [f for f in frames if len(f)] or frames[:1]
+    if len(frames) > 1:
+        frames = [f.copy() for f in frames]
+        for c in SCHEMA[key]["category"]:
+            cats = pd.api.types.union_categoricals([f[c] for f in frames]).categories
+            for f in frames:
+                f[c] = f[c].cat.set_categories(cats)
+    return pd.concat(frames, **kwargs)
+
+def rev_of(v):
+    try: return int(float(v or 0))
+    except (TypeError, ValueError): return 0
+
+def row_matches(current, cond):
+    # Field-level compare-and-set for one row. cond = {col: value or [allowed values]},
+    # optionally with "Rev". Same Rev = nothing changed -> ok. Different Rev = someone
+    # else wrote the row: still ok (merge) if every asserted field is unchanged.
+    fields = {c: v for c, v in cond.items() if c != REV_COL}
+    if REV_COL in cond and rev_of(current.get(REV_COL)) == rev_of(cond[REV_COL]):
+        return True
+    if not fields: return REV_COL not in cond
+    for c, want in fields.items():
+        allowed = want if isinstance(want, (list, tuple, set)) else [want]
+        if str(to_cell(current.get(c, ""))) not in [str(to_cell(a)) for a in allowed]:
+            return False
+    return True
+
+def expect_row(row, *cols):
+    # Preconditions for save_db(expect=...) taken from a row the user is looking at
+    cond = {c: row[c] for c in cols}
+    if REV_COL in row: cond[REV_COL] = rev_of(row[REV_COL])
+    return cond
+
+class WriteResult(dict):
+    # {row_id: "ok" | "conflict" | "missing"}; truthy only if every row went through.
+    # .version = the table's data version after this write (None if it wasn't bumped),
+    # .prev_version = the version it replaced
+    version = None
+    prev_version = None
+
+    def __bool__(self):
+        return all(v == "ok" for v in self.values())
+
+    def failed(self):
+        return [rid for rid, v in self.items() if v != "ok"]
+
+def month_of(v):
+    # "2026-10-05 08:00:00" -> "2026-10"; undated / legacy rows -> ""
+    s = str(v or "")[:7]
+    return s if re.fullmatch(r"\d{4}-\d{2}", s) else ""
+
+def add_months(month, n):
+    y, m = map(int, month.split("-"))
+    y, m = divmod(y * 12 + m - 1 + n, 12)
+    return f"{y:04d}-{m + 1:02d}"
+
+def this_month():
+    return (datetime.utcnow() + timedelta(hours=3)).strftime("%Y-%m")  # Riyadh
+
+def month_name(month):
+    # "2026-10" -> "October 2026"
+    return datetime.strptime(month, "%Y-%m").strftime("%B %Y")
+
+def scope_months(scope):
+    # Which months a view needs: "hot" = this + last month (shifts crossing month end),
+    # "month" = payroll month, "all" = everything, or one explicit "YYYY-MM"
+    if scope == "all": return None
+    if scope == "hot": return {this_month(), add_months(this_month(), -1)}
+    if scope == "month": return {this_month()}
+    return {scope}
+
+def part_title(key, month):
+    return f"{FILES[key]}_{month}" if month else FILES[key]
+
+class StorageBackend:
+    # Har backend do kaam karta hai:
+    #   months(key) -> stored partitions, e.g. ["", "2026-09", "2026-10"] ("" = legacy/undated)
+    #   load(key, month) -> normalised DataFrame of one partition of a table ('data' / 'trans')
+    #   apply(key, inserts, updates, deletes, expect) -> WriteResult (row-level write)
+    #     inserts = [{col: val}], updates = {row_id: {col: val}}, deletes = [row_id]
+    #     expect = {row_id: {col: val}} preconditions checked per row (see row_matches)
+    #   versions() -> {key: data version}, read from a tiny metadata range; every
+    #     apply() that changes rows bumps its table's version (monotonic)
+    #   open_rows(key, months, want) -> rows still open (OPEN_STATES) in those partitions,
+    #     plus legacy ("") rows dated in the `want` months
+    name = "base"
+
+    def months(self, key):
+        raise NotImplementedError
+
+    def load(self, key, month):
+        raise NotImplementedError
+
+    def versions(self):
+        raise NotImplementedError
+
+    def open_rows(self, key, months, want=None):
+        col, vals = OPEN_STATES[key]
+        frames = []
+        for m in months:
+            df = self.load(key, m)
+            keep = df[col].isin(vals)
+            if want and not m: keep |= df[PART_COLS[key]].dt.strftime("%Y-%m").isin(want)
+            frames.append(df[keep])
+        return concat_frames(key, frames, ignore_index=True) if frames else normalise_frame(key, pd.DataFrame())
+
+    def apply(self, key, inserts, updates, deletes, expect=None):
+        raise NotImplementedError
+
+class TokenBucket:
+    # rate_per_min tokens refill continuously; tokens may go negative = queued reservations
+    def __init__(self, rate_per_min):
+        self.rate = rate_per_min / 60.0
+        self.capacity = float(rate_per_min)
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def reserve(self):
+        # Take one token, return seconds to wait until it is actually ours
+        self.refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+class QuotaGovernor:
+    # Process-wide gate for every Google Sheets request (all sessions + writer thread).
+    # Reads/writes have their own per-minute bucket; a 429 puts the whole process
+    # in a cooldown (exponential backoff + jitter) instead of every session retrying.
+    def __init__(self, read_per_min=60, write_per_min=60, retries=5):
+        self.buckets = {"read": TokenBucket(read_per_min), "write": TokenBucket(write_per_min)}
+        self.retries = retries
+        self.lock = threading.Lock()
+        self.cooldown_until = 0.0
+        self.strikes = 0
+        self.shed = 0
+        self.throttled = 0
+
+    def _reserve(self, kind, max_wait):
+        with self.lock:
+            bucket = self.buckets[kind]
+            wait = bucket.reserve() + max(0.0, self.cooldown_until - time.monotonic())
+            if max_wait is not None and wait > max_wait:
+                bucket.tokens += 1  # give the slot back
+                self.shed += 1
+                metrics.inc("sheets_shed_total", kind=kind)
+                raise QuotaExhausted(f"Sheets {kind} budget exhausted (next slot in {wait:.0f}s)")
+            if wait > 0: self.throttled += 1
+            return wait
+
+    def _penalise(self):
+        metrics.inc("sheets_retries_total")
+        with self.lock:
+            self.strikes += 1
+            backoff = min(2 ** self.strikes, 64) * random.uniform(0.5, 1.0)
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + backoff)
+            for b in self.buckets.values():
+                b.refill()
+                b.tokens = min(b.tokens, 0.0)
+
+    def call(self, kind, fn, *args, max_wait=None, **kwargs):
+        for attempt in range(self.retries):
+            wait = self._reserve(kind, max_wait)
+            if wait > 0:
+                metrics.observe("sheets_wait_seconds", wait, kind=kind)
+                time.sleep(wait)
+            method = getattr(fn, "__name__", "call")
+            metrics.inc("sheets_calls_total", kind=kind, method=method)
+            try:
+                with metrics.timer("sheets_seconds", kind=kind, method=method):
+                    result = fn(*args, **kwargs)
+            except Exception as e:
+                metrics.inc("sheets_errors_total", kind=kind, quota=is_quota_error(e))
+                if not is_quota_error(e): raise
+                self._penalise()
+                continue
+            sent = result if kind == "read" else [list(args), list(kwargs.values())]
+            metrics.inc("sheets_bytes_total", metrics.payload_bytes(sent), kind=kind)
+            with self.lock:
+                self.strikes = 0
+            return result
+        raise QuotaExhausted("Google Sheets quota exhausted")
+
+    def status(self):
+        with self.lock:
+            out = {"cooldown": round(max(0.0, self.cooldown_until - time.monotonic()), 1),
+                   "shed": self.shed, "throttled": self.throttled}
+            for kind, b in self.buckets.items():
+                b.refill()
+                out[kind] = round(b.tokens, 1)
+                out[f"{kind}_capacity"] = b.capacity
+        out["degraded"] = out["cooldown"] > 0 or out["read"] < 1
+        return out
+
+class SnapshotStore:
+    # Last good frame per table as an Arrow IPC file. Opened memory-mapped, so
+    # a restart serves instantly and several worker processes on one box share
+    # the same page-cache copy. Files are replaced atomically (tmp + rename).
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, title):
+        return os.path.join(self.folder, f"{title}.arrow")
+
+    def titles(self):
+        return [f[:-6] for f in os.listdir(self.folder) if f.endswith(".arrow")]
+
+    def save(self, title, df, meta):
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}), b"fleet": json.dumps(meta).encode()
+        })
+        tmp = f"{self.path(title)}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, self.path(title))
+
+    def open(self, title):
+        if not os.path.exists(self.path(title)): return None
+        try:
+            with pa.memory_map(self.path(title), "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+            meta = json.loads(table.schema.metadata[b"fleet"])
+            return table.to_pandas(split_blocks=True), meta
+        except Exception:
+            return None  # half-written / old format -> ignore, normal load follows
+
+class SheetsBackend(StorageBackend):
+    # One worksheet per table per month ("shifts_log_2026-10"); the old single
+    # worksheet ("shifts_log") stays as the legacy partition "". The spreadsheet's
+    # own worksheet list is the manifest. Hot partitions (this + last month, legacy)
+    # are kept fresh with tail loads; older months are cold and re-read only
+    # after full_reload_minutes or our own writes to them. Scoped views never
+    # download a cold partition (or the legacy sheet): open_rows scans its status
+    # column and fetches just the open rows.
+    name = "sheets"
+    META = "fleet_meta"  # Table | Version, one row per table in VERSION_KEYS order
+
+    def __init__(self, client, sheet_name, governor, read_max_wait=0, full_reload_minutes=30,
+                 snapshots=None, manifest_ttl=60):
+        self.client = client
+        self.snapshots = snapshots
+        self.sheet_name = sheet_name
+        self.gov = governor
+        self.read_max_wait = read_max_wait
+        self.full_reload_s = full_reload_minutes * 60
+        self.manifest_ttl = manifest_ttl
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self._sh = None
+        self._ws = {}
+        self._titles = None
+        self._titles_at = 0.0
+        # Incremental state per worksheet title: typed frame indexed by sheet row
+        # number, header, time of last full download and IDs we changed since then.
+        # state_lock only guards the dicts (never held over the network); the
+        # reads of one title run under that title's own lock.
+        self.state_lock = threading.Lock()
+        self.state = {}
+        self.title_locks = {}
+        self.warming = set()  # titles served from a snapshot while their reconcile runs
+        self.scans = {}  # cold title -> open rows found by the last column scan
+
+    def read(self, fn, *args, **kwargs):
+        # Reads run on the page's script thread: by default never wait for a slot,
+        # shed to cached data instead (read_max_wait > 0 brings pacing back)
+        return self.gov.call("read", fn, *args, max_wait=self.read_max_wait, **kwargs)
+
+    def write(self, fn, *args, **kwargs):
+        return self.gov.call("write", fn, *args, **kwargs)
+
+    def _open(self):
+        # Spreadsheet/worksheet handles are opened once (each open = 1-2 API reads)
+        if self._sh is None:
+            self._sh = self.read(self.client.open, self.sheet_name)
+        return self._sh
+
+    def _manifest(self):
+        with self.lock:
+            if self._titles is None and self.snapshots:
+                # Warm start: trust the snapshot folder until the first re-read
+                self._titles = self.snapshots.titles() or None
+                self._titles_at = time.monotonic()
+            if self._titles is None or time.monotonic() - self._titles_at > self.manifest_ttl:
+                try:
+                    sheets = self.read(self._open().worksheets)
+                except QuotaExhausted:
+                    if self._titles is None: raise
+                    return self._titles  # degraded: last known list
+                self._ws.update({ws.title: ws for ws in sheets})
+                self._titles = [ws.title for ws in sheets]
+                self._titles_at = time.monotonic()
+            return self._titles
+
+    def months(self, key):
+        base = FILES[key]
+        found = {"" if t == base else t[len(base) + 1:] for t in self._manifest()
+                 if t == base or (t.startswith(base + "_") and month_of(t[len(base) + 1:]))}
+        return sorted(found)
+
+    def _worksheet(self, key, month, create=False):
+        title = part_title(key, month)
+        with self.lock:
+            sh = self._open()
+            if title not in self._ws:
+                try:
+                    self._ws[title] = self.read(sh.worksheet, title)
+                except gspread.exceptions.WorksheetNotFound:
+                    if not create: raise
+                    # First row of a new month -> new partition (header is written by _apply_part)
+                    self._ws[title] = self.write(sh.add_worksheet, title=title, rows=1000,
+                                                 cols=len(REQ_COLS[key]))
+                    self._titles = None
+            return sh, self._ws[title]
+
+    def _meta(self, create=False):
+        # Version worksheet; only looked up once the manifest says it exists
+        if self.META not in self._ws and self.META not in self._manifest() and not create:
+            return None
+        with self.lock:
+            sh = self._open()
+            if self.META not in self._ws:
+                try:
+                    self._ws[self.META] = self.read(sh.worksheet, self.META)
+                except gspread.exceptions.WorksheetNotFound:
+                    if not create: return None
+                    ws = self.write(sh.add_worksheet, title=self.META, rows=len(VERSION_KEYS) + 1, cols=2)
+                    self.write(ws.update, values=[["Table", "Version"]] + [[k, 0] for k in VERSION_KEYS],
+                               range_name="A1")
+                    self._ws[self.META] = ws
+                    self._titles = None
+            return self._ws[self.META]
+
+    def _read_versions(self, ws):
+        rows = self.read(ws.get_values, f"A2:B{len(VERSION_KEYS) + 1}")
+        return {r[0]: rev_of(r[1]) for r in rows if len(r) > 1 and r[0] in VERSION_KEYS}
+
+    @metrics.timed("backend_seconds")
+    def versions(self):
+        # The whole change check: one read of a 2x2 range
+        ws = self._meta()
+        return self._read_versions(ws) if ws is not None else {}
+
+    def _bump(self, key):
+        # After the rows are written. max(old + 1, clock in us) keeps it monotonic and
+        # unique when two processes bump at once; only our own table's cell is written.
+        try:
+            ws = self._meta(create=True)
+            prev = self._read_versions(ws).get(key, 0)
+            version = max(prev + 1, time.time_ns() // 1000)
+            self.write(ws.update, values=[[key, version]], range_name=f"A{VERSION_KEYS.index(key) + 2}")
+            return prev, version
+        except Exception:
+            return None, None  # rows are saved; other processes see them after the next bump
+
+    def _reset(self):
+        with self.lock:
+            self._sh = None
+            self._ws = {}
+            self._titles = None
+
+    def _frame(self, key, header, rows, index):
+        width = len(header)
+        rows = [(list(r) + [""] * width)[:width] for r in rows]
+        return normalise_frame(key, pd.DataFrame(rows, columns=header, index=list(index)))
+
+    def _full_load(self, key, worksheet):
+        values = self.read(worksheet.get_values)
+        header = values[0] if values else []
+        df = self._frame(key, header, values[1:], range(2, len(values) + 1))
+        return {"header": header, "df": df, "full_at": time.monotonic(), "dirty": set()}
+
+    def _tail_load(self, key, worksheet, state):
+        # Fetch only: rows after the high-water mark + rows still open/changed by us.
+        # The last known row is re-read too; if its ID moved, rows were deleted
+        # or re-ordered upstream -> caller falls back to a full load.
+        df, header = state["df"], state["header"]
+        id_col = ID_COLS[key]
+        if df.empty or id_col not in header: return None
+        
+        hid = header.index(id_col)
+        last_row = int(df.index[-1])
+        last_col = gspread.utils.rowcol_to_a1(1, len(header))[:-1]
+        col, vals = OPEN_STATES[key]
+        watch = set(df.index[df[col].isin(vals)])
+        if state["dirty"]:
+            watch |= set(df.index[df[id_col].astype(str).isin(state["dirty"])])
+        watch = sorted(int(r) for r in watch if r < last_row)
+        
+        res = self.read(worksheet.batch_get,
+                        [f"A{last_row}:{last_col}"] + [f"A{r}:{last_col}{r}" for r in watch])
+        rid = lambda row: str(row[hid]) if len(row) > hid else ""
+        
+        tail = list(res[0])
+        if not tail or rid(tail[0]) != str(df[id_col].iloc[-1]): return None
+        fresh = {last_row: tail[0]}
+        for r, vr in zip(watch, res[1:]):
+            row = list(vr[0]) if len(vr) else []
+            if rid(row) != str(df.at[r, id_col]): return None
+            fresh[r] = row
+        
+        changed = self._frame(key, header, list(fresh.values()), fresh.keys())
+        added = self._frame(key, header, tail[1:], range(last_row + 1, last_row + len(tail)))
+        if added.empty and changed.astype(str).equals(df.loc[changed.index].astype(str)):
+            return dict(state, dirty=set())  # nothing moved -> keep frame (and snapshot) as is
+        df = concat_frames(key, [df.drop(index=changed.index), changed, added]).sort_index()
+        return {"header": header, "df": df, "full_at": state["full_at"], "dirty": set()}
+
+    def _restore(self, title):
+        snap = self.snapshots.open(title) if self.snapshots else None
+        if snap is None: return None
+        df, meta = snap
+        if meta.get("sheet") != self.sheet_name: return None
+        age = max(0.0, time.time() - meta["full_at"])
+        return {"header": meta["header"], "df": df, "full_at": time.monotonic() - age, "dirty": set()}
+
+    def _persist(self, title, state):
+        if not self.snapshots: return
+        meta = {"sheet": self.sheet_name, "header": state["header"],
+                "full_at": time.time() - (time.monotonic() - state["full_at"])}
+        def write():
+            try: self.snapshots.save(title, state["df"], meta)
+            except Exception: pass  # snapshot is only an optimisation
+        threading.Thread(target=write, daemon=True).start()
+
+    def _title_lock(self, title):
+        with self.state_lock:
+            return self.title_locks.setdefault(title, threading.Lock())
+
+    def _background_refresh(self, key, month):
+        title = part_title(key, month)
+        try:
+            with self._title_lock(title):
+                with self.state_lock: state = self.state.get(title)
+                self._refresh(key, month, title, state)
+            get_versions().saved(key)
+        except Exception:
+            pass  # next normal load retries
+        finally:
+            with self.state_lock: self.warming.discard(title)
+
+    @metrics.timed("backend_seconds")
+    def load(self, key, month=""):
+        title = part_title(key, month)
+        hot = not month or month >= add_months(this_month(), -1)
+        with self.state_lock:
+            state = self.state.get(title)
+            if state is not None and title in self.warming:
+                return state["df"].reset_index(drop=True)  # snapshot never waits behind its reconcile
+            if state is not None and not hot and not state["dirty"] and time.monotonic() - state["full_at"] <= self.full_reload_s \
+                    and not state["df"][OPEN_STATES[key][0]].isin(OPEN_STATES[key][1]).any():
+                return state["df"].reset_index(drop=True)  # cold month, nothing open: nothing new lands there
+        with self._title_lock(title):
+            with self.state_lock: state = self.state.get(title)
+            if state is None:
+                # Warm start: serve the mmap snapshot now, reconcile with Sheets in background
+                state = self._restore(title)
+                if state is not None:
+                    with self.state_lock:
+                        self.state[title] = state
+                        self.warming.add(title)
+                    threading.Thread(target=self._background_refresh, args=(key, month), daemon=True).start()
+                    return state["df"].reset_index(drop=True)
+            return self._refresh(key, month, title, state)
+
+    def _refresh(self, key, month, title, old):
+        # Network part of a load; caller holds the title's lock, not state_lock
+        seen = set(old["dirty"]) if old else set()
+        state = old
+        try:
+            sh, worksheet = self._worksheet(key, month)
+            if state is None or time.monotonic() - state["full_at"] > self.full_reload_s:
+                state = self._full_load(key, worksheet)
+            else:
+                state = self._tail_load(key, worksheet, state) or self._full_load(key, worksheet)
+        except QuotaExhausted:
+            # Degraded mode: serve the last good copy instead of failing the page
+            if state is not None: return state["df"].reset_index(drop=True)
+            raise
+        except Exception:
+            self._reset()  # stale handle (sheet renamed / token expired) -> reopen next time
+            raise
+        with self.state_lock:
+            current = self.state.get(title)
+            if current is not old:
+                return state["df"].reset_index(drop=True)  # reshaped by a write meanwhile: next load re-reads
+            if old is not None: state["dirty"] |= old["dirty"] - seen  # our writes that landed during the read
+            self.state[title] = state
+        if old is None or state["df"] is not old["df"]:
+            self._persist(title, state)
+        return state["df"].reset_index(drop=True)
+
+    def open_rows(self, key, months, want=None):
+        frames = [self._open_part(key, m, want if not m else None) for m in months]
+        return concat_frames(key, frames, ignore_index=True) if frames else normalise_frame(key, pd.DataFrame())
+
+    def _open_part(self, key, month, want):
+        title = part_title(key, month)
+        col, vals = OPEN_STATES[key]
+        with self.state_lock:
+            loaded = title in self.state
+            scan = self.scans.get(title)
+        if loaded:
+            # Whole partition already kept (an "all" view): its own load keeps it fresh
+            df = self.load(key, month)
+            keep = df[col].isin(vals)
+            if want: keep |= df[PART_COLS[key]].dt.strftime("%Y-%m").isin(want)
+            return df[keep].reset_index(drop=True)
+        if scan is not None and scan["df"].empty and time.monotonic() - scan["at"] <= self.full_reload_s:
+            return scan["df"]  # nothing open there last time and no write of ours since
+        try:
+            found = self._scan(key, month, want)
+        except QuotaExhausted:
+            if scan is not None: return scan["df"]  # degraded: last known open rows
+            raise
+        except Exception:
+            self._reset()
+            raise
+        with self.state_lock:
+            if self.scans.get(title) is scan: self.scans[title] = found
+        return found["df"]
+
+    def _scan(self, key, month, want):
+        # Header + status column (+ date column for the legacy sheet) in one read,
+        # then only the matching rows in a second one
+        sh, worksheet = self._worksheet(key, month)
+        col, vals = OPEN_STATES[key]
+        cols = [col, PART_COLS[key]] if want else [col]
+        span = lambda header, c: "{0}:{0}".format(gspread.utils.rowcol_to_a1(1, header.index(c) + 1)[:-1])
+        guess = REQ_COLS[key]  # usual layout; checked against row 1 below
+        res = self.read(worksheet.batch_get, ["1:1"] + [span(guess, c) for c in cols])
+        header = list(res[0][0]) if len(res[0]) else []
+        got = dict(zip(cols, res[1:]))
+        moved = [c for c in cols if c in header and header.index(c) != guess.index(c)]
+        if moved:
+            got.update(zip(moved, self.read(worksheet.batch_get, [span(header, c) for c in moved])))
+        hits = set()
+        for c in cols:
+            if c not in header: continue
+            match = (lambda v: v in vals) if c == col else (lambda v: month_of(v) in want)
+            hits |= {r for r, v in enumerate(got[c], start=1) if r > 1 and len(v) and match(v[0])}
+        rows = sorted(hits)
+        values = []
+        if rows:
+            last_col = gspread.utils.rowcol_to_a1(1, len(header))[:-1]
+            values = [list(vr[0]) if len(vr) else [] for vr in
+                      self.read(worksheet.batch_get, [f"A{r}:{last_col}{r}" for r in rows])]
+        df = self._frame(key, header, values, rows).reset_index(drop=True)
+        return {"df": df, "at": time.monotonic()}
+
+    def _touched(self, title, updated_ids, reshaped):
+        # Keep the incremental state honest about our own writes
+        with self.state_lock:
+            self.scans.pop(title, None)  # cold scan re-runs on next use
+            if reshaped: self.state.pop(title, None)
+            elif title in self.state: self.state[title]["dirty"].update(str(r) for r in updated_ids)
+
+    def _located(self, key, ids, months):
+        # Month each ID was last seen in (loaded partitions + cold open-row scans) -> {id: month}
+        found = {}
+        with self.state_lock:
+            for month in months:
+                title = part_title(key, month)
+                for state in (self.scans.get(title), self.state.get(title)):
+                    if state is None or state["df"].empty: continue
+                    hit = state["df"][ID_COLS[key]].astype(str)
+                    found.update({rid: month for rid in hit[hit.isin(ids)]})
+        return found
+
+    @metrics.timed("backend_seconds")
+    def apply(self, key, inserts, updates, deletes, expect=None):
+        try:
+            # Read-check-write of one process is serialised; across processes the
+            # check is best effort (Sheets has no server-side compare-and-set)
+            with self.write_lock:
+                result = self._apply(key, inserts, updates, deletes, expect or {})
+                if "ok" in result.values(): result.prev_version, result.version = self._bump(key)
+                return result
+        except QuotaExhausted:
+            raise
+        except Exception:
+            self._reset()
+            raise
+
+    def _apply(self, key, inserts, updates, deletes, expect):
+        # Inserts go to the month of their date; updates/deletes to the month the
+        # row was last seen in, otherwise every partition is searched newest first
+        result = WriteResult()
+        new_rows = {}
+        for row in inserts:
+            new_rows.setdefault(month_of(row.get(PART_COLS[key])), []).append(row)
+        todo = {str(r) for r in list(updates) + list(deletes)}
+        months = self.months(key)
+        seen = self._located(key, todo, months) if todo else {}
+        order = list(new_rows) + sorted(set(seen.values()), reverse=True)
+        if todo - set(seen): order += sorted(months, reverse=True)
+        
+        for month in dict.fromkeys(order):
+            ins = new_rows.get(month, [])
+            upd = {r: c for r, c in updates.items() if str(r) in todo}
+            dels = [r for r in deletes if str(r) in todo]
+            if not (ins or upd or dels) or (not ins and month not in months): continue
+            part = self._apply_part(key, month, ins, upd, dels, expect)
+            for rid, outcome in part.items():
+                if outcome == "missing": continue
+                result[rid] = outcome
+                todo.discard(rid)
+        for rid in todo: result[rid] = "missing"
+        return result
+
+    def _apply_part(self, key, month, inserts, updates, deletes, expect):
+        id_col = ID_COLS[key]
+        title = part_title(key, month)
+        result = WriteResult()
+        sh, worksheet = self._worksheet(key, month, create=bool(inserts))
+        header = self.read(worksheet.row_values, 1)
+        
+        # New columns (new partition / old sheet) -> extend header row only
+        new_cols = [c for c in REQ_COLS[key] if c not in header]
+        for row in inserts + list(updates.values()):
+            new_cols += [c for c in row if c not in header and c not in new_cols]
+        if new_cols:
+            header = header + new_cols
+            if len(header) > worksheet.col_count:
+                self.write(worksheet.add_cols, len(header) - worksheet.col_count)
+            self.write(worksheet.update, values=[header], range_name="A1")
+            self._touched(title, [], reshaped=True)
+        
+        # Only the ID column is read: row numbers for updates/deletes,
+        # and already-written IDs so a replayed insert is skipped
+        ids = self.read(worksheet.col_values, header.index(id_col) + 1)
+        row_of = {str(v): i + 1 for i, v in enumerate(ids) if i > 0 and str(v) != ""}
+        
+        # Current values of the rows we touch (one read) -> revision check + next Rev
+        targets = {}
+        for rid in list(updates) + list(deletes):
+            rid = str(rid)
+            if rid not in row_of: result[rid] = "missing"
+            else: targets[rid] = row_of[rid]
+        current = {}
+        if targets:
+            last_col = gspread.utils.rowcol_to_a1(1, len(header))[:-1]
+            got = self.read(worksheet.batch_get, [f"A{r}:{last_col}{r}" for r in targets.values()])
+            for rid, vr in zip(targets, got):
+                row = list(vr[0]) if len(vr) else []
+                current[rid] = dict(zip(header, row))
+        for rid in targets:
+            ok = str(rid) not in expect or row_matches(current[rid], expect[str(rid)])
+            result[rid] = "ok" if ok else "conflict"
+        
+        if updates:
+            cells = []
+            for rid, changes in updates.items():
+                rid = str(rid)
+                if result.get(rid) != "ok": continue
+                changes = dict(changes, **{REV_COL: rev_of(current[rid].get(REV_COL)) + 1})
+                for c, v in changes.items():
+                    cells.append({
+                        "range": gspread.utils.rowcol_to_a1(row_of[rid], header.index(c) + 1),
+                        "values": [[to_cell(v)]]
+                    })
+            if cells:
+                self.write(worksheet.batch_update, cells)
+                self._touched(title, updates, reshaped=False)
+        
+        if deletes:
+            # Bottom-up so earlier deletes don't shift later row numbers
+            targets = sorted({row_of[str(r)] for r in deletes if result.get(str(r)) == "ok"}, reverse=True)
+            if targets:
+                self.write(sh.batch_update, {"requests": [{
+                    "deleteDimension": {"range": {
+                        "sheetId": worksheet.id, "dimension": "ROWS",
+                        "startIndex": r - 1, "endIndex": r
+                    }}
+                } for r in targets]})
+                self._touched(title, [], reshaped=True)
+        
+        # Append last: a failure above never leaves a half-done append behind
+        if inserts:
+            rows = [[to_cell(dict(row, **{REV_COL: 1}).get(c, "")) for c in header] for row in inserts
+                    if str(row.get(id_col, "")) not in row_of]
+            if rows:
+                self.write(worksheet.append_rows, rows, value_input_option="RAW")
+                self._touched(title, [r[header.index(id_col)] for r in rows], reshaped=False)
+            for row in inserts: result[str(row.get(id_col, ""))] = "ok"
+        return result
+
+class SQLiteBackend(StorageBackend):
+    name = "sqlite"
+    TABLES = {"data": "shifts", "trans": "transactions"}
+    INDEXES = {
+        "data": ["Driver", "Status", "Approval_Status", "Start_Time"],
+        "trans": ["Driver", "Type", "Approval_Status", "Date"]
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # Ek connection, sab sessions ke threads share karte hain (lock ke saath)
+        # Transactions are explicit (BEGIN IMMEDIATE) so compare-and-set holds the write lock
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.lock:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS fleet_meta (tbl TEXT PRIMARY KEY, version INTEGER DEFAULT 0)')
+            for key, table in self.TABLES.items():
+                cols = ", ".join(self._coldef(key, c) for c in REQ_COLS[key])
+                self.conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ({cols})')
+                have = self._columns(table)
+                for c in REQ_COLS[key]:
+                    if c not in have:  # older file -> add new schema columns
+                        self.conn.execute(f'ALTER TABLE {table} ADD COLUMN {self._coldef(key, c)}')
+                for c in self.INDEXES[key]:
+                    self.conn.execute(f'CREATE INDEX IF NOT EXISTS ix_{table}_{c.lower()} ON {table} ("{c}")')
+
+    def _coldef(self, key, c):
+        if c == ID_COLS[key]: return f'"{c}" TEXT PRIMARY KEY'
+        if c == REV_COL: return f'"{c}" INTEGER DEFAULT 0'
+        if c in NUM_COLS: return f'"{c}" REAL DEFAULT 0'
+        return f'"{c}" TEXT DEFAULT \'\''
+
+    def _columns(self, table):
+        return [r[1] for r in self.conn.execute(f"PRAGMA table_info({table})")]
+
+    def months(self, key):
+        # One table per entity; months come from the (indexed) date column
+        col = PART_COLS[key]
+        with self.lock:
+            rows = self.conn.execute(f'SELECT DISTINCT substr("{col}", 1, 7) FROM {self.TABLES[key]}').fetchall()
+        return sorted({month_of(r[0]) for r in rows})
+
+    @metrics.timed("backend_seconds")
+    def load(self, key, month=""):
+        col = PART_COLS[key]
+        if month:
+            where, args = f'"{col}" >= ? AND "{col}" < ?', (month, add_months(month, 1))
+        else:
+            where, args = f'NOT (COALESCE("{col}", \'\') GLOB \'[0-9][0-9][0-9][0-9]-[0-9][0-9]*\')', ()
+        with self.lock:
+            df = pd.read_sql_query(f"SELECT * FROM {self.TABLES[key]} WHERE {where} ORDER BY rowid",
+                                   self.conn, params=args)
+        return normalise_frame(key, df)
+
+    @metrics.timed("backend_seconds")
+    def versions(self):
+        with self.lock:
+            return dict(self.conn.execute("SELECT tbl, version FROM fleet_meta").fetchall())
+
+    def open_rows(self, key, months, want=None):
+        # Indexed: status column + month prefix, no cold partition is read whole.
+        # Undated rows ("") never fall in a wanted month, so `want` changes nothing here.
+        col, vals = OPEN_STATES[key]
+        part = PART_COLS[key]
+        dated = [m for m in months if m]
+        where = [f'substr("{part}", 1, 7) IN ({", ".join("?" for _ in dated)})'] if dated else []
+        if "" in months: where.append(f'NOT (COALESCE("{part}", \'\') GLOB \'[0-9][0-9][0-9][0-9]-[0-9][0-9]*\')')
+        if not where: return normalise_frame(key, pd.DataFrame())
+        sql = (f'SELECT * FROM {self.TABLES[key]} WHERE "{col}" IN ({", ".join("?" for _ in vals)}) '
+               f'AND ({" OR ".join(where)}) ORDER BY rowid')
+        with self.lock:
+            df = pd.read_sql_query(sql, self.conn, params=list(vals) + dated)
+        return normalise_frame(key, df)
+
+    def _current(self, table, id_col, rid):
+        cur = self.conn.execute(f'SELECT * FROM {table} WHERE "{id_col}" = ?', (rid,))
+        row = cur.fetchone()
+        return None if row is None else dict(zip([d[0] for d in cur.description], row))
+
+    @metrics.timed("backend_seconds")
+    def apply(self, key, inserts, updates, deletes, expect=None):
+        table = self.TABLES[key]
+        id_col = ID_COLS[key]
+        expect = expect or {}
+        result = WriteResult()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")  # one transaction, write lock held from the start
+            try:
+                cols = self._columns(table)
+                for row in inserts + list(updates.values()):
+                    for c in row:
+                        if c not in cols:
+                            self.conn.execute(f'ALTER TABLE {table} ADD COLUMN "{c}" TEXT DEFAULT \'\'')
+                            cols.append(c)
+                
+                for row in inserts:
+                    row = dict(row, **{REV_COL: 1})
+                    names = ", ".join(f'"{c}"' for c in row)
+                    marks = ", ".join("?" for _ in row)
+                    self.conn.execute(
+                        f'INSERT OR IGNORE INTO {table} ({names}) VALUES ({marks})',
+                        [to_cell(v) for v in row.values()]
+                    )
+                    result[str(row.get(id_col, ""))] = "ok"
+                for rid in [str(r) for r in list(updates) + list(deletes)]:
+                    current = self._current(table, id_col, rid)
+                    if current is None: result[rid] = "missing"
+                    elif rid in expect and not row_matches(current, expect[rid]): result[rid] = "conflict"
+                    else: result[rid] = "ok"
+                for rid, changes in updates.items():
+                    if result[str(rid)] != "ok" or not changes: continue
+                    sets = ", ".join(f'"{c}" = ?' for c in changes)
+                    self.conn.execute(
+                        f'UPDATE {table} SET {sets}, "{REV_COL}" = COALESCE("{REV_COL}", 0) + 1 WHERE "{id_col}" = ?',
+                        [to_cell(v) for v in changes.values()] + [str(rid)]
+                    )
+                self.conn.executemany(f'DELETE FROM {table} WHERE "{id_col}" = ?',
+                                      [(str(r),) for r in deletes if result[str(r)] == "ok"])
+                if "ok" in result.values():
+                    # Same transaction as the rows: a reader never sees the new version without them
+                    self.conn.execute("INSERT OR IGNORE INTO fleet_meta (tbl, version) VALUES (?, 0)", (key,))
+                    result.prev_version = self.conn.execute("SELECT version FROM fleet_meta WHERE tbl = ?",
+                                                            (key,)).fetchone()[0]
+                    self.conn.execute("UPDATE fleet_meta SET version = MAX(version + 1, ?) WHERE tbl = ?",
+                                      (time.time_ns() // 1000, key))  # same rule as sheets: survives a swapped file
+                    result.version = self.conn.execute("SELECT version FROM fleet_meta WHERE tbl = ?",
+                                                       (key,)).fetchone()[0]
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return result
+
+def is_on(v):
+    return str(v).lower() in ("1", "true", "yes", "on")
+
 @st.cache_resource
 def get_google_sheet_client():
+    if is_on(get_setting("sheets_emulator", "false")):
+        # Offline: in-process fake of the Sheets API (fake_gspread.py), no credentials needed
+        import fake_gspread
+        return fake_gspread.FakeClient(fake_gspread.FakeAPI(
+            latency=float(get_setting("emulator_latency", 0)),
+            fail_rate=float(get_setting("emulator_fail_rate", 0))
+        ))
     try:
         scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
         creds_dict = dict(st.secrets["gcp_service_account"])
@@ -317,152 +1296,841 @@ def get_google_sheet_client():
     except Exception as e:
         return None
 
-@st.cache_data(ttl=60)
-def load_db(key):
-    client = get_google_sheet_client()
-    if not client: 
-        st.error("❌ Database Disconnected!")
-        st.stop()
-    
-    sheet_name = "FLEET_DB_V15"
-    
-    for attempt in range(3):
-        try:
-            sh = client.open(sheet_name)
-            wk_name = FILES[key]
-            worksheet = sh.worksheet(wk_name)
-            
-            data = worksheet.get_all_records()
-            df = pd.DataFrame(data)
-            
-            if key == 'data':
-                req_cols = ["Shift_ID", "Driver", "Car", "Status", "Approval_Status", 
-                            "Start_Time", "End_Time", "Duration", "Total_Earnings", 
-                            "Start_Wallet", "End_Wallet", "Cash_Collected", 
-                            "Start_Fuel", "End_Fuel"]
-            else:
-                req_cols = ["Trans_ID", "Date", "Driver", "Type", "Amount", 
-                            "Method", "Notes", "Approval_Status", "Source"]
+@st.cache_resource
+def get_governor():
+    # Google default: 60 read + 60 write requests / minute / user
+    return QuotaGovernor(read_per_min=float(get_setting("read_quota_per_min", 60)),
+                         write_per_min=float(get_setting("write_quota_per_min", 60)))
 
-            for c in req_cols:
-                if c not in df.columns: df[c] = ""
-            
-            if not df.empty:
-                cols_num = ['Total_Earnings', 'Duration', 'Amount']
-                for c in cols_num:
-                    if c in df.columns:
-                        df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0)
-                
-                if key == 'data':
-                    for d_col in ['Start_Time', 'End_Time']:
-                        if d_col in df.columns:
-                            df[d_col] = pd.to_datetime(df[d_col], errors='coerce')
-                elif key == 'trans':
-                    if 'Date' in df.columns:
-                        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-                    
-            return df
+def get_backend_name():
+    return str(get_setting("backend", "sheets")).lower()
 
-        except Exception as e:
-            if "429" in str(e) or "Quota" in str(e):
-                time.sleep(2)
-                continue
-            else:
-                st.error(f"❌ Read Error: {str(e)}")
-                st.stop()
+@st.cache_resource
+def get_snapshots():
+    folder = get_setting("snapshot_dir", ".fleet_snapshot")
+    if pa is None or not folder: return None
+    return SnapshotStore(folder)
+
+@st.cache_resource
+def get_backend():
+    if get_backend_name() == "sqlite":
+        return SQLiteBackend(get_setting("sqlite_path", "fleet.db"))
     
-    return pd.DataFrame()
+    client = get_google_sheet_client()
+    if not client: return None
+    return SheetsBackend(client, get_setting("sheet_name", "FLEET_DB_V15"), get_governor(),
+                         read_max_wait=float(get_setting("read_max_wait", 0)),
+                         full_reload_minutes=float(get_setting("full_reload_minutes", 30)),
+                         snapshots=get_snapshots())
+
+def coalesce_writes(entries):
+    # Journal entries -> {key: (inserts, updates, deletes, expect)} with one net change per row.
+    # Insert + later update = one insert; insert + delete = nothing at all.
+    # The first expectation per row wins: later ones were checked against the queued state.
+    out = {}
+    for e in entries:
+        key = e["key"]
+        ins, upd, dels, exp = out.setdefault(key, ({}, {}, [], {}))
+        for row in e.get("inserts", []):
+            rid = str(row.get(ID_COLS[key], ""))
+            ins[rid] = dict(row)
+            if rid in dels: dels.remove(rid)
+        for rid, cond in e.get("expect", {}).items():
+            if rid not in ins: exp.setdefault(rid, cond)
+        for rid, changes in e.get("updates", {}).items():
+            if rid in ins: ins[rid].update(changes)
+            else: upd.setdefault(rid, {}).update(changes)
+        for rid in e.get("deletes", []):
+            upd.pop(rid, None)
+            if rid in ins: del ins[rid]
+            elif rid not in dels: dels.append(rid)
+    return {k: (list(i.values()), u, d, {r: c for r, c in x.items() if r in u or r in d})
+            for k, (i, u, d, x) in out.items()}
+
+class WriteBehindQueue:
+    # Save = journal line + fsync, then return. A background worker flushes
+    # pending entries to the backend, coalesced into one apply() per table.
+    # Journal lines: {"seq", "key", "inserts", "updates", "deletes", "expect", "by"} and {"ack": [seq]}.
+    # Each process has its own journal ("pending_writes.<host>.<pid>.jsonl" next to `path`).
+    # Un-acked entries are replayed on the next start, and journals of dead processes
+    # on this box are claimed (atomic rename) and re-queued, so a crash loses nothing.
+    # Rows that fail their revision check at flush time are dropped and kept in
+    # `conflicts`; the user who made the edit gets them from take_conflicts().
+    def __init__(self, backend, path, versions):
+        self.backend = backend
+        self.base = path
+        root, ext = os.path.splitext(path)
+        self.path = f"{root}.{socket.gethostname()}.{os.getpid()}{ext}"
+        self.versions = versions
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # check-then-submit in save_db
+        self.conflicts = deque(maxlen=50)
+        self.unseen = {}  # user -> conflicts not shown to them yet
+        self.wake = threading.Event()
+        self.pending = []
+        self.seq = 0
+        self.failures = 0
+        self.last_error = None
+        self._replay()
+        self._adopt()
+        threading.Thread(target=self._run, daemon=True, name="fleet-writer").start()
+
+    @staticmethod
+    def _read(path):
+        # -> (un-acked entries in order, highest seq seen)
+        entries, acked = {}, set()
+        with open(path) as f:
+            for line in f:
+                try: rec = json.loads(line)
+                except ValueError: continue  # torn last line from a crash
+                if "ack" in rec: acked.update(rec["ack"])
+                else: entries[rec["seq"]] = rec
+        return [entries[s] for s in sorted(entries) if s not in acked], max(list(entries) + list(acked) + [0])
+
+    def _replay(self):
+        if not os.path.exists(self.path): return
+        self.pending, self.seq = self._read(self.path)
+        if self.pending: self.wake.set()
+
+    def _adopt(self):
+        # Orphans: journals of dead processes on this box, and the old shared
+        # journal (`path` itself). Other boxes' journals are left to their owners.
+        root, ext = os.path.splitext(self.base)
+        folder = os.path.dirname(self.base) or "."
+        own = re.compile(re.escape(os.path.basename(root)) + r"\.(.+?)\.(\d+)(?:\.orphan\d+)?" + re.escape(ext) + "$")
+        host = socket.gethostname()
+        for n, name in enumerate(sorted(os.listdir(folder))):
+            src = os.path.join(folder, name)
+            m = own.match(name)
+            if name != os.path.basename(self.base) and not m: continue
+            if src == self.path: continue
+            pid = int(m.group(2)) if m else 0
+            if m and (m.group(1) != host or (pid != os.getpid() and pid_alive(pid))): continue  # owner still running
+            claimed = f"{root}.{host}.{os.getpid()}.orphan{n}{ext}"
+            try: os.rename(src, claimed)  # only one process wins the claim
+            except OSError: continue
+            entries, _ = self._read(claimed)
+            for e in entries: self._queue(e)
+            os.remove(claimed)  # its entries are in our journal now
+
+    def _append(self, rec):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(rec) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def submit(self, key, inserts, updates, deletes, expect=None, by=None):
+        return self._queue({
+            "key": key,
+            "inserts": [{c: to_cell(v) for c, v in row.items()} for row in inserts],
+            "updates": {str(rid): {c: to_cell(v) for c, v in ch.items()} for rid, ch in updates.items()},
+            "deletes": [str(rid) for rid in deletes],
+            "expect": {str(rid): {c: [to_cell(a) for a in v] if isinstance(v, (list, tuple)) else to_cell(v)
+                                  for c, v in cond.items()} for rid, cond in (expect or {}).items()},
+            "by": by
+        })
 
-def save_db(key, df):
-    if df.empty: return False
+    def _queue(self, entry):
+        with self.lock:
+            self.seq += 1
+            entry = dict(entry, seq=self.seq)
+            self._append(entry)
+            self.pending.append(entry)
+        self.wake.set()
+        return entry["seq"]
+
+    def snapshot(self, key):
+        # Pending changes of `key` + a version stamp for them, taken together
+        with self.lock:
+            entries = [e for e in self.pending if e["key"] == key]
+            mark = (self.seq, len(self.pending))
+        return coalesce_writes(entries).get(key), mark
+
+    def status(self):
+        with self.lock:
+            return {"pending": len(self.pending), "failures": self.failures,
+                    "last_error": self.last_error, "conflicts": list(self.conflicts)}
+
+    def take_conflicts(self, by):
+        # Flush-time conflicts of this user's edits, each handed out once
+        with self.lock:
+            return self.unseen.pop(by, [])
+
+    @metrics.timed("backend_seconds")
+    def _flush(self):
+        with self.lock:
+            batch = list(self.pending)
+        for key, (ins, upd, dels, exp) in coalesce_writes(batch).items():
+            result = self.backend.apply(key, ins, upd, dels, exp)
+            for rid in result.failed():
+                # Last queued edit of this row decides whose change it was
+                by = next((e.get("by") for e in reversed(batch) if e["key"] == key and
+                           (rid in e.get("updates", {}) or rid in e.get("deletes", []))), None)
+                conflict = {"key": key, "id": rid, "outcome": result[rid], "by": by,
+                            "at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+                with self.lock:
+                    self.conflicts.append(conflict)
+                    if by: self.unseen.setdefault(by, []).append(conflict)
+            seqs = [e["seq"] for e in batch if e["key"] == key]
+            self.versions.saved(key, result.version, result.prev_version)
+            with self.lock:
+                self._append({"ack": seqs})
+                self.pending = [e for e in self.pending if e["seq"] not in seqs]
+                if not self.pending:
+                    open(self.path, "w").close()  # everything synced -> compact journal
+
+    def _run(self):
+        while True:
+            self.wake.wait(timeout=5)
+            self.wake.clear()
+            if not self.pending: continue
+            try:
+                self._flush()
+                self.failures = 0
+                self.last_error = None
+            except Exception as e:
+                # Quota storm / network: keep everything queued and back off
+                self.failures += 1
+                self.last_error = str(e)
+                time.sleep(min(2 ** self.failures, 60) * (0.5 + random.random()))
+                self.wake.set()
+
+def pid_alive(pid):
+    try: os.kill(pid, 0)
+    except ProcessLookupError: return False
+    except PermissionError: pass  # someone else's process, but alive
+    return True
 
-    client = get_google_sheet_client()
-    if not client: 
+@st.cache_resource
+def get_writer():
+    backend = get_backend()
+    if not backend: return None
+    default = "true" if backend.name == "sheets" else "false"
+    if not is_on(get_setting("write_behind", default)):
+        return None
+    return WriteBehindQueue(backend, get_setting("journal_path", "pending_writes.jsonl"), get_versions())
+
+class DataVersions:
+    # Change detection per table: (backend version, local epoch). The backend's
+    # counters are polled at most every `poll` seconds (one tiny read covers both
+    # tables); our own writes and background reloads move a table at once. fetch_db
+    # is keyed by this, so a table is re-read only when it changed - and then only
+    # that table - while unchanged data stays cached indefinitely.
+    def __init__(self, poll):
+        self.poll = poll
+        self.lock = threading.Lock()
+        self.remote = {}
+        self.local = {}
+        self.ours = {}  # key -> {version before: version after} of our own writes
+        self.polled = -1e9
+
+    def _refresh(self):
+        metrics.inc("version_polls_total")
+        backend = get_backend()
+        try:
+            seen = backend.versions() if backend else {}
+        except Exception:
+            return  # quota / network: keep serving what we know
+        with self.lock:
+            for key, v in seen.items():
+                self.remote[key] = max(self.remote.get(key, 0), v)  # a slow poll never goes back
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            due = now - self.polled > self.poll
+            if due: self.polled = now  # one poller at a time, other sessions use the last answer
+        if due: self._refresh()
+        with self.lock:
+            return (self.remote.get(key, 0), self.local.get(key, 0))
+
+    def saved(self, key, version=None, prev=None):
+        with self.lock:
+            if version is not None: self.remote[key] = max(self.remote.get(key, 0), version)
+            else: self.local[key] = self.local.get(key, 0) + 1  # no version back -> local bump
+            if version is not None and prev is not None:
+                ours = self.ours.setdefault(key, {})
+                ours[prev] = version
+                if len(ours) > 64: ours.pop(next(iter(ours)))
+
+    def only_ours(self, key, old, new):
+        # True if every step from version old to new was one of our own writes
+        if old[1] != new[1]: return False
+        with self.lock: ours = dict(self.ours.get(key, {}))
+        v = old[0]
+        while v != new[0] and v in ours: v = ours[v]
+        return v == new[0]
+
+@st.cache_resource
+def get_versions():
+    default = 10 if get_backend_name() == "sheets" else 1
+    return DataVersions(float(get_setting("version_poll_seconds", default)))
+
+class FrameCache:
+    # Latest frame per (key, scope) only: a new data version replaces the old copy,
+    # so superseded versions never pile up. One load per (key, scope) at a time;
+    # sessions arriving meanwhile get its result. Frames are shared - never edit in place.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frames = {}  # (key, scope) -> (version, df)
+        self.loading = {}
+
+    def get(self, key, scope, version, load):
+        with self.lock:
+            hit = self.frames.get((key, scope))
+            gate = self.loading.setdefault((key, scope), threading.Lock())
+        if hit and hit[0] == version: return hit[1]
+        with gate:
+            with self.lock: hit = self.frames.get((key, scope))
+            if hit and hit[0] == version: return hit[1]
+            df = load()
+            with self.lock: self.frames[(key, scope)] = (version, df)
+        return df
+
+    def clear(self):
+        with self.lock: self.frames.clear()
+
+@st.cache_resource
+def get_frames():
+    return FrameCache()
+
+def fetch_db(key, scope="all", version=None):
+    # version = get_versions().get(key); unchanged version -> cached frame
+    return get_frames().get(key, scope, version, lambda: read_db(key, scope))
+
+def read_db(key, scope):
+    # Cache miss (load_db counts the lookups)
+    metrics.inc("cache_misses_total", cache="fetch_db", key=key)
+    start = time.perf_counter()
+    backend = get_backend()
+    if not backend: 
+        st.error("❌ Database Disconnected!")
+        st.stop()
+    
+    want = scope_months(scope)
+    try:
+        # Only the partitions this view needs; older months load on first use
+        months = backend.months(key)
+        frames = [backend.load(key, m) for m in months if want is None or m in want]
+        cold = [m for m in months if want is not None and m not in want]
+        if cold:
+            # Open missions / pending requests stay live whatever month they started in;
+            # the legacy sheet ("") also gives its rows of the wanted months
+            frames.append(backend.open_rows(key, cold, want))
+    except Exception as e:
+        st.error(f"❌ Read Error: {str(e)}")
+        st.stop()
+    
+    df = concat_frames(key, frames, ignore_index=True) if frames else normalise_frame(key, pd.DataFrame())
+    df.attrs["version"] = time.time_ns()  # every real load is a new data version (indexes rebuild)
+    metrics.observe("data_seconds", time.perf_counter() - start, op="fetch_db", key=key)
+    return df
+
+@metrics.timed("data_seconds", op="load_db")
+def load_db(key, scope="all"):
+    # scope: "hot" (this + last month, for live screens), "month" (payroll),
+    # "all" (full history) or one "YYYY-MM"
+    metrics.inc("cache_lookups_total", cache="fetch_db", key=key)
+    # Read-your-writes: jo changes abhi queue mein hain unko bhi dikhao.
+    # Queue is read BEFORE the fetch: an entry synced in between is then in both
+    # (overlay is idempotent) instead of in neither.
+    writer = get_writer()
+    pend, mark = writer.snapshot(key) if writer else (None, None)
+    df = fetch_db(key, scope, get_versions().get(key))
+    if not pend: return df
+    version = (df.attrs.get("version"),) + mark
+    df = df.copy()  # the cached frame is shared: overlay on a copy
+    
+    ins, upd, dels, _ = pend
+    id_col = ID_COLS[key]
+    ids = df[id_col].astype(str)
+    if dels:
+        df = df[~ids.isin(dels)]
+        ids = df[id_col].astype(str)
+    df = patch_rows(key, df, upd)
+    known = set(ids)
+    new_rows = [dict(r, **{REV_COL: 1}) for r in ins if str(r.get(id_col, "")) not in known]
+    if new_rows:
+        df = concat_frames(key, [df, normalise_frame(key, pd.DataFrame(new_rows))], ignore_index=True)
+    df.attrs["version"] = version
+    return df
+
+def patch_rows(key, df, updates):
+    # Apply {row_id: {col: raw value}} to a typed frame in place (Rev bumped like the backend does)
+    ids = df[ID_COLS[key]].astype(str)
+    for rid, changes in updates.items():
+        typed = normalise_frame(key, pd.DataFrame([changes]))
+        mask = (ids == str(rid)).values
+        for c in changes:
+            if c not in df.columns: df[c] = ""
+            val = typed[c].iloc[0]
+            if isinstance(df[c].dtype, pd.CategoricalDtype) and val not in df[c].cat.categories:
+                df[c] = df[c].cat.add_categories([val])
+            df.loc[mask, c] = val
+        if REV_COL in df.columns: df.loc[mask, REV_COL] += 1  # the backend will bump it once
+    return df
+
+def current_rows(key, ids):
+    # Rows as this process sees them (cache + queued writes); hot months first
+    df = load_db(key, "hot")
+    if not set(ids) <= set(df[ID_COLS[key]].astype(str)):
+        df = load_db(key)  # older month -> full history
+    return df[df[ID_COLS[key]].astype(str).isin(ids)]
+
+def check_expect(key, rows, ids, expect):
+    # Revision check against what this process currently sees
+    current = {str(r[ID_COLS[key]]): r for r in rows.to_dict("records")}
+    result = WriteResult()
+    for rid in ids:
+        if rid not in current: result[rid] = "missing"
+        elif rid in expect and not row_matches(current[rid], expect[rid]): result[rid] = "conflict"
+        else: result[rid] = "ok"
+    return result
+
+@metrics.timed("data_seconds", op="save_db")
+def save_db(key, inserts=None, updates=None, deletes=None, expect=None):
+    # Row-level write: append new rows, patch changed cells, drop deleted rows.
+    # expect = {row_id: {col: val}}: only write rows that still look like that (see row_matches).
+    # Returns WriteResult (per-row outcome, truthy if all ok) or False on error.
+    # With write-behind on, the write is durable once journaled; sync happens in background.
+    inserts = list(inserts or []); updates = dict(updates or {}); deletes = list(deletes or [])
+    expect = {str(r): c for r, c in (expect or {}).items()}
+    if not (inserts or updates or deletes): return False
+
+    backend = get_backend()
+    if not backend: 
         st.error("Database connection failed!")
         return False
     
-    sheet_name = "FLEET_DB_V15"
+    # Rows before the change: revision check + rollup deltas
+    ids = [str(r) for r in list(updates) + list(deletes)]
     
-    for attempt in range(3):
+    writer = get_writer()
+    if writer:
         try:
-            sh = client.open(sheet_name)
-            wk_name = FILES[key]
-            worksheet = sh.worksheet(wk_name)
-            
-            df_save = df.copy()
-            
-            target_cols = ['Start_Time', 'End_Time', 'Date']
-            for col in target_cols:
-                if col in df_save.columns:
-                    df_save[col] = df_save[col].astype(str)
-                    df_save[col] = df_save[col].replace(['NaT', 'nan', '<NA>', 'None'], '')
-
-            df_save = df_save.fillna('')
-            
-            data_to_write = [df_save.columns.values.tolist()] + df_save.values.tolist()
-            
-            worksheet.update(data_to_write)
-            worksheet.resize(rows=len(data_to_write))
-            
-            load_db.clear()
-            return True
-            
+            with writer.save_lock:
+                before = current_rows(key, ids) if ids else None
+                result = check_expect(key, before, ids, expect) if ids else WriteResult()
+                ok_upd = {r: c for r, c in updates.items() if result[str(r)] == "ok"}
+                ok_del = [r for r in deletes if result[str(r)] == "ok"]
+                if inserts or ok_upd or ok_del:
+                    writer.submit(key, inserts, ok_upd, ok_del, expect, by=st.session_state.get("user"))
+            for row in inserts: result[str(row.get(ID_COLS[key], ""))] = "ok"
+        except OSError as e:
+            st.error(f"❌ Save Failed (journal): {str(e)}")
+            return False
+    else:
+        before = current_rows(key, ids) if ids else None
+        try:
+            result = backend.apply(key, inserts, updates, deletes, expect)
+        except QuotaExhausted:
+            st.error("❌ Server Busy (Google Quota). Please wait 1 min.")
+            return False
         except Exception as e:
-            if "429" in str(e) or "Quota" in str(e):
-                time.sleep(3)
-                continue
-            else:
-                st.error(f"❌ Save Failed: {str(e)}")
-                return False
-                
-    st.error("❌ Server Busy (Google Quota). Please wait 1 min.")
-    return False
+            st.error(f"❌ Save Failed: {str(e)}")
+            return False
+        get_versions().saved(key, result.version, result.prev_version)
+    
+    get_rollups().on_save(key, before, inserts, updates, deletes, result)
+    if not result:
+        st.warning("⚠️ Record was changed by someone else - please review and try again.")
+    return result
+
+# ==========================================
+# 📊 ROLLUPS (DRIVER × MONTH)
+# ==========================================
+# Materialised per-driver, per-month totals so HUD / salary / leaderboard / finance
+# read a few rows instead of summing history on every rerun. Rebuilt from the data
+# only when the table's data version moved because of someone else's write, and
+# patched by save_db with the delta of each of our own writes (before vs after rows).
+# Money in halala like the frames.
+ROLLUP_COLS = {
+    "data": ["revenue", "shifts", "gross"],
+    "trans": ["advances", "fines", "received", "expenses", "ceo_transfers"]
+}
+
+def month_code(month):
+    return int(month.replace("-", "")) if month else 0
+
+def rollup_rows(key, df):
+    # Each row's contribution: Driver, Month (yyyymm), metrics (+ Day for days worked)
+    when = df[PART_COLS[key]]
+    out = pd.DataFrame({
+        "Driver": df["Driver"].astype(str).values,
+        "Month": (when.dt.year * 100 + when.dt.month).fillna(0).astype("int64").values
+    })
+    if key == "data":
+        done = (df["Status"] == "Completed").values
+        ok = done & (df["Approval_Status"] == "Approved").values
+        earn = df["Total_Earnings"].values
+        out["revenue"] = np.where(ok, earn, 0)
+        out["shifts"] = ok.astype("int64")
+        out["gross"] = np.where(done, earn, 0)
+        out["Day"] = when.dt.day.fillna(0).astype("int64").values
+    else:
+        kind = df["Type"].astype(str).values
+        appr = (df["Approval_Status"] == "Approved").values
+        amt = df["Amount"].values
+        out["advances"] = np.where(appr & (kind == "Advance"), amt, 0)
+        out["fines"] = np.where(kind == "Challan", amt, 0)  # fines count even before approval
+        out["received"] = np.where(appr & (kind == "Received"), amt, 0)
+        out["expenses"] = np.where(appr & (kind == "Expense"), amt, 0)
+        out["ceo_transfers"] = np.where(appr & (kind == "CEO_Transfer") &
+                                        (df["Source"] == "Manager").values, amt, 0)
+    return out
+
+class RollupStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        empty = pd.MultiIndex.from_tuples([], names=["Driver", "Month"])
+        self.tables = {k: pd.DataFrame({c: pd.Series(dtype="int64") for c in cols}, index=empty)
+                       for k, cols in ROLLUP_COLS.items()}
+        # approved shifts per (Driver, Month, Day) -> days worked
+        self.days = pd.Series(dtype="int64", index=pd.MultiIndex.from_tuples([], names=["Driver", "Month", "Day"]))
+        self.fresh = {}  # (key, scope) -> data version the totals match
+        self.version = 0
+
+    def _months(self, index, want):
+        return index.get_level_values("Month").isin([month_code(m) for m in want])
+
+    @metrics.timed("data_seconds", op="rollup_refresh")
+    def refresh(self, key, scope, data_version=None):
+        want = scope_months(scope)
+        with self.lock: version = self.version
+        rows = rollup_rows(key, load_db(key, scope))
+        if want is not None: rows = rows[rows["Month"].isin([month_code(m) for m in want])]
+        table = rows.groupby(["Driver", "Month"], sort=False)[ROLLUP_COLS[key]].sum()
+        days = rows[rows["shifts"] > 0].groupby(["Driver", "Month", "Day"]).size() if key == "data" else None
+        with self.lock:
+            if self.version != version: return  # a save landed meanwhile -> rebuild on next read
+            old = self.tables[key]
+            keep = old[~self._months(old.index, want)] if want is not None else old.iloc[0:0]
+            self.tables[key] = pd.concat([keep, table])
+            if days is not None:
+                keep = self.days[~self._months(self.days.index, want)] if want is not None else self.days.iloc[0:0]
+                self.days = pd.concat([keep, days])
+            self.fresh[(key, scope)] = data_version
+
+    def ensure(self, key, scope):
+        # Idle = no work. Versions moved only by our own writes are already patched in
+        versions = get_versions()
+        now = versions.get(key)
+        with self.lock:
+            seen = {s: self.fresh.get((key, s)) for s in (scope, "all")}
+        for s, v in seen.items():
+            if v is not None and (v == now or versions.only_ours(key, v, now)):
+                with self.lock: self.fresh[(key, s)] = now
+                return
+        self.refresh(key, scope, now)
+
+    def on_save(self, key, before, inserts, updates, deletes, result):
+        # Saved rows only: subtract what they contributed, add what they contribute now
+        ok = {rid for rid, v in result.items() if v == "ok"}
+        if not ok: return
+        id_col = ID_COLS[key]
+        deltas = []
+        if before is not None and not before.empty:
+            old = before[before[id_col].astype(str).isin(ok)]
+            kept = old[~old[id_col].astype(str).isin([str(r) for r in deletes])].copy()
+            changed = {r: c for r, c in updates.items() if str(r) in ok}
+            neg = rollup_rows(key, old)
+            neg[ROLLUP_COLS[key]] *= -1
+            deltas += [neg, rollup_rows(key, patch_rows(key, kept, changed))]
+        new = [r for r in inserts if str(r.get(id_col, "")) in ok]
+        if new: deltas.append(rollup_rows(key, normalise_frame(key, pd.DataFrame(new))))
+        if not deltas: return  # saved rows we never had loaded (e.g. outside the hot months)
+        rows = pd.concat(deltas, ignore_index=True)
+        table = rows.groupby(["Driver", "Month"])[ROLLUP_COLS[key]].sum()
+        with self.lock:
+            self.version += 1
+            self.tables[key] = self.tables[key].add(table, fill_value=0).astype("int64")
+            if key == "data":
+                # shifts is +1 / -1 per approved shift gained / lost on that day
+                days = rows.groupby(["Driver", "Month", "Day"])["shifts"].sum()
+                self.days = self.days.add(days, fill_value=0).astype("int64")
+                self.days = self.days[self.days > 0]
+
+    def view(self, scope, drivers=None):
+        # Driver -> totals over the months of `scope` (+ days worked)
+        for key in ROLLUP_COLS: self.ensure(key, scope)
+        want = scope_months(scope)
+        with self.lock:
+            parts = [t[self._months(t.index, want)] if want is not None else t for t in self.tables.values()]
+            days = self.days[self._months(self.days.index, want)] if want is not None else self.days
+        out = pd.concat([p.groupby(level="Driver").sum() for p in parts], axis=1).fillna(0)
+        out["days"] = days[days > 0].groupby(level="Driver").size()
+        out = out.fillna(0).astype("int64")
+        if drivers is not None: out = out.reindex(drivers, fill_value=0)
+        return out
+
+@st.cache_resource
+def get_rollups():
+    return RollupStore()
+
+# ==========================================
+# 💵 PAYROLL ENGINE
+# ==========================================
+# Salary maths for every driver in one vectorised pass over the rollup totals
+# (driver x metric, halala ints). Results stay numeric (SAR floats); only the
+# screens turn them into text, so totals are summed from numbers, not strings.
+def payroll(totals):
+    shifts = totals['shifts'].to_numpy()
+    rev = sar(totals['revenue'].to_numpy())
+    ratio = np.minimum(rev / MONTHLY_TARGET, 1.0) if MONTHLY_TARGET > 0 else np.zeros(len(rev))
+    salary = BASE_SALARY * ratio
+    adv, fines = sar(totals['advances'].to_numpy()), sar(totals['fines'].to_numpy())
+    return pd.DataFrame({
+        "shifts": shifts, "days": totals['days'].to_numpy(),
+        "revenue": rev, "ratio": ratio, "salary": salary,
+        "advances": adv, "fines": fines, "payable": salary - adv - fines,
+        "avg_shift": np.divide(rev, shifts, out=np.zeros(len(rev)), where=shifts > 0)
+    }, index=totals.index)
+
+def fmt_sar(values):
+    # Display only: 12345.6 -> "12,346"
+    return [f"{v:,.0f}" for v in values]
+
+def hhmm(hours):
+    # Decimal hours -> "H:MM" (2.8 -> "2:48")
+    total_mins = int(float(hours) * 60)
+    return f"{total_mins // 60}:{total_mins % 60:02d}"
+
+# ==========================================
+# 🗂️ INDEXES (QUERY LAYER)
+# ==========================================
+# Row positions per loaded frame: id -> position (hash) plus value -> sorted
+# positions for driver / status / approval. Built once per data version (fetch_db
+# stamps every load, queued writes extend the stamp) and reused by every rerun
+# that sees that version, so lookups cost O(1) / O(k) instead of a full mask.
+INDEX_COLS = {
+    "data": ["Driver", "Status", "Approval_Status"],
+    "trans": ["Driver", "Type", "Approval_Status"]
+}
+
+class TableIndex:
+    def __init__(self, key, df):
+        self.size = len(df)
+        ids = df[ID_COLS[key]].astype(str).values
+        self.ids = dict(zip(ids, range(len(ids))))  # duplicate id -> last row wins
+        self.by = {}
+        for c in INDEX_COLS[key]:
+            groups = df[c].groupby(df[c], observed=True, sort=False).indices
+            self.by[c] = {str(v): pos for v, pos in groups.items()}
+
+    def find(self, rid):
+        return self.ids.get(str(rid))
+
+    def positions(self, **where):
+        # col=value or col=[values]; AND across columns, OR inside a list, None = no filter
+        out = None
+        for col, want in where.items():
+            if want is None: continue
+            vals = want if isinstance(want, (list, tuple, set)) else [want]
+            hits = [self.by[col][str(v)] for v in vals if str(v) in self.by[col]]
+            pos = np.sort(np.concatenate(hits)) if hits else np.empty(0, dtype=np.intp)
+            out = pos if out is None else np.intersect1d(out, pos, assume_unique=True)
+        return np.arange(self.size) if out is None else out
+
+class IndexCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.built = {}  # (key, scope) -> (version, TableIndex)
+
+    def get(self, key, scope, df):
+        version = df.attrs.get("version")
+        with self.lock: hit = self.built.get((key, scope))
+        metrics.inc("cache_lookups_total", cache="index", key=key)
+        if version is not None and hit and hit[0] == version and hit[1].size == len(df):
+            return hit[1]
+        metrics.inc("cache_misses_total", cache="index", key=key)
+        index = TableIndex(key, df)
+        if version is not None:
+            with self.lock: self.built[(key, scope)] = (version, index)
+        return index
+
+@st.cache_resource
+def get_indexes():
+    return IndexCache()
+
+# ==========================================
+# 🧭 DATA CONTEXT (ONE PER RERUN)
+# ==========================================
+# main() builds one per rerun and hands it to every render_*: each (table, scope)
+# frame is loaded once and the views several screens share (open shifts, approved
+# completed shifts, approved transactions, pending queues, rollup totals) are
+# filtered once, instead of every widget calling load_db and re-masking by itself.
+# Views are shared between screens - derive with assign/filters, never edit in place.
+class DataContext:
+    def __init__(self, user=None, role=None):
+        self.user = user
+        self.role = role
+        self.frames = {}
+        self.views = {}
+
+    def frame(self, key, scope="all"):
+        if (key, scope) not in self.frames:
+            self.frames[(key, scope)] = load_db(key, scope)
+        return self.frames[(key, scope)]
+
+    def _view(self, name, scope, build):
+        if (name, scope) not in self.views:
+            self.views[(name, scope)] = build()
+        return self.views[(name, scope)]
+
+    def shifts(self, scope="hot"):
+        return self.frame('data', scope)
+
+    def trans(self, scope="hot"):
+        return self.frame('trans', scope)
+
+    # --- query layer: O(1) by id, O(k) by driver / status / approval ---
+    def index(self, key, scope="hot"):
+        return get_indexes().get(key, scope, self.frame(key, scope))
+
+    def row(self, key, rid, scope="hot"):
+        pos = self.index(key, scope).find(rid)
+        return None if pos is None else self.frame(key, scope).iloc[pos]
+
+    def rows(self, key, scope="hot", **where):
+        return self.frame(key, scope).iloc[self.index(key, scope).positions(**where)]
+
+    # --- live screens ("hot" = this + last month, plus open / pending rows of older months) ---
+    def open_shifts(self):
+        return self._view("open", "hot", lambda: self.rows('data', "hot", Status=OPEN_STATES['data'][1]))
+
+    def active_shifts(self):
+        return self._view("active", "hot", lambda: self.rows('data', "hot", Status='Active'))
+
+    def pending_shifts(self):
+        return self._view("pending", "hot", lambda: self.rows('data', "hot", Status=['Pending_Start', 'Pending_End']))
+
+    def pending_trans(self):
+        return self._view("pending_trans", "hot", lambda: self.rows('trans', "hot", Approval_Status='Pending'))
+
+    # --- history / reports ---
+    def completed(self, scope="all"):
+        return self._view("completed", scope, lambda: self.rows('data', scope, Status='Completed', Approval_Status='Approved'))
+
+    def approved_trans(self, scope="all"):
+        return self._view("approved_trans", scope, lambda: self.rows('trans', scope, Approval_Status='Approved'))
+
+    def totals(self, scope, drivers=None):
+        # Rollup driver totals; one view per scope per rerun
+        out = self._view("totals", scope, lambda: get_rollups().view(scope))
+        return out.reindex(drivers, fill_value=0) if drivers is not None else out
 
 # ==========================================
 # 5. SESSION MANAGER
 # ==========================================
+# Login tokens sit in a small SQLite table (WAL, token primary key) instead of
+# active_sessions.json: a login is one INSERT, a check is a dict hit in the
+# in-process cache (SESSION_CACHE_TTL) and otherwise one indexed SELECT. A daemon
+# thread deletes expired tokens; tokens from the old json file are imported once.
+SESSION_HOURS = 24
+SESSION_CACHE_TTL = 30
+SESSION_GC_SECONDS = 600
+
+class SessionStore:
+    def __init__(self, path, legacy=None):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS sessions (token TEXT PRIMARY KEY, username TEXT NOT NULL, expiry REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS sessions_expiry ON sessions (expiry)")
+        self.cache = {}  # token -> (username or None, expiry epoch, cached at)
+        if legacy: self._import(legacy)
+        threading.Thread(target=self._gc_loop, daemon=True, name="fleet-session-gc").start()
+
+    def _import(self, path):
+        if not os.path.exists(path): return
+        try:
+            with open(path) as f: old = json.load(f)
+        except ValueError: old = {}
+        now = time.time()
+        rows = []
+        for token, s in old.items():
+            try: expiry = datetime.strptime(s['expiry'], "%Y-%m-%d %H:%M:%S").timestamp()
+            except (KeyError, TypeError, ValueError): continue
+            if expiry > now: rows.append((token, s.get('username', ''), expiry))
+        with self.lock:
+            self.conn.executemany("INSERT OR IGNORE INTO sessions VALUES (?, ?, ?)", rows)
+        os.replace(path, path + ".imported")  # once only: a logged-out token must not come back
+
+    def create(self, username, hours=SESSION_HOURS):
+        token = str(uuid.uuid4())
+        expiry = time.time() + hours * 3600
+        with self.lock:
+            self.conn.execute("INSERT INTO sessions VALUES (?, ?, ?)", (token, username, expiry))
+        self.cache[token] = (username, expiry, time.monotonic())
+        return token
+
+    def get(self, token):
+        # -> username, or None if unknown / expired
+        hit = self.cache.get(token)
+        if hit is None or time.monotonic() - hit[2] > SESSION_CACHE_TTL:
+            with self.lock:
+                row = self.conn.execute("SELECT username, expiry FROM sessions WHERE token = ?", (token,)).fetchone()
+            hit = (row[0], row[1], time.monotonic()) if row else (None, 0.0, time.monotonic())
+            self.cache[token] = hit
+        return hit[0] if hit[1] > time.time() else None
+
+    def revoke(self, token):
+        with self.lock:
+            self.conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+        self.cache.pop(token, None)
+
+    def gc(self):
+        now, stale = time.time(), time.monotonic() - SESSION_CACHE_TTL
+        with self.lock:
+            gone = self.conn.execute("DELETE FROM sessions WHERE expiry <= ?", (now,)).rowcount
+        self.cache = {t: h for t, h in list(self.cache.items()) if h[1] > now and h[2] > stale}
+        return gone
+
+    def _gc_loop(self):
+        while True:
+            time.sleep(SESSION_GC_SECONDS)
+            try: self.gc()
+            except sqlite3.Error: pass
+
+@st.cache_resource
+def get_sessions():
+    return SessionStore(get_setting("session_path", "sessions.db"), legacy=FILES['sessions'])
+
 def create_session(user):
-    s = {}
-    try: 
-        if os.path.exists(FILES['sessions']):
-            s = json.load(open(FILES['sessions']))
-    except: 
-        pass
-    
-    token = str(uuid.uuid4())
-    s[token] = {
-        "username": user, 
-        "expiry": (datetime.now() + timedelta(hours=24)).strftime("%Y-%m-%d %H:%M:%S")
-    }
-    
-    with open(FILES['sessions'], 'w') as f: 
-        json.dump(s, f)
-    return token
+    return get_sessions().create(user)
 
 def check_session():
     token = st.query_params.get("session", None)
-    if not token or not os.path.exists(FILES['sessions']): 
-        return None
-    
-    try:
-        s = json.load(open(FILES['sessions']))
-        if token in s:
-            expiry = datetime.strptime(s[token]['expiry'], "%Y-%m-%d %H:%M:%S")
-            if datetime.now() < expiry:
-                u = s[token]['username']
-                return USERS_DB.get(u, None)
-    except: 
-        pass
-    
-    return None
+    if not token: return None
+    u = get_sessions().get(token)
+    return USERS_DB.get(u, None) if u else None
 
 def logout(): 
+    token = st.query_params.get("session", None)
+    if token: get_sessions().revoke(token)
     st.query_params.clear()
     st.rerun()
 
+# ==========================================
+# 💬 FLASH MESSAGES (SURVIVE ONE RERUN)
+# ==========================================
+# After a save: queue the confirmation, st.rerun() straight away, and the next run
+# shows it. Nothing sleeps on the script thread just so a message stays readable.
+def flash(kind, text=None, icon=None):
+    # kind: "success" / "info" / "warning" / "error" / "toast" / "balloons"
+    st.session_state.setdefault("flash", []).append((kind, text, icon))
+
+def show_flash():
+    for kind, text, icon in st.session_state.pop("flash", []):
+        if kind == "toast": st.toast(text, icon=icon)
+        elif kind == "balloons": st.balloons()
+        else: getattr(st, kind)(text)
+
 # ==========================================
 # 6. UI: LOGIN
 # ==========================================
+@metrics.timed("render_seconds")
 def render_login():
     st.markdown("<br><br>", unsafe_allow_html=True)
     c1, c2, c3 = st.columns([1, 1.5, 1])
@@ -501,119 +2169,112 @@ def render_login():
 # ==========================================
 # 7. UI: DUAL HISTORY LOGS (FIXED DUPLICATE KEY ERROR)
 # ==========================================
-def render_history_logs(user, role, unique_key="default"):
+# Filter -> sort -> slice one page on the server, then send that page as ONE html
+# block: payload and widget count stay flat however long the history gets.
+LOG_PAGE_SIZE = 50
+
+def log_page(logs, date_col, unique_key):
+    # Newest first; returns just the rows of the selected page
+    n = len(logs)
+    pages = max((n - 1) // LOG_PAGE_SIZE + 1, 1)
+    key = f"log_page_{unique_key}"
+    if st.session_state.get(key, 1) > pages: st.session_state[key] = pages  # filters shrank the list
+    c1, c2 = st.columns([1, 3])
+    with c1: page = st.number_input("PAGE", min_value=1, max_value=pages, step=1, key=key)
+    first = (int(page) - 1) * LOG_PAGE_SIZE
+    with c2: st.caption(f"SHOWING {first + 1 if n else 0}-{min(first + LOG_PAGE_SIZE, n)} OF {n} RECORDS")
+    # Undated rows (NaT) go after the oldest ones
+    return logs.sort_values(date_col, ascending=False, na_position="last", kind="stable").iloc[first:first + LOG_PAGE_SIZE]
+
+def log_block(columns, rows):
+    # Header + page rows in a single markdown element (one line per row: no markdown code blocks)
+    head = "".join(f'<div class="{cls}">{label}</div>' for cls, label in columns)
+    st.markdown('<div style="display:flex;justify-content:space-between;color:#888;font-size:12px;padding:5px;">'
+                + head + '</div>' + "".join(rows), unsafe_allow_html=True)
+
+@metrics.timed("render_seconds")
+def render_history_logs(ctx, user, role, unique_key="default"):
     st.markdown("### 📜 HISTORY LOGS")
     
     # 👇 FIX: Widget Keys ab unique hongi (e.g., 'type_ceo_shift', 'type_driver')
-    log_type = st.radio("TYPE", ["🚙 SHIFTS", "💸 TRANSACTIONS"], horizontal=True, key=f"log_type_{unique_key}")
-    
-    if "SHIFT" in log_type:
-        df = load_db('data')
-        
-        valid = ['Completed', 'Pending_End', 'Complete']
-        
-        if role == "driver":
-            logs = df[(df['Driver'] == user) & (df['Status'].isin(valid))]
+    # Filter badla to wapis page 1
+    first_page = lambda: st.session_state.pop(f"log_page_{unique_key}", None)
+    log_type = st.radio("TYPE", ["🚙 SHIFTS", "💸 TRANSACTIONS"], horizontal=True, key=f"log_type_{unique_key}", on_change=first_page)
+    is_shift = "SHIFT" in log_type
+    
+    f1, f2, f3 = st.columns(3)
+    with f1:
+        if role == "driver": who = user
         else:
             # 👇 FIX: Key added here too
-            sel = st.selectbox("FILTER DRIVER", ["ALL"] + DRIVERS, key=f"filter_shift_{unique_key}")
-            if sel == "ALL":
-                logs = df[df['Status'].isin(valid)]
-            else:
-                logs = df[(df['Driver'] == sel) & (df['Status'].isin(valid))]
-        
-        if logs.empty: st.info("NO DATA"); return
-        
-        # Sort
-        if 'Start_Time' in logs.columns:
-            logs['Start_Time'] = pd.to_datetime(logs['Start_Time'], errors='coerce')
-            logs = logs.sort_values(by="Start_Time", ascending=False)
-        
-        st.markdown("""<div style="display:flex;justify-content:space-between;color:#888;font-size:12px;padding:5px;">
-            <div class="t-date">DATE</div>
-            <div class="t-main">UNIT</div>
-            <div class="t-sub">TIMELINE</div>
-            <div class="t-duration">STATUS</div>
-            <div class="t-val">REV</div>
-        </div>""", unsafe_allow_html=True)
-        
-        for _, r in logs.iterrows():
-            try:
-                if pd.notna(r['Start_Time']):
-                    d_str = r['Start_Time'].strftime("%d-%b")
-                    t_str = r['Start_Time'].strftime("%I:%M%p")
-                else:
-                    d_str = "Unknown"; t_str = "--"
-                
-                if pd.notna(r['End_Time']): 
-                    e_str = pd.to_datetime(r['End_Time']).strftime("%I:%M%p")
-                else: 
-                    e_str = "--"
-                
-                stat = r['Status']
-                col = "#ffaa00" if "Pending" in stat else "#00ff41"
-                
-                st.markdown(f"""<div class="terminal-row"><div class="t-date" style="color:#fff">{d_str}</div>
-                <div class="t-main">{str(r['Car']).split(' ')[1]}</div><div class="t-sub">{t_str} ➔ {e_str}</div>
-                <div class="t-duration" style="color:{col}">{stat}</div><div class="t-val">{float(r['Total_Earnings']):,.0f}</div></div>""", unsafe_allow_html=True)
-            except: continue
-
-    else:
-        df = load_db('trans')
-        
-        if role == "driver": logs = df[df['Driver'] == user]
+            sel = st.selectbox("FILTER DRIVER", ["ALL"] + DRIVERS, key=f"filter_{'shift' if is_shift else 'trans'}_{unique_key}", on_change=first_page)
+            who = None if sel == "ALL" else sel
+    with f2:
+        if is_shift:
+            status = st.multiselect("STATUS", ["Completed", "Pending_End"], key=f"log_status_{unique_key}", on_change=first_page)
+            status = status or ['Completed', 'Pending_End']
+            if 'Completed' in status: status = status + ['Complete']  # purani entries
         else:
-            # 👇 FIX: Key added here too
-            sel = st.selectbox("FILTER DRIVER", ["ALL"] + DRIVERS, key=f"filter_trans_{unique_key}")
-            logs = df if sel == "ALL" else df[df['Driver'] == sel]
-            
-        if logs.empty: st.info("NO DATA"); return
-        
-        if 'Date' in logs.columns:
-            logs['Date'] = pd.to_datetime(logs['Date'], errors='coerce')
-            logs = logs.sort_values(by="Date", ascending=False)
-            
-        st.markdown("""<div style="display:flex;justify-content:space-between;color:#888;font-size:12px;padding:5px;">
-            <div class="t-date">DATE</div>
-            <div class="t-main">TYPE</div>
-            <div class="t-sub">NOTE</div>
-            <div class="t-sub">STATUS</div>
-            <div class="t-val">AMT</div>
-        </div>""", unsafe_allow_html=True)
-        
-        for _, r in logs.iterrows():
-            try:
-                d_str = r['Date'].strftime("%d-%b") if pd.notna(r['Date']) else "N/A"
-                raw_type = r['Type']
-                
-                # Label Logic
-                display_label = raw_type
-                if raw_type == "Received":
-                    display_label = "💸 SENT" if role == "driver" else "📥 RECEIVED"
-                elif raw_type == "Advance":
-                    display_label = "💰 RECEIVED" if role == "driver" else "📤 SENT (ADV)"
-                
-                col = "#0088ff" if "Advance" in raw_type else "#00ff41"
-
-                st.markdown(f"""<div class="terminal-row"><div class="t-date" style="color:#fff">{d_str}</div>
-                <div class="t-main" style="color:{col}">{display_label}</div>
-                <div class="t-sub">{str(r['Notes'])[:15]}..</div>
-                <div class="t-sub">{r['Approval_Status']}</div><div class="t-val" style="color:{col}">{r['Amount']}</div></div>""", unsafe_allow_html=True)
-            except: continue
+            status = st.multiselect("STATUS", ["Approved", "Pending"], key=f"log_appr_{unique_key}", on_change=first_page) or None
+    with f3:
+        if is_shift: kinds = None
+        else: kinds = st.multiselect("TYPE", ["Received", "Advance", "CEO_Transfer", "Challan", "Expense"], key=f"log_kind_{unique_key}", on_change=first_page) or None
+    
+    c1, c2 = st.columns([2, 1])
+    with c1: span = st.date_input("DATE RANGE", value=(), key=f"log_dates_{unique_key}", on_change=first_page)
+    span = span if isinstance(span, (list, tuple)) and len(span) == 2 else None
+    # Pichle 2 mahine by default; purane months sirf maangne par (ya purani date range par) load hon
+    with c2: older = st.toggle("📂 INCLUDE OLDER MONTHS", key=f"log_all_{unique_key}", on_change=first_page)
+    old = span is not None and span[0].strftime("%Y-%m") < add_months(this_month(), -1)
+    scope = "all" if older or old else "hot"
+    
+    date_col = "Start_Time" if is_shift else "Date"
+    if is_shift: logs = ctx.rows('data', scope, Status=status, Driver=who)
+    else: logs = ctx.rows('trans', scope, Approval_Status=status, Type=kinds, Driver=who)
+    if span is not None:
+        day = logs[date_col].dt.normalize()
+        logs = logs[(day >= pd.Timestamp(span[0])) & (day <= pd.Timestamp(span[1]))]
+    
+    if logs.empty: st.info("NO DATA"); return
+    page = log_page(logs, date_col, unique_key)
+    
+    if is_shift:
+        start, end = page['Start_Time'], page['End_Time']
+        rows = [
+            f'<div class="terminal-row"><div class="t-date" style="color:#fff">{d}</div><div class="t-main">{car}</div>'
+            f'<div class="t-sub">{t} ➔ {e}</div><div class="t-duration" style="color:{"#ffaa00" if "Pending" in stat else "#00ff41"}">{stat}</div>'
+            f'<div class="t-val">{rev:,.0f}</div></div>'
+            for d, t, e, car, stat, rev in zip(
+                start.dt.strftime("%d-%b").fillna("Unknown"), start.dt.strftime("%I:%M%p").fillna("--"),
+                end.dt.strftime("%I:%M%p").fillna("--"), page['Car'].astype(str).str.split(' ').str[1].fillna(""),
+                page['Status'].astype(str), sar(page['Total_Earnings'].to_numpy()))
+        ]
+        log_block([("t-date", "DATE"), ("t-main", "UNIT"), ("t-sub", "TIMELINE"), ("t-duration", "STATUS"), ("t-val", "REV")], rows)
+    
+    else:
+        # Label Logic
+        labels = {"Received": "💸 SENT" if role == "driver" else "📥 RECEIVED",
+                  "Advance": "💰 RECEIVED" if role == "driver" else "📤 SENT (ADV)"}
+        rows = []
+        for d, kind, note, appr, amt in zip(page['Date'].dt.strftime("%d-%b").fillna("N/A"), page['Type'].astype(str),
+                                            page['Notes'].astype(str), page['Approval_Status'].astype(str),
+                                            sar(page['Amount'].to_numpy())):
+            col = "#0088ff" if "Advance" in kind else "#00ff41"
+            rows.append(f'<div class="terminal-row"><div class="t-date" style="color:#fff">{d}</div>'
+                        f'<div class="t-main" style="color:{col}">{labels.get(kind, kind)}</div>'
+                        f'<div class="t-sub">{escape(note[:15])}..</div><div class="t-sub">{appr}</div>'
+                        f'<div class="t-val" style="color:{col}">{amt:g}</div></div>')
+        log_block([("t-date", "DATE"), ("t-main", "TYPE"), ("t-sub", "NOTE"), ("t-sub", "STATUS"), ("t-val", "AMT")], rows)
 # ==========================================
 # 8. UI: DRIVER HUD & TIMER
 # ==========================================
-def render_driver_hud(driver):
-    df = load_db('data')
+@metrics.timed("render_seconds")
+def render_driver_hud(ctx, driver):
+    mine = payroll(ctx.totals("month", [driver])).loc[driver]
     
-    comp = df[(df['Driver'] == driver) & (df['Status'] == 'Completed') & (df['Approval_Status'] == 'Approved')]
+    rev, ratio, sal = mine['revenue'], mine['ratio'], mine['salary']
     
-    rev = comp['Total_Earnings'].sum() if not comp.empty else 0
-    
-    ratio = min(rev / MONTHLY_TARGET, 1.0) if MONTHLY_TARGET > 0 else 0
-    sal = BASE_SALARY * ratio
-    
-    days_worked = len(comp['Start_Time'].dt.date.unique()) if not comp.empty else 0
+    days_worked = int(mine['days'])
     
     st.markdown(f"### 👤 CMD╰┈➤ {driver.upper()}")
     
@@ -665,16 +2326,16 @@ def render_driver_hud(driver):
 # ==========================================
 # ⏱️ UI: MISSION TIMER (RIYADH TIME FIX)
 # ==========================================
-def render_js_timer(driver):
-    df = load_db('data')
-    active = df[(df['Driver'] == driver) & (df['Status'] == 'Active')]
+@metrics.timed("render_seconds")
+def render_js_timer(ctx, driver):
+    active = ctx.rows('data', "hot", Status='Active', Driver=driver)
     
     if active.empty:
         return
     
     try:
         # 1. Get Start Time from DB
-        start_time = pd.to_datetime(active.iloc[0]['Start_Time'])
+        start_time = active.iloc[0]['Start_Time']
         
         # 2. Get Current Time (Fixed for Riyadh)
         # Server UTC par hota hai, usme 3 ghantay add karein taake Riyadh ka waqt ban jaye
@@ -767,9 +2428,19 @@ def render_js_timer(driver):
 # ==========================================
 # 9. UI: ADMIN & OPS
 # ==========================================
-def render_fleet(role):
-    df = load_db('data')
-    active = df[df['Status'] == 'Active']
+# Fleet radar and pending badge are fragments: every LIVE_SECONDS they rerun by
+# themselves and redraw only their own block. Each run builds its own DataContext
+# (the one from the last full rerun would be stale) - cheap, load_db only re-reads
+# a table when its data version moved.
+LIVE_SECONDS = 15
+
+@st.fragment(run_every=LIVE_SECONDS)
+def live_fleet(user, role, view):
+    render_fleet(DataContext(user, role), view)
+
+@metrics.timed("render_seconds")
+def render_fleet(ctx, role):
+    active = ctx.active_shifts()
     
     st.markdown("### 📡 FLEET RADAR")
     
@@ -782,7 +2453,7 @@ def render_fleet(role):
     cols = st.columns(len(drivers)) if len(drivers) > 0 else [st.empty()]
     
     for i, d in enumerate(drivers):
-        row = active[active['Driver'] == d]
+        row = ctx.rows('data', "hot", Status='Active', Driver=d)
         is_active = not row.empty
         
         car = row.iloc[0]['Car'].split(' ')[1] if is_active else "---"
@@ -816,27 +2487,14 @@ def render_fleet(role):
             """, unsafe_allow_html=True)
     st.markdown("---")
 
-def render_manager_stats():
-    df_s = load_db('data')
-    df_t = load_db('trans')
+@metrics.timed("render_seconds")
+def render_manager_stats(ctx):
+    tot = ctx.totals("all").sum()  # whole fleet, all months
     
-    comp = df_s[df_s['Status'] == 'Completed']
-    gross_rev = comp['Total_Earnings'].sum() if not comp.empty else 0
-    
-    if not df_t.empty:
-        app = df_t[df_t['Approval_Status'] == 'Approved']
-        
-        rec = app[app['Type'] == 'Received']['Amount'].sum() if not app.empty else 0
-        
-        adv = app[app['Type'] == 'Advance']['Amount'].sum() if not app.empty else 0
-        mgr_ceo = app[(app['Type'] == 'CEO_Transfer') & (app['Source'] == 'Manager')]['Amount'].sum() if not app.empty else 0
-        
-        expenses = app[app['Type'] == 'Expense']['Amount'].sum() if not app.empty else 0
-        
-        safe = rec - adv - mgr_ceo
-        
-    else:
-        rec = adv = mgr_ceo = expenses = safe = 0
+    gross_rev = sar(tot.get('gross', 0))
+    rec, adv = sar(tot.get('received', 0)), sar(tot.get('advances', 0))
+    mgr_ceo, expenses = sar(tot.get('ceo_transfers', 0)), sar(tot.get('expenses', 0))
+    safe = rec - adv - mgr_ceo
     
     st.markdown("### 💠 FINANCE CORE")
     
@@ -880,31 +2538,83 @@ def render_manager_stats():
     
     st.markdown("---")
 
+# ==========================================
+# 📉 CHARTS (PRE-AGGREGATED, MEMOISED)
+# ==========================================
+# Chart series are summed per day x driver straight from the typed columns (no
+# per-row Date / Day strings), bucketed to weeks / months once the range gets
+# long, and finished Plotly figures are kept per (chart, data version, role,
+# user), so a rerun on unchanged data builds nothing. Long series draw with WebGL.
+CHART_DAYS = 120       # up to this many days: one point per day
+CHART_WEEKS = 104      # up to this many weeks: one point per week, beyond: per month
+WEBGL_POINTS = 1000    # more points than this -> Scattergl instead of SVG
+CHART_CACHE_SIZE = 64  # figures kept (all viewers)
+CHART_CONFIG = {'modeBarButtonsToRemove': ['zoom2d', 'select2d', 'lasso2d']}
+BUCKET_TICKS = {"D": "%a %d", "W": "%d %b", "M": "%b %Y"}
+
+def daily_revenue(df):
+    # Completed shifts -> one row per (Date, Driver), revenue in halala
+    out = pd.DataFrame({
+        'Date': df['Start_Time'].values.astype('datetime64[D]'),
+        'Driver': df['Driver'].astype(str).values,
+        'Total_Earnings': df['Total_Earnings'].values
+    })
+    return out.groupby(['Date', 'Driver'])['Total_Earnings'].sum().reset_index()
+
+def bucket_series(daily):
+    # Long ranges -> weekly / monthly sums, so the chart never carries thousands of days
+    if daily.empty: return daily, "D"
+    span = (daily['Date'].max() - daily['Date'].min()).days + 1
+    if span <= CHART_DAYS: return daily, "D"
+    freq = "W" if span <= CHART_WEEKS * 7 else "M"
+    start = daily['Date'].dt.to_period(freq).dt.start_time
+    return daily.assign(Date=start).groupby(['Date', 'Driver'])['Total_Earnings'].sum().reset_index(), freq
+
+class ChartCache:
+    def __init__(self, size=CHART_CACHE_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.figs = OrderedDict()
+
+    def get(self, key, build):
+        metrics.inc("cache_lookups_total", cache="chart", key=key[0])
+        with self.lock:
+            if key in self.figs:
+                self.figs.move_to_end(key)
+                return self.figs[key]
+        metrics.inc("cache_misses_total", cache="chart", key=key[0])
+        fig = build()
+        with self.lock:
+            self.figs[key] = fig
+            while len(self.figs) > self.size: self.figs.popitem(last=False)
+        return fig
+
+@st.cache_resource
+def get_charts():
+    return ChartCache()
+
+def cached_chart(name, version, role, user, build):
+    # Unversioned data (no stamp) is never cached
+    if version is None: return build()
+    return get_charts().get((name, version, role, user), build)
+
 # ==========================================
 # 🏆 UI: LIVE LEADERBOARD
 # ==========================================
-def render_leaderboard():
-    df = load_db('data')
-    
-    comp = df[(df['Status'] == 'Completed') & (df['Approval_Status'] == 'Approved')]
-    
-    if comp.empty:
-        st.info("WAITING FOR DATA...")
-        return
-    
-    ranking = comp.groupby('Driver').agg(
-        Total_Earnings=('Total_Earnings', 'sum'),
-        Total_Shifts=('Shift_ID', 'count')
-    ).reset_index()
+def leaderboard_figure(tot):
+    ranking = pd.DataFrame({
+        'Driver': tot.index.astype(str),
+        'Total_Earnings': sar(tot['revenue'].values),
+        'Total_Shifts': tot['shifts'].values
+    })
     
     ranking = ranking.sort_values(by='Total_Earnings', ascending=False)
-    st.markdown("### 🏆 ELITE DRIVER RANKING")
     
     fig = go.Figure(data=[
         go.Bar(
             x=ranking['Driver'],
             y=ranking['Total_Earnings'],
-            text=ranking.apply(lambda x: f"{x['Total_Shifts']} SHIFTS", axis=1),
+            text=[f"{n} SHIFTS" for n in ranking['Total_Shifts']],
             textposition='auto',
             marker=dict(
                 color=['#FFD700', '#C0C0C0', '#CD7F32', '#00ff41', '#0088ff'][:len(ranking)],
@@ -933,35 +2643,41 @@ def render_leaderboard():
         margin=dict(t=40, b=20),
         dragmode='pan'
     )
-    st.plotly_chart(fig, use_container_width=True, config={'modeBarButtonsToRemove': ['zoom2d', 'select2d', 'lasso2d']})
+    return fig
 
-# ==========================================
-# 📈 UI: NEON ANALYTICS (ENHANCED)
-# ==========================================
-def render_analytics(user, role):
-    df = load_db('data')
-    
-    data = df[df['Status'] == 'Completed'] if role == 'admin' else df[(df['Driver'] == user) & (df['Status'] == 'Completed')]
+@metrics.timed("render_seconds")
+def render_leaderboard(ctx):
+    tot = ctx.totals("all")
+    tot = tot[tot['shifts'] > 0]
     
-    if data.empty:
-        st.info("📊 NO DATA AVAILABLE FOR ANALYTICS")
+    if tot.empty:
+        st.info("WAITING FOR DATA...")
         return
-
-    st.markdown("### 📊 PERFORMANCE ANALYTICS")
     
-    data['Date'] = pd.to_datetime(data['Start_Time']).dt.date
-    data['Day'] = pd.to_datetime(data['Start_Time']).dt.strftime('%a %d')
+    st.markdown("### 🏆 ELITE DRIVER RANKING")
+    # Rollup totals are a few rows: their content is the version
+    version = tuple(zip(tot.index, tot['revenue'], tot['shifts']))
+    fig = cached_chart("leaderboard", version, None, None, lambda: leaderboard_figure(tot))
+    st.plotly_chart(fig, use_container_width=True, config=CHART_CONFIG)
 
-    daily_data = data.groupby(['Date', 'Day', 'Driver'])['Total_Earnings'].sum().reset_index()
+# ==========================================
+# 📈 UI: NEON ANALYTICS (ENHANCED)
+# ==========================================
+def analytics_figure(data):
+    series, freq = bucket_series(daily_revenue(data))
+    if series.empty: return None
+    series['Total_Earnings'] = sar(series['Total_Earnings'])
     
     fig_line = px.line(
-        daily_data, 
-        x='Day', 
+        series, 
+        x='Date', 
         y='Total_Earnings', 
         color='Driver', 
         markers=True,
-        title="<b>📈 DAILY REVENUE RACE</b>",
-        color_discrete_sequence=px.colors.qualitative.Bold
+        title="<b>📈 DAILY REVENUE RACE</b>" if freq == "D" else
+              f"<b>📈 {'WEEKLY' if freq == 'W' else 'MONTHLY'} REVENUE RACE</b>",
+        color_discrete_sequence=px.colors.qualitative.Bold,
+        render_mode='webgl' if len(series) > WEBGL_POINTS else 'svg'
     )
     fig_line.update_layout(
         plot_bgcolor='rgba(0,0,0,0)', 
@@ -969,20 +2685,70 @@ def render_analytics(user, role):
         font_color='#fff',
         xaxis_title="Timeline",
         yaxis_title="Revenue (SAR)",
+        xaxis_tickformat=BUCKET_TICKS[freq],
         dragmode='pan'
     )
-    st.plotly_chart(fig_line, use_container_width=True, config={'modeBarButtonsToRemove': ['zoom2d', 'select2d', 'lasso2d']})
+    return fig_line
+
+@metrics.timed("render_seconds")
+def render_analytics(ctx, user, role):
+    who = None if role == 'admin' else user
+    data = lambda: ctx.completed("all") if who is None else \
+        ctx.rows('data', "all", Status='Completed', Approval_Status='Approved', Driver=who)
+    fig = cached_chart("analytics", ctx.shifts("all").attrs.get("version"), role, who,
+                       lambda: analytics_figure(data()))
+    
+    if fig is None:
+        st.info("📊 NO DATA AVAILABLE FOR ANALYTICS")
+        return
+
+    st.markdown("### 📊 PERFORMANCE ANALYTICS")
+    st.plotly_chart(fig, use_container_width=True, config=CHART_CONFIG)
+
+# ==========================================
+# 🧾 UI: MISSION RECEIPT (STATE, NOT SLEEP)
+# ==========================================
+RECEIPT_SECONDS = 60
+
+@metrics.timed("render_seconds")
+def render_receipt(unique_key):
+    # Shown from session state after the end-mission rerun; the browser fades it out
+    # when the time is up and the next rerun after that drops it from state.
+    key = f"receipt_{unique_key}"
+    r = st.session_state.get(key)
+    if not r: return
+    left = RECEIPT_SECONDS - (time.time() - r["at"])
+    if left <= 0:
+        st.session_state.pop(key, None)
+        return
+    st.markdown(f"""
+    <div class="receipt-box receipt-expire" style="animation-delay:{left:.0f}s">
+        <h3 style="margin:0; text-align:center;">🧾 MISSION REPORT</h3>
+        <div style="text-align:center; font-size:12px; color:#888; margin-bottom:10px; font-family:'Courier New';">
+            {r['dt']}
+        </div>
+        <hr style="border-color:#00ff41;">
+        <div style="display:flex; justify-content:space-between;"><span>PILOT:</span><span>{r['driver']}</span></div>
+        <div style="display:flex; justify-content:space-between;"><span>UNIT:</span><span>{r['car']}</span></div>
+        <div style="display:flex; justify-content:space-between;"><span>DURATION:</span><span>{r['dur']:.1f} HRS</span></div>
+        <div style="display:flex; justify-content:space-between; color:#00ff41;"><span>TOTAL EARNINGS:</span><span>{r['earn']}</span></div>
+        <hr style="border-color:#333;">
+        <h1 style="text-align:center; margin-top:10px; color:#fff;">TOTAL: {r['earn']:,.0f} SAR</h1>
+        <div style="text-align:center; font-size:10px; color:#555;">ID: {r['sid']} | STATUS: {r['stat'].upper()}</div>
+        <div style="text-align:center; color:#00ff41; margin-top:10px;">✅ MISSION ENDED - SENT FOR APPROVAL</div>
+        <div style="text-align:center; font-size:10px; color:#888;">ℹ️ Closing automatically in {left:.0f} seconds...</div>
+    </div>
+    """, unsafe_allow_html=True)
 
 # ==========================================
 # 🔄 UI: OPERATIONS (RIYADH TIME FIXED)
 # ==========================================
-def render_ops(user, role, unique_key):
-    df = load_db('data')
-    
+@metrics.timed("render_seconds")
+def render_ops(ctx, user, role, unique_key):
     # Active/Pending shifts dhoondo
-    mask = df['Status'].isin(['Active', 'Pending_Start', 'Pending_End'])
-    busy_drivers = df[mask]['Driver'].astype(str).tolist()
-    busy_cars = df[mask]['Car'].astype(str).tolist()
+    busy = ctx.open_shifts()
+    busy_drivers = busy['Driver'].astype(str).tolist()
+    busy_cars = busy['Car'].astype(str).tolist()
     
     st.markdown("### 🛠️ OPERATIONS CENTER")
     
@@ -1034,8 +2800,6 @@ def render_ops(user, role, unique_key):
                     st.error("❌ LAUNCH FAILED: No Pilot or Unit Available!")
                 else:
                     with st.spinner("🔄 INITIALIZING SYSTEMS..."):
-                        time.sleep(1) 
-                        
                         status = "Active" if auto_live else "Pending_Start"
                         appr_status = "Approved" if auto_live else "Pending"
                         
@@ -1053,25 +2817,21 @@ def render_ops(user, role, unique_key):
                             "Total_Earnings": 0, "Duration": 0, "End_Time": ""
                         }
                         
-                        df = pd.concat([df, pd.DataFrame([new_shift])], ignore_index=True)
-                        save_db('data', df)
-                        
+                        saved = save_db('data', inserts=[new_shift])
+                    
+                    if saved:
                         if status == "Active":
-                            st.toast(f"✅ {driver} is now ONLINE!", icon="🟢")
-                            st.balloons()
+                            flash("toast", f"✅ {driver} is now ONLINE!", "🟢")
+                            flash("balloons")
                         else:
-                            st.toast("📩 Request Sent to Manager!", icon="📨")
-                            st.success("✅ REQUEST SUBMITTED FOR APPROVAL")
-                        
-                        time.sleep(1)
+                            flash("toast", "📩 Request Sent to Manager!", "📨")
+                            flash("success", "✅ REQUEST SUBMITTED FOR APPROVAL")
                         st.rerun()
 
     # --- TAB 2: END MISSION ---
     with t2:
-        if role == "driver":
-            acts = df[(df['Driver'] == user) & (df['Status'].isin(['Active', 'Pending_Start']))]
-        else:
-            acts = df[df['Status'].isin(['Active', 'Pending_Start'])]
+        render_receipt(unique_key)
+        acts = ctx.rows('data', "hot", Status=['Active', 'Pending_Start'], Driver=user if role == "driver" else None)
             
         if not acts.empty:
             opts = [f"{r['Shift_ID']} | {r['Driver']} | {r['Car'].split(' ')[1]}" for i, r in acts.iterrows()]
@@ -1079,8 +2839,7 @@ def render_ops(user, role, unique_key):
             
             if sel:
                 sid = sel.split(" | ")[0]
-                row_idx = df.index[df['Shift_ID'] == sid].tolist()[0]
-                row = df.loc[row_idx]
+                row = ctx.row('data', sid)
                 
                 st.info(f"🛑 TERMINATING MISSION: {row['Driver']}")
                 
@@ -1088,7 +2847,7 @@ def render_ops(user, role, unique_key):
                     c1, c2 = st.columns(2)
                     with c1:
                         cash = st.number_input("TOTAL EARNINGS", min_value=0.0, key=f"total_earnings_{unique_key}")
-                        ew = float(row['Start_Wallet'])
+                        ew = sar(row['Start_Wallet'])
                     with c2:
                         ef = st.slider("FINAL FUEL", 0, 100, 50)
                     
@@ -1096,7 +2855,7 @@ def render_ops(user, role, unique_key):
                         with st.spinner("💾 GENERATING RECEIPT..."):
                             
                             # 1. Start Time Read Karo
-                            s_time = pd.to_datetime(row['Start_Time'])
+                            s_time = row['Start_Time']
                             
                             # 👇 FIX: End Time ko Riyadh Time (+3 Hours) banao
                             riyadh_end = datetime.utcnow() + timedelta(hours=3)
@@ -1106,49 +2865,29 @@ def render_ops(user, role, unique_key):
                             dur_seconds = (riyadh_end - s_time).total_seconds()
                             dur = max(0, dur_seconds / 3600) # Minus na ho
                             
-                            # Receipt Date Format
-                            receipt_dt = riyadh_end.strftime("%d-%b-%Y | %I:%M %p")
-                            
                             earn = cash
                             stat = "Pending_End"
                             appr = "Pending"
                             
-                            # Update DB
-                            df.at[row_idx, 'End_Time'] = riyadh_end.strftime("%Y-%m-%d %H:%M:%S")
-                            df.at[row_idx, 'Duration'] = round(dur, 2)
-                            df.at[row_idx, 'End_Wallet'] = ew
-                            df.at[row_idx, 'Cash_Collected'] = cash
-                            df.at[row_idx, 'End_Fuel'] = ef
-                            df.at[row_idx, 'Total_Earnings'] = earn
-                            df.at[row_idx, 'Status'] = stat
-                            df.at[row_idx, 'Approval_Status'] = appr
-                            
-                            save_db('data', df)
-                            time.sleep(0.5)
-                        
-                        # Show Receipt
-                        st.markdown(f"""
-                        <div class="receipt-box">
-                            <h3 style="margin:0; text-align:center;">🧾 MISSION REPORT</h3>
-                            <div style="text-align:center; font-size:12px; color:#888; margin-bottom:10px; font-family:'Courier New';">
-                                {receipt_dt}
-                            </div>
-                            <hr style="border-color:#00ff41;">
-                            <div style="display:flex; justify-content:space-between;"><span>PILOT:</span><span>{row['Driver']}</span></div>
-                            <div style="display:flex; justify-content:space-between;"><span>UNIT:</span><span>{row['Car']}</span></div>
-                            <div style="display:flex; justify-content:space-between;"><span>DURATION:</span><span>{dur:.1f} HRS</span></div>
-                            <div style="display:flex; justify-content:space-between; color:#00ff41;"><span>TOTAL EARNINGS:</span><span>{cash}</span></div>
-                            <hr style="border-color:#333;">
-                            <h1 style="text-align:center; margin-top:10px; color:#fff;">TOTAL: {earn:,.0f} SAR</h1>
-                            <div style="text-align:center; font-size:10px; color:#555;">ID: {sid} | STATUS: {stat.upper()}</div>
-                        </div>
-                        """, unsafe_allow_html=True)
+                            # Update DB (sirf is shift ke cells) - only if mission is still open
+                            saved = save_db('data', updates={sid: {
+                                'End_Time': riyadh_end.strftime("%Y-%m-%d %H:%M:%S"),
+                                'Duration': round(dur, 2),
+                                'End_Wallet': ew,
+                                'Cash_Collected': cash,
+                                'End_Fuel': ef,
+                                'Total_Earnings': earn,
+                                'Status': stat,
+                                'Approval_Status': appr
+                            }}, expect={sid: expect_row(row, 'Status')})
                         
-                        st.success("✅ MISSION ENDED - SENT FOR APPROVAL")
-                        st.caption("ℹ️ Closing automatically in 60 seconds...")
-                        
-                        time.sleep(60) 
-                        st.rerun()
+                        if saved:
+                            # Receipt agle run mein dikhega (state), aur 60s baad khud band
+                            st.session_state[f"receipt_{unique_key}"] = {
+                                "at": time.time(), "sid": sid, "driver": str(row['Driver']), "car": str(row['Car']),
+                                "dt": riyadh_end.strftime("%d-%b-%Y | %I:%M %p"), "dur": dur, "earn": earn, "stat": stat
+                            }
+                            st.rerun()
         else:
             st.info("😴 NO ACTIVE MISSIONS DETECTED")
 
@@ -1186,7 +2925,6 @@ def render_ops(user, role, unique_key):
                     db_type = "Advance" if "ADVANCE" in ftype.upper() else "CEO_Transfer" if "CEO" in ftype.upper() else "Received"
                     status = "Pending" if role == "driver" else "Approved"
                     
-                    tdf = load_db('trans')
                     # Fix Transaction Date to Riyadh Time too
                     riyadh_now = datetime.utcnow() + timedelta(hours=3)
                     
@@ -1198,16 +2936,15 @@ def render_ops(user, role, unique_key):
                         "Approval_Status": status, "Source": src
                     }
                     
-                    tdf = pd.concat([tdf, pd.DataFrame([new_tx])], ignore_index=True)
-                    save_db('trans', tdf)
-                    time.sleep(0.5)
+                    saved = save_db('trans', inserts=[new_tx])
                 
-                st.toast(f"Transaction Saved: {amt} SAR", icon="💾")
-                st.success("✅ TRANSACTION RECORDED SUCCESSFULLY")
-                time.sleep(1)
-                st.rerun()
+                if saved:
+                    flash("toast", f"Transaction Saved: {amt} SAR", "💾")
+                    flash("success", "✅ TRANSACTION RECORDED SUCCESSFULLY")
+                    st.rerun()
 #---Services Tab: Maintenance & Penalties ---
-def render_services_tab(unique_key):
+@metrics.timed("render_seconds")
+def render_services_tab(ctx, unique_key):
     st.markdown("### 🔧 MAINTENANCE & PENALTIES")
     
     with st.form(key=f"serv_form_{unique_key}", clear_on_submit=True):
@@ -1239,7 +2976,6 @@ def render_services_tab(unique_key):
                         src = "Manager"
                         status = "Approved"
 
-                    tdf = load_db('trans')
                     new_tx = {
                         "Trans_ID": str(uuid.uuid4())[:8],
                         "Date": datetime.now().strftime("%Y-%m-%d %H:%M"),
@@ -1251,65 +2987,37 @@ def render_services_tab(unique_key):
                         "Approval_Status": status,
                         "Source": src
                     }
-                    tdf = pd.concat([tdf, pd.DataFrame([new_tx])], ignore_index=True)
-                    save_db('trans', tdf)
-                    
-                    time.sleep(0.5)
+                    saved = save_db('trans', inserts=[new_tx])
                 
-                if db_type == "Challan":
-                    st.error(f"⛔ CHALLAN ADDED! Will be deducted from {driver}'s salary.")
-                else:
-                    st.success(f"✅ EXPENSE RECORDED! Deducted from Manager's Account.")
-                time.sleep(1.5)
-                st.rerun()
+                if saved:
+                    if db_type == "Challan":
+                        flash("error", f"⛔ CHALLAN ADDED! Will be deducted from {driver}'s salary.")
+                    else:
+                        flash("success", f"✅ EXPENSE RECORDED! Deducted from Manager's Account.")
+                    st.rerun()
             else:
                 st.warning("⚠️ Please enter a valid amount.")
 
 # ==========================================
 # 💰 UI: SALARY REPORT (FIXED)
 # ==========================================
-def render_salary():
-    df = load_db('data')
-    tdf = load_db('trans')
+@metrics.timed("render_seconds")
+def render_salary(ctx):
+    pay = payroll(ctx.totals("month", DRIVERS))  # driver x this month, one pass
     
     st.markdown("### 💰 SALARY MATRIX")
     
-    comp = df[(df['Status'] == 'Completed') & (df['Approval_Status'] == 'Approved')]
-    adv_df = tdf[(tdf['Type'] == 'Advance') & (tdf['Approval_Status'] == 'Approved')]
-    
-    fine_df = tdf[tdf['Type'] == 'Challan']
-    
-    rows = []
-    
-    for driver in DRIVERS:
-        driver_shifts = comp[comp['Driver'] == driver]
-        rev = driver_shifts['Total_Earnings'].sum() if not driver_shifts.empty else 0
-        
-        ratio = min(rev / MONTHLY_TARGET, 1.0) if MONTHLY_TARGET > 0 else 0
-        sal = BASE_SALARY * ratio
-        
-        taken = adv_df[adv_df['Driver'] == driver]['Amount'].sum() if not adv_df.empty else 0
-        
-        penalties = fine_df[fine_df['Driver'] == driver]['Amount'].sum() if not fine_df.empty else 0
-        
-        pay = sal - taken - penalties
-        
-        shift_count = len(driver_shifts)
-        avg_rev = rev / shift_count if shift_count > 0 else 0
-        
-        rows.append({
-            "DRIVER": driver,
-            "SHIFTS": shift_count,
-            "REVENUE": f"{rev:,.0f}",
-            "PERF": f"{ratio*100:.0f}%",
-            "SALARY": f"{sal:,.0f}",
-            "ADVANCE": f"{taken:,.0f}",
-            "FINE": f"{penalties:,.0f}",
-            "PAYABLE": f"{pay:,.0f}",
-            "AVG/SHIFT": f"{avg_rev:,.0f}"
-        })
-    
-    salary_df = pd.DataFrame(rows)
+    salary_df = pd.DataFrame({
+        "DRIVER": pay.index.astype(str),
+        "SHIFTS": pay['shifts'],
+        "REVENUE": fmt_sar(pay['revenue']),
+        "PERF": [f"{r*100:.0f}%" for r in pay['ratio']],
+        "SALARY": fmt_sar(pay['salary']),
+        "ADVANCE": fmt_sar(pay['advances']),
+        "FINE": fmt_sar(pay['fines']),
+        "PAYABLE": fmt_sar(pay['payable']),
+        "AVG/SHIFT": fmt_sar(pay['avg_shift'])
+    })
     
     st.dataframe(
         salary_df,
@@ -1328,11 +3036,9 @@ def render_salary():
         }
     )
     
-    total_rev = sum(float(row["REVENUE"].replace(",", "")) for row in rows)
-    total_sal = sum(float(row["SALARY"].replace(",", "")) for row in rows)
-    total_adv = sum(float(row["ADVANCE"].replace(",", "")) for row in rows)
-    total_fine = sum(float(row["FINE"].replace(",", "")) for row in rows)
-    total_pay = sum(float(row["PAYABLE"].replace(",", "")) for row in rows)
+    total = pay.sum()
+    total_rev, total_sal, total_adv = total['revenue'], total['salary'], total['advances']
+    total_fine, total_pay = total['fines'], total['payable']
     
     col1, col2, col3, col4, col5 = st.columns(5)
     
@@ -1345,16 +3051,46 @@ def render_salary():
 # ==========================================
 # 🔔 UI: NOTIFICATIONS (REJECT = REVERT TO ACTIVE FIX)
 # ==========================================
-def render_notifs():
-    df = load_db('data')
-    tdf = load_db('trans')
-    
-    # Sirf wo shifts dikhao jo Pending hain (Start ya End ke liye)
-    pending_shifts = df[df['Status'].isin(['Pending_Start', 'Pending_End'])]
-    pending_trans = tdf[tdf['Approval_Status'] == 'Pending']
-    
-    total_pending = len(pending_shifts) + len(pending_trans)
-    
+# Tick any number of requests, then one APPROVE / REJECT: one save_db per table
+# for the whole batch, each row checked against the revision the admin saw.
+OUTCOME_TEXT = {"conflict": "changed by someone else", "missing": "already handled / deleted", "error": "save failed"}
+# End request reject -> wapis Active, end data saaf
+REVERT_END = {'Status': 'Active', 'Approval_Status': 'Approved', 'End_Time': '', 'Duration': 0,
+              'Total_Earnings': 0, 'Cash_Collected': 0, 'End_Wallet': 0, 'End_Fuel': 0}
+
+def decide_shifts(shifts, approve):
+    upd, dels = {}, []
+    for sid, stat in zip(shifts['Shift_ID'].astype(str), shifts['Status'].astype(str)):
+        if approve: upd[sid] = {'Status': 'Active' if stat == 'Pending_Start' else 'Completed', 'Approval_Status': 'Approved'}
+        elif stat == 'Pending_Start': dels.append(sid)  # Start hi ghalat tha -> delete row
+        else: upd[sid] = REVERT_END
+    return upd, dels
+
+def decide_trans(trans, approve):
+    ids = trans['Trans_ID'].astype(str).tolist()
+    # Transaction reject matlab delete
+    return ({rid: {'Approval_Status': 'Approved'} for rid in ids}, []) if approve else ({}, ids)
+
+def notif_batch(shifts, trans, approve):
+    # -> {"ok": n, "failed": [(label, outcome)]}
+    out = {"ok": 0, "failed": []}
+    for key, rows, decide, col in [('data', shifts, decide_shifts, 'Status'), ('trans', trans, decide_trans, 'Approval_Status')]:
+        if rows.empty: continue
+        upd, dels = decide(rows, approve)
+        expect = {str(r[ID_COLS[key]]): expect_row(r, col) for r in rows.to_dict("records")}
+        result = save_db(key, updates=upd, deletes=dels, expect=expect)
+        labels = dict(zip(rows[ID_COLS[key]].astype(str), rows['Driver'].astype(str)))
+        for rid, label in labels.items():
+            outcome = result.get(rid, "error") if result is not False else "error"
+            if outcome == "ok": out["ok"] += 1
+            else: out["failed"].append((f"{label} ({rid})", outcome))
+    return out
+
+@st.fragment(run_every=LIVE_SECONDS)
+def live_pending_badge(user, role, shown):
+    # shown = requests in the review tables of the last full rerun
+    live = DataContext(user, role)
+    total_pending = len(live.pending_shifts()) + len(live.pending_trans())
     if total_pending > 0:
         st.markdown(f"""
         <div style="display:flex; align-items:center; gap:10px; margin-bottom:20px;">
@@ -1362,95 +3098,146 @@ def render_notifs():
             <span style="color:#fff; font-size:16px; font-family:'Orbitron';">PENDING APPROVALS</span>
         </div>
         """, unsafe_allow_html=True)
-        
+    # Naye requests aaye ya queue khali ho gayi -> tables full rerun pe hi banti hain (ticks reset na hon)
+    if total_pending != shown and st.button("🔄 REQUESTS CHANGED - RELOAD LIST", key="notif_reload"):
+        st.rerun()
+
+@metrics.timed("render_seconds")
+def render_notifs(ctx):
+    # Sirf wo shifts dikhao jo Pending hain (Start ya End ke liye)
+    pending_shifts = ctx.pending_shifts()
+    pending_trans = ctx.pending_trans()
+    
+    total_pending = len(pending_shifts) + len(pending_trans)
+    live_pending_badge(ctx.user, ctx.role, total_pending)
+    
+    if total_pending > 0:
         with st.expander("📋 REVIEW REQUESTS", expanded=True):
+            pick_s = pick_t = None
             # --- 1. SHIFT REQUESTS ---
             if not pending_shifts.empty:
                 st.markdown("#### 🚗 SHIFT REQUESTS")
-                for idx, shift in pending_shifts.iterrows():
-                    col1, col2, col3 = st.columns([3, 1, 1])
-                    
-                    with col1:
-                        # Display Logic
-                        if shift['Status'] == 'Pending_Start':
-                            st.write(f"**🟢 START REQUEST:** {shift['Driver']} - {shift['Car']}")
-                            st.caption(f"Start Time: {shift['Start_Time']}")
-                        else:
-                            st.write(f"**🔴 END REQUEST:** {shift['Driver']} - {shift['Car']}")
-                            # Earnings show karo taake admin dekh sake sahi hai ya nahi
-                            earn = shift['Total_Earnings'] if 'Total_Earnings' in shift else 0
-                            cash = shift['Cash_Collected'] if 'Cash_Collected' in shift else 0
-                            st.caption(f"Earnings: {earn} | Cash Handover: {cash}")
-                    
-                    # ✅ APPROVE BUTTON
-                    with col2:
-                        if st.button("✅", key=f"approve_s_{idx}", help="Approve"):
-                            if shift['Status'] == 'Pending_Start':
-                                df.at[idx, 'Status'] = 'Active'
-                            else:
-                                df.at[idx, 'Status'] = 'Completed'
-                            
-                            df.at[idx, 'Approval_Status'] = 'Approved'
-                            save_db('data', df)
-                            st.success(f"Approved for {shift['Driver']}")
-                            time.sleep(1)
-                            st.rerun()
-                    
-                    # ❌ REJECT BUTTON (THE FIX)
-                    with col3:
-                        if st.button("❌", key=f"reject_s_{idx}", help="Reject & Revert"):
-                            if shift['Status'] == 'Pending_Start':
-                                # Case 1: Start hi ghalat tha -> Delete row
-                                df = df.drop(idx)
-                                st.warning(f"Start Request Deleted for {shift['Driver']}")
-                            else:
-                                # Case 2: End Request Reject hui -> REVERT TO ACTIVE
-                                # Wapis purani halat mein le aao
-                                df.at[idx, 'Status'] = 'Active'           # Wapis Active
-                                df.at[idx, 'Approval_Status'] = 'Approved' # Active maane Approved Start
-                                
-                                # End data saaf kar do
-                                df.at[idx, 'End_Time'] = ''
-                                df.at[idx, 'Duration'] = 0
-                                df.at[idx, 'Total_Earnings'] = 0
-                                df.at[idx, 'Cash_Collected'] = 0
-                                df.at[idx, 'End_Wallet'] = 0
-                                df.at[idx, 'End_Fuel'] = 0
-                                
-                                st.info(f"Session Reverted to ACTIVE for {shift['Driver']}")
-                            
-                            save_db('data', df)
-                            time.sleep(1)
-                            st.rerun()
-                    
-                    st.divider()
+                start = (pending_shifts['Status'] == 'Pending_Start').to_numpy()
+                # End request pe earnings dikhao taake admin dekh sake sahi hai ya nahi
+                details = [f"Start: {t}" if is_start else f"Earnings: {e:,.0f} | Cash: {c:,.0f}"
+                           for is_start, t, e, c in zip(start, pending_shifts['Start_Time'].dt.strftime("%d-%b %I:%M %p").fillna("--"),
+                                                        sar(pending_shifts['Total_Earnings'].to_numpy()),
+                                                        sar(pending_shifts['Cash_Collected'].to_numpy()))]
+                table = pd.DataFrame({
+                    "✔": False,
+                    "REQUEST": np.where(start, "🟢 START", "🔴 END"),
+                    "DRIVER": pending_shifts['Driver'].astype(str),
+                    "UNIT": pending_shifts['Car'].astype(str),
+                    "DETAILS": details
+                }, index=pending_shifts['Shift_ID'].astype(str))
+                pick_s = st.data_editor(table, key="notif_pick_s", use_container_width=True,
+                                        disabled=["REQUEST", "DRIVER", "UNIT", "DETAILS"])
             
-            # --- 2. TRANSACTION REQUESTS (As it is) ---
+            # --- 2. TRANSACTION REQUESTS ---
             if not pending_trans.empty:
                 st.markdown("#### 💰 TRANSACTION REQUESTS")
-                for idx, trans in pending_trans.iterrows():
-                    col1, col2, col3 = st.columns([3, 1, 1])
-                    
-                    with col1:
-                        st.write(f"**{trans['Type']}:** {trans['Driver']}")
-                        st.caption(f"Amount: {trans['Amount']} | {trans['Notes']}")
-                    
-                    with col2:
-                        if st.button("✅", key=f"approve_t_{idx}"):
-                            tdf.at[idx, 'Approval_Status'] = 'Approved'
-                            save_db('trans', tdf)
-                            st.rerun()
-                    
-                    with col3:
-                        if st.button("❌", key=f"reject_t_{idx}"):
-                            tdf = tdf.drop(idx) # Transaction reject matlab delete
-                            save_db('trans', tdf)
-                            st.rerun()
-                    st.divider()
+                table = pd.DataFrame({
+                    "✔": False,
+                    "TYPE": pending_trans['Type'].astype(str),
+                    "DRIVER": pending_trans['Driver'].astype(str),
+                    "AMOUNT": [f"{a:g}" for a in sar(pending_trans['Amount'].to_numpy())],
+                    "NOTES": pending_trans['Notes'].astype(str)
+                }, index=pending_trans['Trans_ID'].astype(str))
+                pick_t = st.data_editor(table, key="notif_pick_t", use_container_width=True,
+                                        disabled=["TYPE", "DRIVER", "AMOUNT", "NOTES"])
+            
+            chosen_s = pending_shifts[pending_shifts['Shift_ID'].astype(str).isin(pick_s.index[pick_s["✔"]])] if pick_s is not None else pending_shifts.iloc[0:0]
+            chosen_t = pending_trans[pending_trans['Trans_ID'].astype(str).isin(pick_t.index[pick_t["✔"]])] if pick_t is not None else pending_trans.iloc[0:0]
+            n = len(chosen_s) + len(chosen_t)
+            
+            c1, c2 = st.columns(2)
+            # ✅ / ❌ - Reject: start request delete, end request wapis ACTIVE, transaction delete
+            approve = c1.button(f"✅ APPROVE SELECTED ({n})", disabled=n == 0, use_container_width=True, key="notif_approve")
+            reject = c2.button(f"❌ REJECT SELECTED ({n})", disabled=n == 0, use_container_width=True, key="notif_reject")
+            if approve or reject:
+                with st.spinner("💾 APPLYING DECISIONS..."):
+                    done = notif_batch(chosen_s, chosen_t, approve)
+                if done["ok"]: flash("success", f"✅ {done['ok']} REQUEST(S) {'APPROVED' if approve else 'REJECTED'}")
+                for label, outcome in done["failed"]:
+                    flash("warning", f"⚠️ {label}: {OUTCOME_TEXT.get(outcome, outcome)}")
+                for k in ("notif_pick_s", "notif_pick_t"): st.session_state.pop(k, None)
+                st.rerun()
+
+# ==========================================
+# 📟 UI: DIAGNOSTICS (ADMIN ONLY)
+# ==========================================
+# Where the time goes, from the process-wide metrics registry (metrics.py):
+# p50/p95 per render_* / data call / Sheets method, API calls + bytes, retries,
+# cache hit ratios. Export: Prometheus text or JSON lines, as download or into
+# metrics_dir on disk (every metrics_export_seconds when that is > 0).
+@st.cache_resource
+def get_metrics_exporter():
+    folder = get_setting("metrics_dir", "fleet_metrics")
+    every = float(get_setting("metrics_export_seconds", 0))
+    if folder and every > 0: metrics.REGISTRY.start_exporter(folder, every)
+    return folder
+
+def hit_ratio(cache):
+    lookups = metrics.total("cache_lookups_total", cache=cache)
+    return None if not lookups else 1 - metrics.total("cache_misses_total", cache=cache) / lookups
+
+def label_text(labels):
+    return " ".join(f"{k}={v}" for k, v in labels.items())
+
+@metrics.timed("render_seconds")
+def render_diagnostics(ctx):
+    st.markdown("### 📟 SYSTEM DIAGNOSTICS")
+    counters, hists = metrics.rows()
+    up = time.time() - metrics.REGISTRY.started
+    
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("UPTIME", f"{int(up // 3600)}h {int(up % 3600 // 60)}m")
+    c2.metric("SHEETS CALLS", f"{metrics.total('sheets_calls_total'):,}",
+              f"{metrics.total('sheets_retries_total')} RETRIES", delta_color="inverse")
+    c3.metric("SHEETS DATA", f"{metrics.total('sheets_bytes_total') / 1e6:,.2f} MB")
+    ratio = hit_ratio("fetch_db")
+    c4.metric("DATA CACHE HITS", "--" if ratio is None else f"{ratio:.0%}")
+    st.caption(" | ".join(f"{c.upper()} CACHE: {'--' if r is None else f'{r:.0%}'}"
+                          for c, r in ((c, hit_ratio(c)) for c in ("index", "chart"))))
+    
+    if hists:
+        st.markdown("#### ⏱️ LATENCY")
+        lat = pd.DataFrame([{
+            "METRIC": h["name"], "SERIES": label_text(h["labels"]), "CALLS": h["count"],
+            "P50 ms": h["p50"] * 1000, "P95 ms": h["p95"] * 1000, "MAX ms": h["max"] * 1000,
+            "TOTAL s": h["sum"]
+        } for h in hists]).sort_values("TOTAL s", ascending=False)
+        st.dataframe(lat.round(1), hide_index=True, use_container_width=True)
+    if counters:
+        st.markdown("#### 🔢 COUNTERS")
+        cnt = pd.DataFrame([{"METRIC": c["name"], "SERIES": label_text(c["labels"]), "VALUE": c["value"]}
+                            for c in counters]).sort_values(["METRIC", "SERIES"])
+        st.dataframe(cnt, hide_index=True, use_container_width=True)
+    
+    if get_backend_name() == "sheets": st.json(get_governor().status(), expanded=False)
+    writer = get_writer()
+    if writer: st.json(writer.status(), expanded=False)
+    
+    c1, c2, c3, c4 = st.columns(4)
+    c1.download_button("📥 PROMETHEUS (.prom)", metrics.prometheus(), file_name="fleet_metrics.prom",
+                       mime="text/plain", use_container_width=True, key="diag_prom")
+    c2.download_button("📥 JSON LINES", metrics.jsonl(), file_name="fleet_metrics.jsonl",
+                       mime="application/json", use_container_width=True, key="diag_jsonl")
+    if c3.button("💾 WRITE TO DISK", use_container_width=True, key="diag_export"):
+        try:
+            folder = metrics.export(get_metrics_exporter() or "fleet_metrics")
+            flash("success", f"✅ METRICS WRITTEN TO {folder}/")
+        except OSError as e:
+            flash("error", f"❌ Export Failed: {str(e)}")
+        st.rerun()
+    if c4.button("🧹 RESET", use_container_width=True, key="diag_reset"):
+        metrics.REGISTRY.reset()
+        st.rerun()
 
 # ==========================================
 # 10. MAIN APPLICATION (FINAL ERROR-FREE VERSION)
 # ==========================================
+@metrics.timed("rerun_seconds")
 def main():
     user_data = check_session()
     
@@ -1460,6 +3247,10 @@ def main():
     
     name = user_data['name']
     role = user_data.get('role', 'driver')
+    st.session_state["user"] = name  # save_db tags queued writes with it
+    # Is rerun ka saara data - ek baar load, har screen ko yehi milta hai
+    ctx = DataContext(name, role)
+    get_metrics_exporter()
     
     # Header Section
     col1, col2, col3 = st.columns([1, 6, 1])
@@ -1482,76 +3273,89 @@ def main():
         # Role Badge
         role_display = "👑 CEO" if role == "ceo" else role.upper()
         st.markdown(f"<p style='color:#888; margin:0; font-size:14px; text-align:center;'>User: {name} | Role: {role_display} | System: ONLINE</p>", unsafe_allow_html=True)
+        
+        if get_backend_name() == "sheets":
+            quota = get_governor().status()
+            if quota['degraded']:
+                st.markdown(f"<p style='color:#ff0055; margin:0; font-size:12px; text-align:center;'>⚠️ DEGRADED MODE: GOOGLE QUOTA LOW (READS {max(quota['read'], 0):.0f}/{quota['read_capacity']:.0f}, COOLDOWN {quota['cooldown']:.0f}s) - SHOWING CACHED DATA</p>", unsafe_allow_html=True)
+        
+        writer = get_writer()
+        sync = writer.status() if writer else None
+        if sync and sync['pending']:
+            st.markdown(f"<p style='color:#ffaa00; margin:0; font-size:12px; text-align:center;'>⏳ SYNCING {sync['pending']} SAVED CHANGE(S) TO CLOUD</p>", unsafe_allow_html=True)
+        for c in (writer.take_conflicts(name) if writer else []):
+            # Queued edit lost its revision check while syncing -> tell whoever made it
+            flash("warning", f"⚠️ Your change to {c['id']} ({c['at']}) was not saved - the record was changed by someone else. Please review and try again.")
     
     with col3:
         if st.button("🚪 LOGOUT", use_container_width=True): logout()
     
     st.markdown("---")
+    show_flash()  # pichle action ka result
     
     # ==================================
     # 🚗 DRIVER VIEW
     # ==================================
     if role == "driver":
-        render_js_timer(name); render_driver_hud(name)
+        render_js_timer(ctx, name); render_driver_hud(ctx, name)
         
         col1, col2 = st.columns([2, 1])
-        with col1: render_fleet("driver"); 
-        with col2: render_leaderboard()
+        with col1: live_fleet(name, role, "driver")
+        with col2: render_leaderboard(ctx)
         
         tab1, tab2 = st.tabs(["⚙️ OPERATIONS", "📜 HISTORY"])
-        with tab1: render_ops(name, role, unique_key="driver_ops")
+        with tab1: render_ops(ctx, name, role, unique_key="driver_ops")
         # 👇 Unique Key: 'driver_hist'
-        with tab2: render_history_logs(name, role, unique_key="driver_hist")
+        with tab2: render_history_logs(ctx, name, role, unique_key="driver_hist")
     
     # ==================================
     # 👑 CEO VIEW (READ ONLY) - 3 TABS FIXED
     # ==================================
     elif role == "ceo":
-        render_manager_stats()
+        render_manager_stats(ctx)
         
         c1, c2 = st.columns([2, 1])
         with c1: 
             st.info("📡 LIVE FLEET MONITORING (READ-ONLY)")
-            render_fleet("admin") 
+            live_fleet(name, role, "admin")
         with c2: 
-            render_leaderboard()
+            render_leaderboard(ctx)
             
-        render_analytics(name, role)
+        render_analytics(ctx, name, role)
         
         # 👇 FIX: Changed to 3 Tabs (Removed Trans Logs tab)
         t1, t2, t3 = st.tabs(["🖨️ REPORTS", "💰 SALARY SHEET", "📜 HISTORY LOGS"])
         
-        with t1: render_reports_tab() 
-        with t2: render_salary()      
+        with t1: render_reports_tab(ctx) 
+        with t2: render_salary(ctx)      
         with t3: 
             # 👇 Ye function khud hi Shifts aur Transactions dono dikhata hai (Radio Button ke zariye)
-            render_history_logs(name, "admin", unique_key="ceo_view_main")
+            render_history_logs(ctx, name, "admin", unique_key="ceo_view_main")
 
     # ==================================
     # 🛠️ ADMIN VIEW (FULL CONTROL)
     # ==================================
     else:
-        render_fleet("admin"); render_manager_stats(); render_notifs()
+        live_fleet(name, role, "admin"); render_manager_stats(ctx); render_notifs(ctx)
         
         col1, col2 = st.columns(2)
-        with col1: render_analytics(name, role)
-        with col2: render_leaderboard()
+        with col1: render_analytics(ctx, name, role)
+        with col2: render_leaderboard(ctx)
         
-        t1, t2, t3, t4, t5 = st.tabs(["⚙️ OPS", "💰 PAYROLL", "📜 LOGS", "🔧 SERVICES", "🖨️ REPORTS"])
+        t1, t2, t3, t4, t5, t6 = st.tabs(["⚙️ OPS", "💰 PAYROLL", "📜 LOGS", "🔧 SERVICES", "🖨️ REPORTS", "📟 DIAGNOSTICS"])
         
-        with t1: render_ops(name, role, unique_key="admin_ops")
-        with t2: render_salary()
+        with t1: render_ops(ctx, name, role, unique_key="admin_ops")
+        with t2: render_salary(ctx)
         # 👇 Unique Key: 'admin_hist'
-        with t3: render_history_logs(name, role, unique_key="admin_hist")
-        with t4: render_services_tab("service_key_main")
-        with t5: render_reports_tab()
+        with t3: render_history_logs(ctx, name, role, unique_key="admin_hist")
+        with t4: render_services_tab(ctx, "service_key_main")
+        with t5: render_reports_tab(ctx)
+        with t6: render_diagnostics(ctx)
 # ==========================================
 # 🖨️ UI: REPORT GENERATOR (HH:MM TIME FORMAT)
 # ==========================================
-def render_reports_tab():
-    import matplotlib.pyplot as plt
-    import io
-
+@metrics.timed("render_seconds")
+def render_reports_tab(ctx):
     st.markdown("### 🖨️ GENERATE REPORT CARD")
     
     # 1. Inputs
@@ -1567,49 +3371,24 @@ def render_reports_tab():
     if "DAILY" in rtype or "DATE" in rtype:
         target_date = st.date_input("SELECT DATE", datetime.now())
 
-    # Helper function
-    def clean_duration_value(val):
-        try:
-            val_str = str(val).strip()
-            if ":" in val_str:
-                parts = val_str.split(":")
-                h = float(parts[0])
-                m = float(parts[1]) if len(parts) > 1 else 0
-                s = float(parts[2]) if len(parts) > 2 else 0
-                return h + (m/60) + (s/3600)
-            else:
-                return float(val)
-        except:
-            return 0.0
-
     if st.button("📄 GENERATE REPORT", use_container_width=True):
-        df = load_db('data')
-        tdf = load_db('trans')
+        # Sirf zaroori months load karo; FULL HISTORY hi saare purane partitions kholta hai
+        if "DAILY" in rtype or "DATE" in rtype: scope = target_date.strftime("%Y-%m")
+        elif "THIS MONTH" in rtype: scope = "month"
+        else: scope = "all"
+        # --- FILTERING (index lookups) ---
+        who = None if "ALL TEAM" in driver else driver
+        driver_label = "ALL TEAM (FLEET)" if who is None else driver.upper()
+        comp = ctx.rows('data', scope, Status='Completed', Approval_Status='Approved', Driver=who)
+        trans = ctx.rows('trans', scope, Approval_Status='Approved', Driver=who)
         
         # --- FIXES ---
-        if 'Shift_ID' in df.columns: df = df.drop_duplicates(subset=['Shift_ID'], keep='last')
-        if 'Trans_ID' in tdf.columns: tdf = tdf.drop_duplicates(subset=['Trans_ID'], keep='last')
-        if 'Duration' in df.columns: df['Duration'] = df['Duration'].apply(clean_duration_value)
-
-        cols_to_fix = ['Total_Earnings', 'Cash_Collected', 'End_Wallet', 'Start_Wallet']
-        for c in cols_to_fix:
-            if c in df.columns: df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0)
-        tdf['Amount'] = pd.to_numeric(tdf['Amount'], errors='coerce').fillna(0)
+        comp = comp.drop_duplicates(subset=['Shift_ID'], keep='last')
+        trans = trans.drop_duplicates(subset=['Trans_ID'], keep='last')
         
-        # --- FILTERING ---
-        if "ALL TEAM" in driver:
-            target_df = df; target_trans = tdf; driver_label = "ALL TEAM (FLEET)"
-        else:
-            target_df = df[df['Driver'] == driver]; target_trans = tdf[tdf['Driver'] == driver]; driver_label = driver.upper()
-
-        comp = target_df[(target_df['Status'] == 'Completed')]
-        trans = target_trans[(target_trans['Approval_Status'] == 'Approved')]
-        
-        # Date Prep
-        comp['Date'] = pd.to_datetime(comp['Start_Time']).dt.date
-        trans['Date_Only'] = pd.to_datetime(trans['Date']).dt.date
-        comp['Month'] = pd.to_datetime(comp['Start_Time']).dt.month
-        trans['Month'] = pd.to_datetime(trans['Date']).dt.month
+        # Date Prep (columns already typed by load_db)
+        comp = comp.assign(Date=comp['Start_Time'].dt.date, Month=comp['Start_Time'].dt.strftime('%Y-%m'))
+        trans = trans.assign(Date_Only=trans['Date'].dt.date, Month=trans['Date'].dt.strftime('%Y-%m'))
         
         report_data = {}; title = ""
         
@@ -1624,9 +3403,9 @@ def render_reports_tab():
                 "FINE": day_trans[day_trans['Type'] == 'Challan']['Amount'].sum()
             }
         elif "THIS MONTH" in rtype:
-            curr_month = datetime.now().month
+            curr_month = this_month()  # Riyadh month, same as the "month" data scope (year too)
             m_comp = comp[comp['Month'] == curr_month]; m_trans = trans[trans['Month'] == curr_month]
-            title = f"MONTHLY REPORT | {datetime.now().strftime('%B %Y')}"
+            title = f"MONTHLY REPORT | {month_name(curr_month)}"
             report_data = {
                 "SHIFTS": len(m_comp), "REVENUE": m_comp['Total_Earnings'].sum(),
                 "DURATION": m_comp['Duration'].sum(), "ADVANCE": m_trans[m_trans['Type'] == 'Advance']['Amount'].sum(),
@@ -1641,16 +3420,12 @@ def render_reports_tab():
             }
             
         # Calculations
-        rev = float(report_data['REVENUE']); fine = float(report_data['FINE'])
-        adv = float(report_data['ADVANCE']); dur = float(report_data['DURATION'])
+        rev = sar(report_data['REVENUE']); fine = sar(report_data['FINE'])
+        adv = sar(report_data['ADVANCE']); dur = float(report_data['DURATION'])
         net_gen = rev - fine
         
-        # 👇 NEW: Format Duration (Decimal -> HH:MM)
-        # Is hisab se: 2.8 Hours -> 2:48
-        total_mins = int(dur * 60)
-        hours = total_mins // 60
-        minutes = total_mins % 60
-        dur_str = f"{hours}:{minutes:02d}" # Output format: 2:48
+        # 👇 NEW: Format Duration (Decimal -> HH:MM), 2.8 Hours -> 2:48
+        dur_str = hhmm(dur)
         
         # --- 1. DISPLAY ON SCREEN (HTML) ---
         st.markdown(f"""
@@ -1669,62 +3444,101 @@ def render_reports_tab():
         </div>
         """, unsafe_allow_html=True)
 
-        # --- 2. GENERATE PNG IMAGE (UPDATED TIME FORMAT) ---
-        fig, ax = plt.subplots(figsize=(5, 6)) 
-        fig.patch.set_facecolor('black')
-        ax.set_facecolor('black')
-        ax.axis('off')
-
-        # Header
-        plt.text(0.5, 0.93, "NOMORE MANAGEMENT", ha='center', color='#00ff41', fontsize=14, weight='bold', fontname='monospace')
-        plt.text(0.5, 0.88, title, ha='center', color='white', fontsize=10, fontname='monospace')
-        plt.text(0.5, 0.84, f"TARGET: {driver_label}", ha='center', color='gray', fontsize=9, fontname='monospace')
-        
-        # Line 1
-        plt.plot([0.05, 0.95], [0.80, 0.80], color='white', lw=1, ls='--')
-
-        # Stats Block
-        plt.text(0.05, 0.74, "TOTAL SHIFTS:", color='white', fontsize=11, fontname='monospace')
-        plt.text(0.95, 0.74, f"{report_data['SHIFTS']}", color='white', ha='right', fontsize=11, fontname='monospace')
-
-        plt.text(0.05, 0.68, "TOTAL HOURS:", color='white', fontsize=11, fontname='monospace')
-        plt.text(0.95, 0.68, f"{dur_str} HRS", color='white', ha='right', fontsize=11, fontname='monospace')
-
-        # Line 2
-        plt.plot([0.05, 0.95], [0.62, 0.62], color='gray', lw=0.5)
-
-        # Financials Block
-        plt.text(0.05, 0.55, "GROSS REVENUE:", color='#00ff41', fontsize=11, fontname='monospace')
-        plt.text(0.95, 0.55, f"{rev:,.0f}", color='#00ff41', ha='right', fontsize=11, fontname='monospace')
-
-        plt.text(0.05, 0.49, "TOTAL FINES:", color='#ff0055', fontsize=11, fontname='monospace')
-        plt.text(0.95, 0.49, f"-{fine:,.0f}", color='#ff0055', ha='right', fontsize=11, fontname='monospace')
-
-        plt.text(0.05, 0.43, "TOTAL ADVANCE:", color='#ffaa00', fontsize=11, fontname='monospace')
-        plt.text(0.95, 0.43, f"{adv:,.0f}", color='#ffaa00', ha='right', fontsize=11, fontname='monospace')
-
-        # Final Line
-        plt.plot([0.05, 0.95], [0.36, 0.36], color='white', lw=2)
-
-        # Net Total Block
-        plt.text(0.5, 0.28, "NET REVENUE", ha='center', color='white', fontsize=10, fontname='monospace')
-        plt.text(0.5, 0.18, f"{net_gen:,.0f} SAR", ha='center', color='white', fontsize=22, weight='bold', fontname='monospace')
-        
-        plt.text(0.5, 0.05, "GENERATED BY SYSTEM MANAGEMENT", ha='center', color='gray', fontsize=7, fontname='monospace')
-
-        buf = io.BytesIO()
-        plt.savefig(buf, format="png", bbox_inches='tight', facecolor='black', pad_inches=0.2)
-        buf.seek(0)
+        # --- 2. PNG RECEIPT (Pillow template, cached by content) ---
+        png = receipts.receipt_png(title, driver_label, {
+            "shifts": int(report_data['SHIFTS']), "hours": dur_str, "revenue": float(rev),
+            "fines": float(fine), "advance": float(adv), "net": float(net_gen)
+        })
         
         fname = f"Receipt_{driver_label.replace(' ','_')}_{datetime.now().strftime('%Y%m%d')}.png"
         st.download_button(
             label="💾 DOWNLOAD PNG RECEIPT",
-            data=buf,
+            data=png,
             file_name=fname,
             mime="image/png",
             use_container_width=True
         )
 
+    st.markdown("---")
+    render_payroll_pack(ctx)
+
+# ==========================================
+# 📦 PAYROLL PACK (ALL DRIVERS, ONE CLICK)
+# ==========================================
+# Month-end export: every driver's THIS MONTH report card from one grouped pass,
+# receipts rendered on a process pool (cache hits skipped), zipped together with
+# per-driver CSVs and a payroll summary sheet.
+@st.cache_resource
+def get_render_pool():
+    workers = int(get_setting("export_workers", min(4, os.cpu_count() or 1)))
+    if workers < 2: return None
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    # spawn: the server process has threads, forking it is not safe
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def monthly_reports(ctx):
+    # Same numbers as the THIS MONTH report card, for all drivers at once
+    month = this_month()
+    comp = ctx.completed("month").drop_duplicates(subset=['Shift_ID'], keep='last')
+    trans = ctx.approved_trans("month").drop_duplicates(subset=['Trans_ID'], keep='last')
+    comp = comp[comp['Start_Time'].dt.strftime('%Y-%m') == month]
+    trans = trans[trans['Date'].dt.strftime('%Y-%m') == month]
+    shifts = comp.groupby('Driver', observed=True).agg(
+        shifts=('Shift_ID', 'size'), revenue=('Total_Earnings', 'sum'), hours=('Duration', 'sum'))
+    money = trans.groupby(['Driver', 'Type'], observed=True)['Amount'].sum().unstack(fill_value=0)
+    out = pd.DataFrame({
+        "shifts": shifts['shifts'].reindex(DRIVERS, fill_value=0),
+        "revenue": sar(shifts['revenue'].reindex(DRIVERS, fill_value=0)),
+        "hours": shifts['hours'].reindex(DRIVERS, fill_value=0.0).astype(float),
+        "advance": sar(money.get('Advance', pd.Series(dtype="int64")).reindex(DRIVERS, fill_value=0)),
+        "fines": sar(money.get('Challan', pd.Series(dtype="int64")).reindex(DRIVERS, fill_value=0)),
+    })
+    out["net"] = out["revenue"] - out["fines"]
+    return out, comp, trans, f"MONTHLY REPORT | {month_name(month)}"
+
+def payroll_pack(ctx):
+    import io
+    import zipfile
+    reports, comp, trans, title = monthly_reports(ctx)
+    jobs = [(title, d.upper(), {"shifts": int(r.shifts), "hours": hhmm(r.hours), "revenue": float(r.revenue),
+                                "fines": float(r.fines), "advance": float(r.advance), "net": float(r.net)})
+            for d, r in zip(reports.index, reports.itertuples())]
+    pngs = receipts.receipt_pngs(jobs, get_render_pool())
+    
+    pay = payroll(ctx.totals("month", DRIVERS))
+    summary = pay.assign(hours=reports['hours'].round(2), ratio=(pay['ratio'] * 100).round(1)).rename(columns={
+        "shifts": "Shifts", "days": "Days", "revenue": "Revenue", "ratio": "Perf_%", "salary": "Salary",
+        "advances": "Advance", "fines": "Fines", "payable": "Net_Payable", "avg_shift": "Avg_Shift", "hours": "Hours"})
+    
+    shift_cols = ['Shift_ID', 'Car', 'Start_Time', 'End_Time', 'Duration', 'Total_Earnings', 'Cash_Collected']
+    trans_cols = ['Trans_ID', 'Date', 'Type', 'Amount', 'Method', 'Notes']
+    by_shift = dict(list(comp[shift_cols + ['Driver']].groupby('Driver', observed=True)))
+    by_trans = dict(list(trans[trans_cols + ['Driver']].groupby('Driver', observed=True)))
+    
+    stamp = this_month()
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr(f"payroll_{stamp}/summary.csv", summary.round(2).to_csv(index_label="Driver"))
+        for d, png in zip(reports.index, pngs):
+            folder = f"payroll_{stamp}/{d.replace(' ', '_')}"
+            z.writestr(f"{folder}/receipt.png", png, compress_type=zipfile.ZIP_STORED)
+            s = by_shift.get(d, pd.DataFrame(columns=shift_cols + ['Driver']))[shift_cols]
+            t = by_trans.get(d, pd.DataFrame(columns=trans_cols + ['Driver']))[trans_cols]
+            z.writestr(f"{folder}/shifts.csv", s.assign(Total_Earnings=sar(s['Total_Earnings']), Cash_Collected=sar(s['Cash_Collected'])).to_csv(index=False))
+            z.writestr(f"{folder}/transactions.csv", t.assign(Amount=sar(t['Amount'])).to_csv(index=False))
+    return buf.getvalue(), f"Payroll_Pack_{stamp}.zip"
+
+@metrics.timed("render_seconds")
+def render_payroll_pack(ctx):
+    st.markdown("### 📦 MONTH-END PAYROLL PACK")
+    st.caption("All drivers: report card PNGs, shift & transaction CSVs and a payroll summary in one zip.")
+    if st.button("📦 EXPORT PAYROLL PACK (THIS MONTH)", use_container_width=True, key="pack_export"):
+        with st.spinner("📦 BUILDING PAYROLL PACK..."):
+            data, fname = payroll_pack(ctx)
+        st.download_button(label="💾 DOWNLOAD PAYROLL PACK (ZIP)", data=data, file_name=fname,
+                           mime="application/zip", use_container_width=True)
+
 # ==========================================
 # APPLICATION ENTRY POINT
 # ==========================================
@@ -0,0 +1,285 @@
+# ==========================================
+# SYNTHETIC DATA + BENCHMARKS
+# ==========================================
+# Generates realistic shift / transaction histories and times the data path and
+# every heavy render function against them (wall time + peak Python memory).
+# Streamlit runs in "bare mode" here, so widgets return their defaults and
+# nothing is drawn; the data work is the same as in the real app.
+#
+#   python bench.py                          # 1k, 100k, 1M shift rows on SQLite
+#   python bench.py --sizes 1k,100k --backend emulator
+#   python bench.py --sizes 10k --drivers 20 --months 24 --pending 0.05
+#
+# Results go to bench_results/<timestamp>.json; each run is compared with the
+# previous file in that folder so regressions show up as a % change.
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import platform
+import statistics
+import subprocess
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+TRANS_PER_SHIFT = 0.4
+
+# ==========================================
+# 1. GENERATOR
+# ==========================================
+def fleet_names(app, drivers, cars):
+    names = list(app.DRIVERS)[:drivers] + [f"Driver{i:02d}" for i in range(len(app.DRIVERS), drivers)]
+    units = list(app.CARS)[:cars] + [f"Car Unit{i:02d} (Grey)" for i in range(len(app.CARS), cars)]
+    return names, units
+
+def generate(app, rows, drivers=6, cars=3, months=12, pending=0.03, seed=7, end=None):
+    # -> (shifts, transactions) as raw text frames, exactly what storage hands back
+    rng = np.random.default_rng(seed)
+    names, units = fleet_names(app, drivers, cars)
+    end = end or (datetime.utcnow() + timedelta(hours=3))
+    start = end - timedelta(days=30 * months)
+    span = int((end - start).total_seconds())
+
+    # --- shifts ---
+    t0 = np.sort(rng.integers(0, span, rows))
+    st_ = pd.to_datetime(start) + pd.to_timedelta(t0, unit="s")
+    hours = np.clip(rng.normal(9, 1.5, rows), 2, 14).round(2)
+    en = st_ + pd.to_timedelta(hours * 3600, unit="s")
+    u = rng.random(rows)
+    status = np.where(u < pending, "Pending_End", "Completed").astype(object)
+    status[-min(drivers, rows):] = "Active"  # latest shift of the day still running
+    appr = np.where(status == "Completed", "Approved", np.where(status == "Active", "Approved", "Pending"))
+    earn = np.clip(rng.normal(380, 90, rows), 0, None).round()
+    wallet = rng.integers(0, 200, rows)
+    active = status == "Active"
+    fmt = lambda s: s.strftime("%Y-%m-%d %H:%M:%S")
+    shifts = pd.DataFrame({
+        "Shift_ID": [f"S{i:08d}" for i in range(rows)],
+        "Driver": rng.choice(names, rows),
+        "Car": rng.choice(units, rows),
+        "Start_Time": fmt(st_),
+        "End_Time": np.where(active, "", fmt(en)),
+        "Duration": np.where(active, 0, hours),
+        "Total_Earnings": np.where(active, 0, earn),
+        "Status": status,
+        "Approval_Status": appr,
+        "Start_Wallet": wallet,
+        "End_Wallet": np.where(active, 0, wallet + earn),
+        "Cash_Collected": np.where(active, 0, (earn * rng.uniform(0.3, 0.8, rows)).round()),
+        "Start_Fuel": rng.integers(60, 101, rows),
+        "End_Fuel": np.where(active, 0, rng.integers(5, 60, rows)),
+        "Rev": 1
+    })
+    live = shifts.index[active]
+    shifts.loc[live, "Driver"] = [names[i % len(names)] for i in range(len(live))]  # one live shift per driver
+
+    # --- transactions ---
+    n = max(1, int(rows * TRANS_PER_SHIFT))
+    t1 = np.sort(rng.integers(0, span, n))
+    types = rng.choice(["Received", "Advance", "Challan", "Expense", "CEO_Transfer"], n,
+                       p=[0.55, 0.15, 0.08, 0.12, 0.10])
+    amount = np.where(types == "Received", rng.integers(100, 900, n),
+             np.where(types == "Challan", rng.choice([150, 300, 500], n), rng.integers(20, 400, n)))
+    trans = pd.DataFrame({
+        "Trans_ID": [f"T{i:08d}" for i in range(n)],
+        "Date": (pd.to_datetime(start) + pd.to_timedelta(t1, unit="s")).strftime("%Y-%m-%d %H:%M"),
+        "Driver": rng.choice(names, n),
+        "Type": types,
+        "Amount": amount,
+        "Method": rng.choice(["Cash", "Bank", "STC Pay"], n, p=[0.7, 0.2, 0.1]),
+        "Notes": "auto",
+        "Approval_Status": np.where(rng.random(n) < pending, "Pending", "Approved"),
+        "Source": np.where(types == "CEO_Transfer", "Manager", "Driver"),
+        "Rev": 1
+    })
+    return shifts, trans
+
+# ==========================================
+# 2. SEEDING THE STORAGE BACKEND
+# ==========================================
+def seed_sqlite(app, backend, shifts, trans):
+    with backend.lock:
+        for key, df in (("data", shifts), ("trans", trans)):
+            df.to_sql(backend.TABLES[key], backend.conn, if_exists="append", index=False, chunksize=50_000)
+
+def seed_emulator(app, client, sheet_name, shifts, trans):
+    # One worksheet per month, like the Sheets backend writes them
+    for key, df in (("data", shifts), ("trans", trans)):
+        month = df[app.PART_COLS[key]].str[:7]
+        for m, part in df.groupby(month):
+            values = [list(df.columns)] + part.astype(str).values.tolist()
+            client.seed(sheet_name, app.part_title(key, m), values)
+
+def setup(backend_name, tmp):
+    os.environ["FLEET_BACKEND"] = "sqlite" if backend_name == "sqlite" else "sheets"
+    os.environ["FLEET_SHEETS_EMULATOR"] = "1" if backend_name == "emulator" else "0"
+    os.environ["FLEET_SQLITE_PATH"] = os.path.join(tmp, "bench.db")
+    os.environ["FLEET_WRITE_BEHIND"] = "0"
+    os.environ["FLEET_SNAPSHOT_DIR"] = ""
+    os.environ["FLEET_READ_QUOTA_PER_MIN"] = "1000000"
+    os.environ["FLEET_WRITE_QUOTA_PER_MIN"] = "1000000"
+    import app
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):  # bare-mode / deprecation chatter
+            logging.getLogger(name).setLevel(logging.ERROR)
+    return app
+
+def reset_backend(app):
+    # New dataset: drop every cached resource (backend, client, versions, frames,
+    # rollups, indexes, chart memo, ...) and cached data, nothing carries over
+    app.get_frames().clear()
+    app.st.cache_resource.clear()
+    app.st.cache_data.clear()
+
+def cold(app):
+    # Forget every cache so the next load_db pays the full read
+    app.get_frames().clear()
+    backend = app.get_backend()
+    if hasattr(backend, "state"):
+        with backend.state_lock: backend.state.clear()
+
+# ==========================================
+# 3. CASES
+# ==========================================
+@contextmanager
+def pressed(st, choose=None):
+    # Buttons / toggles "clicked" and chosen selectbox options, so report and
+    # archive paths actually run. choose = {widget_key: text in the option}
+    button, toggle, selectbox = st.button, st.toggle, st.selectbox
+    def pick(label, options, *a, key=None, **k):
+        if choose and key in choose:
+            return next(o for o in options if choose[key] in o)
+        return selectbox(label, options, *a, key=key, **k)
+    st.button = lambda *a, **k: True
+    st.toggle = lambda *a, **k: True
+    st.selectbox = pick
+    try: yield
+    finally: st.button, st.toggle, st.selectbox = button, toggle, selectbox
+
+def cases(app):
+    st = app.st
+    ctx = lambda: app.DataContext("admin", "admin")  # a fresh rerun per call
+    def load(scope):
+        def run():
+            cold(app)
+            app.load_db("data", scope); app.load_db("trans", scope)
+        return run
+    def history():
+        with pressed(st):
+            app.render_history_logs(ctx(), "admin", "admin", "bench")
+    def reports():
+        with pressed(st, {"rep_type": "FULL HISTORY"}):
+            app.render_reports_tab(ctx())
+    def rollups():
+        store = app.get_rollups()
+        store.fresh.clear()
+        store.view("all")
+    return [
+        ("load_db[hot]", load("hot"), False),
+        ("load_db[all]", load("all"), False),
+        ("rollups_rebuild[all]", rollups, True),
+        ("render_salary", lambda: app.render_salary(ctx()), True),
+        ("render_leaderboard", lambda: app.render_leaderboard(ctx()), True),
+        ("render_analytics", lambda: app.render_analytics(ctx(), "admin", "admin"), True),
+        ("render_history_logs[all]", history, True),
+        ("render_reports_tab[all]", reports, True),
+        ("render_notifs", lambda: app.render_notifs(ctx()), True),
+        ("render_manager_stats", lambda: app.render_manager_stats(ctx()), True),
+    ]
+
+def measure(fn, repeat):
+    times = []
+    tracemalloc.start()
+    for i in range(repeat):
+        if i == 1: tracemalloc.stop()  # peak from the first run only, later runs timed clean
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+        if i == 0:
+            _, peak = tracemalloc.get_traced_memory()
+    if tracemalloc.is_tracing(): tracemalloc.stop()
+    return {"wall_s": round(min(times), 4), "wall_median_s": round(statistics.median(times), 4),
+            "peak_mb": round(peak / 2**20, 2), "runs": repeat}
+
+def warm(app):
+    for scope in ("hot", "month", "all"):
+        app.load_db("data", scope); app.load_db("trans", scope)
+
+# ==========================================
+# 4. RUN + SAVE + COMPARE
+# ==========================================
+def git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+def previous(folder):
+    if not os.path.isdir(folder): return None
+    files = sorted(f for f in os.listdir(folder) if f.endswith(".json"))
+    return json.load(open(os.path.join(folder, files[-1]))) if files else None
+
+def main():
+    p = argparse.ArgumentParser(description="Fleet manager benchmarks")
+    p.add_argument("--sizes", default="1k,100k,1m", help="shift rows per run: " + ",".join(SIZES))
+    p.add_argument("--backend", default="sqlite", choices=["sqlite", "emulator"])
+    p.add_argument("--drivers", type=int, default=6)
+    p.add_argument("--cars", type=int, default=3)
+    p.add_argument("--months", type=int, default=12)
+    p.add_argument("--pending", type=float, default=0.03, help="share of pending shifts / transactions")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--only", default="", help="comma separated case names to run")
+    p.add_argument("--out", default="bench_results")
+    args = p.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="fleet_bench_")
+    app = setup(args.backend, tmp)
+    only = [s for s in args.only.split(",") if s]
+    prev = previous(args.out)
+    old = {(r["size"], r["case"]): r for r in (prev or {}).get("results", [])}
+    results = []
+
+    for size in args.sizes.split(","):
+        rows = SIZES[size.lower()]
+        shifts, trans = generate(app, rows, args.drivers, args.cars, args.months, args.pending)
+        if os.path.exists(os.environ["FLEET_SQLITE_PATH"]): os.remove(os.environ["FLEET_SQLITE_PATH"])
+        reset_backend(app)
+        if args.backend == "sqlite":
+            seed_sqlite(app, app.get_backend(), shifts, trans)
+        else:
+            seed_emulator(app, app.get_google_sheet_client(), app.get_setting("sheet_name", "FLEET_DB_V15"),
+                          shifts, trans)
+        del shifts, trans
+        print(f"\n== {size} shift rows ({args.backend}) ==")
+
+        for name, fn, needs_warm in cases(app):
+            if only and name not in only: continue
+            if needs_warm: warm(app)
+            r = measure(fn, args.repeat)
+            r.update(size=size, case=name)
+            results.append(r)
+            before = old.get((size, name))
+            delta = f"{(r['wall_s'] / before['wall_s'] - 1) * 100:+.0f}%" if before and before["wall_s"] else ""
+            print(f"  {name:<28} {r['wall_s']*1000:>10.1f} ms   peak {r['peak_mb']:>8.1f} MB   {delta}")
+
+    os.makedirs(args.out, exist_ok=True)
+    out = os.path.join(args.out, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    json.dump({
+        "at": datetime.now().isoformat(timespec="seconds"), "git": git_rev(),
+        "python": platform.python_version(), "pandas": pd.__version__,
+        "backend": args.backend, "params": vars(args), "results": results
+    }, open(out, "w"), indent=1)
+    print(f"\nsaved {out}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+# ==========================================
+# FAKE GSPREAD (OFFLINE SHEETS EMULATOR)
+# ==========================================
+# In-process stand-in for the gspread client/spreadsheet/worksheet calls the app
+# makes. Lets load_db/save_db run without FLEET_DB_V15 or a service account, with
+# injectable latency and 429 quota faults, and counts every API call so a user
+# action's cost can be measured / asserted:
+#
+#   api = FakeAPI(latency=0.2, fail_rate=0.05, read_per_min=60)
+#   client = FakeClient(api)
+#   ... run the app / backend ...
+#   api.stats()  ->  {"reads": 12, "writes": 3, "calls": {"batch_get": 4, ...}, ...}
+#
+# Values behave like the real API with RAW input: everything comes back as text,
+# trailing empty cells/rows are trimmed from value ranges, writes outside the
+# grid fail until the sheet is grown (add_cols / add_rows / resize).
+
+import re
+import time
+import random
+import threading
+from collections import Counter, deque
+
+import gspread
+from gspread.utils import a1_to_rowcol
+
+class _Response:
+    # Just enough of requests.Response for gspread.exceptions.APIError
+    def __init__(self, code, message, status):
+        self.status_code = code
+        self.text = message
+        self._error = {"code": code, "message": message, "status": status}
+
+    def json(self):
+        return {"error": self._error}
+
+def quota_error(kind="read"):
+    what = "Read requests" if kind == "read" else "Write requests"
+    return gspread.exceptions.APIError(_Response(
+        429, f"Quota exceeded for quota metric '{what}' and limit '{what} per minute per user'",
+        "RESOURCE_EXHAUSTED"))
+
+def grid_error(message):
+    return gspread.exceptions.APIError(_Response(400, message, "INVALID_ARGUMENT"))
+
+class FakeAPI:
+    # Shared "Google" side: latency, faults, per-minute quota and call counters
+    def __init__(self, latency=0.0, jitter=0.0, fail_rate=0.0, read_per_min=None,
+                 write_per_min=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.limits = {"read": read_per_min, "write": write_per_min}
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.forced = 0
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = Counter()
+            self.counts = Counter()
+            self.cells = Counter()
+            self.faults = 0
+            self.window = {"read": deque(), "write": deque()}
+
+    def fail_next(self, n=1):
+        # Next n calls answer 429, whatever the quota says
+        with self.lock:
+            self.forced += n
+
+    def hit(self, kind, method):
+        with self.lock:
+            now = time.monotonic()
+            window = self.window[kind]
+            while window and now - window[0] > 60: window.popleft()
+            limit = self.limits[kind]
+            fail = self.forced > 0 or (limit is not None and len(window) >= limit) \
+                or (self.fail_rate and self.rng.random() < self.fail_rate)
+            if self.forced > 0: self.forced -= 1
+            self.calls[method] += 1
+            self.counts[kind] += 1
+            window.append(now)
+            if fail: self.faults += 1
+            delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay: time.sleep(delay)
+        if fail: raise quota_error(kind)
+
+    def moved(self, kind, n):
+        with self.lock:
+            self.cells[kind] += n
+
+    def stats(self):
+        with self.lock:
+            return {"reads": self.counts["read"], "writes": self.counts["write"],
+                    "faults": self.faults, "cells_read": self.cells["read"],
+                    "cells_written": self.cells["write"], "calls": dict(self.calls)}
+
+def _cell(v):
+    if v is None: return ""
+    if isinstance(v, bool): return "TRUE" if v else "FALSE"
+    if isinstance(v, float) and v.is_integer(): return str(int(v))
+    return str(v)
+
+def _trim(rows):
+    rows = [list(r) for r in rows]
+    for r in rows:
+        while r and r[-1] == "": r.pop()
+    while rows and not rows[-1]: rows.pop()
+    return rows
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, sheet_id, rows=1000, cols=26):
+        self.spreadsheet = spreadsheet
+        self.api = spreadsheet.api
+        self.title = title
+        self.id = sheet_id
+        self.row_count = rows
+        self.col_count = cols
+        self.cells = []  # list of rows (lists of str), only as long as written
+
+    def __repr__(self):
+        return f"<FakeWorksheet {self.title!r} id:{self.id}>"
+
+    # --- helpers ---
+    def _range(self, a1):
+        # "A5", "A5:K", "A5:K9", "A:C" -> 1-based inclusive (r1, c1, r2, c2)
+        m = re.fullmatch(r"([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?", a1.split("!")[-1].upper())
+        if not m: raise grid_error(f"Unable to parse range: {a1}")
+        c1, r1, c2, r2 = m.groups()
+        col = lambda s, d: a1_to_rowcol(f"{s}1")[1] if s else d
+        r1 = int(r1) if r1 else 1
+        c1 = col(c1, 1)
+        if m.group(3) is None and m.group(4) is None:
+            return r1, c1, r1, c1
+        return r1, c1, int(r2) if r2 else self.row_count, col(c2, self.col_count)
+
+    def _values(self, r1, c1, r2, c2):
+        out = [[(row[c - 1] if c - 1 < len(row) else "") for c in range(c1, c2 + 1)]
+               for row in self.cells[r1 - 1:r2]]
+        out = _trim(out)
+        self.api.moved("read", sum(len(r) for r in out))
+        return out
+
+    def _put(self, r, c, values):
+        if r + len(values) - 1 > self.row_count or c + max(map(len, values), default=0) - 1 > self.col_count:
+            raise grid_error(f"Range exceeds grid limits. Max rows: {self.row_count}, max columns: {self.col_count}")
+        for i, vals in enumerate(values):
+            while len(self.cells) < r + i: self.cells.append([])
+            row = self.cells[r + i - 1]
+            while len(row) < c - 1 + len(vals): row.append("")
+            for j, v in enumerate(vals): row[c - 1 + j] = _cell(v)
+        self.api.moved("write", sum(len(v) for v in values))
+
+    # --- reads ---
+    def get_values(self, range_name=None, **kwargs):
+        self.api.hit("read", "get_values")
+        rows = self._values(*self._range(range_name)) if range_name else self._values(1, 1, self.row_count, self.col_count)
+        width = max(map(len, rows), default=0)
+        return [r + [""] * (width - len(r)) for r in rows]  # gspread fills gaps
+
+    get_all_values = get_values
+
+    def get_all_records(self, head=1, **kwargs):
+        values = self.get_values()
+        if len(values) < head: return []
+        keys = values[head - 1]
+        return [dict(zip(keys, row)) for row in values[head:]]
+
+    def row_values(self, row, **kwargs):
+        self.api.hit("read", "row_values")
+        got = self._values(row, 1, row, self.col_count)
+        return got[0] if got else []
+
+    def col_values(self, col, **kwargs):
+        self.api.hit("read", "col_values")
+        return [r[0] if r else "" for r in self._values(1, col, self.row_count, col)]
+
+    def batch_get(self, ranges, **kwargs):
+        self.api.hit("read", "batch_get")
+        return [self._values(*self._range(a1)) for a1 in ranges]
+
+    # --- writes ---
+    def update(self, values=None, range_name=None, **kwargs):
+        self.api.hit("write", "update")
+        r, c, _, _ = self._range(range_name or "A1")
+        self._put(r, c, values)
+        return {"updatedRange": f"{self.title}!{range_name}"}
+
+    def batch_update(self, data, **kwargs):
+        self.api.hit("write", "batch_update")
+        for item in data:
+            r, c, _, _ = self._range(item["range"])
+            self._put(r, c, item["values"])
+        return {"totalUpdatedCells": sum(len(v) for d in data for v in d["values"])}
+
+    def append_rows(self, values, value_input_option="RAW", **kwargs):
+        self.api.hit("write", "append_rows")
+        start = len(_trim(self.cells)) + 1
+        if start + len(values) - 1 > self.row_count:
+            self.row_count = start + len(values) - 1  # append grows the grid
+        if values: self._put(start, 1, values)
+        return {"updates": {"updatedRows": len(values)}}
+
+    def append_row(self, values, **kwargs):
+        return self.append_rows([values], **kwargs)
+
+    def add_rows(self, rows):
+        self.api.hit("write", "add_rows")
+        self.row_count += rows
+
+    def add_cols(self, cols):
+        self.api.hit("write", "add_cols")
+        self.col_count += cols
+
+    def resize(self, rows=None, cols=None):
+        self.api.hit("write", "resize")
+        if rows is not None:
+            self.row_count = rows
+            del self.cells[rows:]
+        if cols is not None:
+            self.col_count = cols
+            self.cells = [r[:cols] for r in self.cells]
+
+    def clear(self):
+        self.api.hit("write", "clear")
+        self.cells = []
+
+class FakeSpreadsheet:
+    def __init__(self, api, title):
+        self.api = api
+        self.title = title
+        self.sheets = []
+        self._next_id = 0
+
+    def _new(self, title, rows, cols):
+        self._next_id += 1
+        ws = FakeWorksheet(self, title, self._next_id, rows, cols)
+        self.sheets.append(ws)
+        return ws
+
+    def worksheets(self, **kwargs):
+        self.api.hit("read", "worksheets")
+        return list(self.sheets)
+
+    def worksheet(self, title):
+        self.api.hit("read", "worksheet")
+        for ws in self.sheets:
+            if ws.title == title: return ws
+        raise gspread.exceptions.WorksheetNotFound(title)
+
+    def add_worksheet(self, title, rows, cols, **kwargs):
+        self.api.hit("write", "add_worksheet")
+        if any(ws.title == title for ws in self.sheets):
+            raise grid_error(f'A sheet with the name "{title}" already exists.')
+        return self._new(title, int(rows), int(cols))
+
+    def del_worksheet(self, worksheet):
+        self.api.hit("write", "del_worksheet")
+        self.sheets = [ws for ws in self.sheets if ws.id != worksheet.id]
+
+    def batch_update(self, body):
+        # Only the structural request the app sends: deleteDimension (rows)
+        self.api.hit("write", "spreadsheet_batch_update")
+        for req in body.get("requests", []):
+            rng = req["deleteDimension"]["range"]
+            ws = next(ws for ws in self.sheets if ws.id == rng["sheetId"])
+            if rng.get("dimension", "ROWS") != "ROWS": raise grid_error("Only row deletes are emulated")
+            del ws.cells[rng["startIndex"]:rng["endIndex"]]
+            ws.row_count -= rng["endIndex"] - rng["startIndex"]
+        return {"replies": [{} for _ in body.get("requests", [])]}
+
+class FakeClient:
+    # open() creates a spreadsheet on first use (create=True), like a fresh copy of FLEET_DB_V15
+    def __init__(self, api=None, create=True):
+        self.api = api or FakeAPI()
+        self.create = create
+        self.files = {}
+
+    def open(self, title, **kwargs):
+        self.api.hit("read", "open")
+        if title not in self.files:
+            if not self.create: raise gspread.exceptions.SpreadsheetNotFound(title)
+            self.files[title] = FakeSpreadsheet(self.api, title)
+        return self.files[title]
+
+    def seed(self, title, worksheet, values):
+        # Test data straight in, without counting API calls
+        sh = self.files.setdefault(title, FakeSpreadsheet(self.api, title))
+        ws = next((w for w in sh.sheets if w.title == worksheet), None) or \
+            sh._new(worksheet, max(1000, len(values) + 1), max(26, max(map(len, values), default=0)))
+        ws.cells = [[_cell(v) for v in row] for row in values]
+        ws.row_count = max(ws.row_count, len(values))
+        return ws
@@ -0,0 +1,183 @@
+# ==========================================
+# METRICS (TIMINGS + COUNTERS)
+# ==========================================
+# Process-wide, in-memory registry behind the admin DIAGNOSTICS tab. Labelled
+# counters (Sheets calls, bytes, retries, cache lookups/misses) and latency
+# histograms (render_*, load_db/save_db, backend calls) that cost a perf_counter
+# and a dict update per observation. Exportable as Prometheus text or JSON lines:
+#
+#   metrics.inc("sheets_calls_total", kind="read", method="get_values")
+#   with metrics.timer("data_seconds", op="fetch_db", key="data"): ...
+#   @metrics.timed("render_seconds")          # label fn=<function name>
+#   metrics.prometheus() / metrics.jsonl() / metrics.export("fleet_metrics")
+#
+# Histograms keep Prometheus buckets (cumulative on export) plus the last
+# SAMPLES observations for exact p50 / p95 in the UI.
+
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from itertools import chain
+
+PREFIX = "fleet_"
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+SAMPLES = 512
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)  # last = +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=SAMPLES)
+
+    def add(self, value):
+        i = 0
+        while i < len(BUCKETS) and value > BUCKETS[i]: i += 1
+        self.buckets[i] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.recent.append(value)
+
+    def quantile(self, q):
+        s = sorted(self.recent)
+        return s[min(len(s) - 1, int(q * len(s)))] if s else 0.0
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}  # (name, labels) -> number
+            self.hists = {}     # (name, labels) -> Histogram
+            self.started = time.time()
+
+    def inc(self, name, n=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            hist = self.hists.get(key)
+            if hist is None: hist = self.hists[key] = Histogram()
+            hist.add(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        # Decorator; without labels the series is named after the function
+        def wrap(fn):
+            tags = labels or {"fn": fn.__qualname__}
+            @wraps(fn)
+            def inner(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start, **tags)
+            return inner
+        return wrap
+
+    def rows(self):
+        # -> (counters, histograms) as plain dicts for tables / JSON
+        with self.lock:
+            counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in self.counters.items()]
+            hists = [{"name": n, "labels": dict(l), "count": h.count, "sum": h.sum, "max": h.max,
+                      "p50": h.quantile(0.5), "p95": h.quantile(0.95)} for (n, l), h in self.hists.items()]
+        return counters, hists
+
+    def total(self, name, **match):
+        # Sum of a counter over every series whose labels include `match`
+        with self.lock:
+            return sum(v for (n, l), v in self.counters.items()
+                       if n == name and all(dict(l).get(k) == w for k, w in match.items()))
+
+    def prometheus(self):
+        def fmt(labels, **extra):
+            items = list(labels) + list(extra.items())
+            if not items: return ""
+            return "{" + ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in items) + "}"
+        out = []
+        with self.lock:
+            for name in sorted({n for n, _ in self.counters}):
+                out.append(f"# TYPE {PREFIX}{name} counter")
+                for (n, labels), v in sorted(self.counters.items()):
+                    if n == name: out.append(f"{PREFIX}{name}{fmt(labels)} {v}")
+            for name in sorted({n for n, _ in self.hists}):
+                out.append(f"# TYPE {PREFIX}{name} histogram")
+                for (n, labels), h in sorted(self.hists.items(), key=lambda kv: kv[0]):
+                    if n != name: continue
+                    running = 0
+                    for le, c in zip(list(BUCKETS) + ["+Inf"], h.buckets):
+                        running += c
+                        out.append(f"{PREFIX}{name}_bucket{fmt(labels, le=le)} {running}")
+                    out.append(f"{PREFIX}{name}_sum{fmt(labels)} {h.sum:.6f}")
+                    out.append(f"{PREFIX}{name}_count{fmt(labels)} {h.count}")
+        return "\n".join(out) + "\n"
+
+    def jsonl(self):
+        # One line per snapshot: append to a file to keep a history
+        counters, hists = self.rows()
+        return json.dumps({"ts": round(time.time(), 3), "uptime": round(time.time() - self.started, 1),
+                           "counters": counters, "histograms": hists}) + "\n"
+
+    def export(self, folder):
+        # metrics.prom replaced atomically (node_exporter textfile style) + metrics.jsonl appended
+        os.makedirs(folder, exist_ok=True)
+        prom = os.path.join(folder, "metrics.prom")
+        tmp = f"{prom}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f: f.write(self.prometheus())
+        os.replace(tmp, prom)
+        with open(os.path.join(folder, "metrics.jsonl"), "a") as f: f.write(self.jsonl())
+        return folder
+
+    def start_exporter(self, folder, every):
+        def loop():
+            while True:
+                time.sleep(every)
+                try: self.export(folder)
+                except OSError: pass  # disk full / folder gone: try again next round
+        threading.Thread(target=loop, daemon=True, name="fleet-metrics").start()
+
+SAMPLE_ROWS = 64  # rows measured per value range; bigger ranges are scaled up
+
+def payload_bytes(obj):
+    # Rough size of Sheets values: text length of the cells (value ranges are lists of
+    # rows). Large ranges are estimated from SAMPLE_ROWS evenly spaced rows, so a
+    # 100k-row read costs the same to measure as a small one.
+    if isinstance(obj, (list, tuple)):
+        first = obj[0] if obj else None
+        if isinstance(first, (list, tuple)) and not any(isinstance(c, (list, tuple, dict)) for c in first[:1]):
+            step = max(1, len(obj) // SAMPLE_ROWS)
+            sample = obj[::step]
+            return sum(map(len, map(str, chain.from_iterable(sample)))) * len(obj) // len(sample)
+        return sum(payload_bytes(v) for v in obj)
+    if isinstance(obj, dict): return sum(payload_bytes(v) for v in obj.values())
+    if isinstance(obj, (str, int, float)): return len(str(obj))
+    return 0  # worksheet handles etc.
+
+REGISTRY = Registry()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+timed = REGISTRY.timed
+rows = REGISTRY.rows
+total = REGISTRY.total
+prometheus = REGISTRY.prometheus
+jsonl = REGISTRY.jsonl
+export = REGISTRY.export
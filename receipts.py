@@ -0,0 +1,134 @@
+# ==========================================
+# RECEIPT RENDERER (PILLOW)
+# ==========================================
+# PNG report cards for the reports tab and the payroll pack. One fixed template
+# drawn with Pillow on fonts loaded once per process (no matplotlib figure per
+# click), and an LRU of finished PNGs keyed by a hash of the receipt content, so
+# downloading the same report again is a dict lookup:
+#
+#   png = receipts.receipt_png("MONTHLY REPORT | October 2026", "USMAN", values)
+#   pngs = receipts.receipt_pngs([(title, label, values), ...], pool)  # bulk, misses on a process pool
+#
+# values: {"shifts", "hours" (text, "2:48"), "revenue", "fines", "advance", "net"}
+# with money already in SAR. render() is a plain function of its arguments, so bulk
+# renders can run in worker processes.
+
+import io
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageDraw, ImageFont
+
+WIDTH, HEIGHT = 500, 600
+BG = "#000000"
+GREEN, RED, AMBER, WHITE, GRAY = "#00ff41", "#ff0055", "#ffaa00", "#ffffff", "#808080"
+CACHE_SIZE = 256  # finished PNGs kept (~15 KB each)
+
+# Monospace first choice; Pillow also searches the system font folders by file name
+FONT_FILES = {
+    False: ["DejaVuSansMono.ttf", "LiberationMono-Regular.ttf", "cour.ttf", "Menlo.ttc"],
+    True: ["DejaVuSansMono-Bold.ttf", "LiberationMono-Bold.ttf", "courbd.ttf", "Menlo.ttc"],
+}
+_fonts = {}
+
+def font(size, bold=False):
+    if (size, bold) not in _fonts:
+        for name in FONT_FILES[bold]:
+            try:
+                _fonts[(size, bold)] = ImageFont.truetype(name, size)
+                break
+            except OSError:
+                continue
+        else:
+            try: _fonts[(size, bold)] = ImageFont.load_default(size)
+            except TypeError: _fonts[(size, bold)] = ImageFont.load_default()  # old Pillow
+    return _fonts[(size, bold)]
+
+# Template: (y, kind, ...) with y as a fraction from the top, sizes in px
+TEMPLATE = [
+    (0.07, "center", "NOMORE MANAGEMENT", 20, True, GREEN),
+    (0.12, "center", "{title}", 14, False, WHITE),
+    (0.16, "center", "TARGET: {label}", 12, False, GRAY),
+    (0.20, "dash", WHITE, 1),
+    (0.26, "pair", "TOTAL SHIFTS:", "{shifts}", 15, WHITE),
+    (0.32, "pair", "TOTAL HOURS:", "{hours} HRS", 15, WHITE),
+    (0.38, "line", GRAY, 1),
+    (0.45, "pair", "GROSS REVENUE:", "{revenue:,.0f}", 15, GREEN),
+    (0.51, "pair", "TOTAL FINES:", "-{fines:,.0f}", 15, RED),
+    (0.57, "pair", "TOTAL ADVANCE:", "{advance:,.0f}", 15, AMBER),
+    (0.64, "line", WHITE, 2),
+    (0.72, "center", "NET REVENUE", 14, False, WHITE),
+    (0.82, "center", "{net:,.0f} SAR", 30, True, WHITE),
+    (0.95, "center", "GENERATED BY SYSTEM MANAGEMENT", 10, False, GRAY),
+]
+MARGIN = 25
+
+for _row in TEMPLATE:  # preload every font the template uses
+    if _row[1] == "center": font(_row[3], _row[4])
+    elif _row[1] == "pair": font(_row[4])
+
+def render(title, label, values):
+    fields = dict(values, title=title, label=label)
+    img = Image.new("RGB", (WIDTH, HEIGHT), BG)
+    draw = ImageDraw.Draw(img)
+    for y, kind, *args in TEMPLATE:
+        y = int(y * HEIGHT)
+        if kind == "center":
+            text, size, bold, color = args
+            draw.text((WIDTH // 2, y), text.format(**fields), font=font(size, bold), fill=color, anchor="mm")
+        elif kind == "pair":
+            left, right, size, color = args
+            draw.text((MARGIN, y), left, font=font(size), fill=color, anchor="lm")
+            draw.text((WIDTH - MARGIN, y), right.format(**fields), font=font(size), fill=color, anchor="rm")
+        elif kind == "line":
+            color, width = args
+            draw.line([(MARGIN, y), (WIDTH - MARGIN, y)], fill=color, width=width)
+        else:  # dash
+            color, width = args
+            for x in range(MARGIN, WIDTH - MARGIN, 12):
+                draw.line([(x, y), (min(x + 6, WIDTH - MARGIN), y)], fill=color, width=width)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
+
+def content_key(title, label, values):
+    raw = json.dumps([title, label, values], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+def receipt_png(title, label, values):
+    key = content_key(title, label, values)
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    png = render(title, label, values)
+    with _lock:
+        _cache[key] = png
+        while len(_cache) > CACHE_SIZE: _cache.popitem(last=False)
+    return png
+
+def _render_job(job):
+    return render(*job)
+
+def receipt_pngs(jobs, pool=None, min_parallel=4):
+    # [(title, label, values)] -> [png]: cache hits first, the misses rendered on
+    # `pool` (a concurrent.futures executor) when there are enough of them
+    keys = [content_key(*job) for job in jobs]
+    with _lock: out = [_cache.get(k) for k in keys]
+    todo = [i for i, png in enumerate(out) if png is None]
+    if not todo: return out
+    pngs = None
+    if pool is not None and len(todo) >= min_parallel:
+        try: pngs = list(pool.map(_render_job, [jobs[i] for i in todo]))
+        except Exception: pngs = None  # broken / unavailable pool -> render here
+    if pngs is None: pngs = [_render_job(jobs[i]) for i in todo]
+    with _lock:
+        for i, png in zip(todo, pngs):
+            out[i] = _cache[keys[i]] = png
+        while len(_cache) > CACHE_SIZE: _cache.popitem(last=False)
+    return out
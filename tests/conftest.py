@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+import streamlit as st
+
+# app.py lives at the repo root; importing it only defines things (main() runs under streamlit)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    # cache_resource / cache_data are process-wide: every test starts from nothing
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    yield
+    st.cache_resource.clear()
+    st.cache_data.clear()
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    # save_db / load_db against a throwaway SQLite file
+    monkeypatch.setenv("FLEET_BACKEND", "sqlite")
+    monkeypatch.setenv("FLEET_SQLITE_PATH", str(tmp_path / "fleet.db"))
+    return tmp_path / "fleet.db"
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+import app
+
+def completed(days, drivers=("Usman", "Ijaz")):
+    # one 100-halala shift per driver per day, twice a day for Usman
+    start = pd.Timestamp("2024-01-01 08:00")
+    rows = [(start + pd.Timedelta(days=d, hours=h), drv) for d in range(days) for drv in drivers
+            for h in ((0, 6) if drv == "Usman" else (0,))]
+    return pd.DataFrame({"Start_Time": [t for t, _ in rows], "Driver": [d for _, d in rows],
+                         "Total_Earnings": np.full(len(rows), 100, dtype="int64")})
+
+def test_daily_revenue_sums_per_day_and_driver():
+    daily = app.daily_revenue(completed(3))
+    assert len(daily) == 6
+    assert daily.groupby("Driver")["Total_Earnings"].sum().to_dict() == {"Ijaz": 300, "Usman": 600}
+
+def test_short_range_stays_daily():
+    daily = app.daily_revenue(completed(app.CHART_DAYS))
+    assert app.bucket_series(daily)[1] == "D"
+
+def test_long_ranges_are_bucketed_without_losing_revenue():
+    for days, freq in ((200, "W"), (3 * 365, "M")):
+        df = completed(days)
+        series, got = app.bucket_series(app.daily_revenue(df))
+        assert got == freq
+        assert series["Total_Earnings"].sum() == df["Total_Earnings"].sum()
+        assert len(series) <= 2 * (days // (7 if freq == "W" else 28) + 2)
+
+def test_chart_cache_builds_once_per_version():
+    built = []
+    build = lambda: built.append(1) or object()
+    fig = app.cached_chart("analytics", 1, "admin", "admin", build)
+    assert app.cached_chart("analytics", 1, "admin", "admin", build) is fig and len(built) == 1
+    assert app.cached_chart("analytics", 2, "admin", "admin", build) is not fig
+    app.cached_chart("analytics", None, "admin", "admin", build)  # unversioned: never cached
+    app.cached_chart("analytics", None, "admin", "admin", build)
+    assert len(built) == 4
+
+def test_chart_cache_is_bounded():
+    charts = app.ChartCache(size=2)
+    for k in "abc": charts.get(k, lambda: k)
+    assert list(charts.figs) == ["b", "c"]
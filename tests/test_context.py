@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+import app
+from test_rollups import shift, trans
+
+STATES = ["Active", "Pending_Start", "Pending_End", "Completed"]
+
+@pytest.fixture
+def ctx(sqlite_db):
+    rows = [shift(f"s{i}", app.DRIVERS[i % 3], STATES[i % 4], ["Approved", "Pending"][i % 5 == 0], day=1 + i % 9)
+            for i in range(40)]
+    assert app.save_db("data", inserts=rows)
+    assert app.save_db("trans", inserts=[trans(f"t{i}", app.DRIVERS[i % 4], ["Advance", "Expense", "Challan"][i % 3],
+                                               10 + i, ["Approved", "Pending"][i % 2]) for i in range(20)])
+    return app.DataContext("admin", "admin")
+
+def ids(df, key="data"):
+    return sorted(df[app.ID_COLS[key]])
+
+def test_each_frame_loads_once_per_rerun(ctx, monkeypatch):
+    loads = []
+    real = app.load_db
+    monkeypatch.setattr(app, "load_db", lambda key, scope="all": loads.append((key, scope)) or real(key, scope))
+    ctx.open_shifts(); ctx.active_shifts(); ctx.pending_shifts(); ctx.pending_trans()
+    ctx.completed("all"); ctx.completed("all"); ctx.approved_trans("all")
+    assert sorted(loads) == [("data", "all"), ("data", "hot"), ("trans", "all"), ("trans", "hot")]
+    assert ctx.active_shifts() is ctx.active_shifts()
+
+def test_views_match_plain_filters(ctx):
+    df, tdf = app.load_db("data", "hot"), app.load_db("trans", "hot")
+    assert ids(ctx.open_shifts()) == ids(df[df["Status"].isin(["Active", "Pending_Start", "Pending_End"])])
+    assert ids(ctx.active_shifts()) == ids(df[df["Status"] == "Active"])
+    assert ids(ctx.pending_shifts()) == ids(df[df["Status"].isin(["Pending_Start", "Pending_End"])])
+    assert ids(ctx.pending_trans(), "trans") == ids(tdf[tdf["Approval_Status"] == "Pending"], "trans")
+    full = app.load_db("data")
+    assert ids(ctx.completed()) == ids(full[(full["Status"] == "Completed") & (full["Approval_Status"] == "Approved")])
+    pd.testing.assert_frame_equal(ctx.totals("all", app.DRIVERS), app.get_rollups().view("all", app.DRIVERS))
+
+def test_index_lookups_match_masks(ctx):
+    df = ctx.shifts("hot")
+    mask = df["Status"].isin(["Active", "Pending_Start"]) & (df["Driver"] == app.DRIVERS[1])
+    assert ids(ctx.rows("data", "hot", Status=["Active", "Pending_Start"], Driver=app.DRIVERS[1])) == ids(df[mask])
+    assert ids(ctx.rows("data", "hot", Driver=None)) == ids(df)  # None = no filter
+    assert ctx.rows("data", "hot", Driver="Nobody").empty
+    tdf = ctx.trans("hot")
+    assert ids(ctx.rows("trans", "hot", Type="Expense"), "trans") == ids(tdf[tdf["Type"] == "Expense"], "trans")
+    assert ctx.row("data", "s7")["Shift_ID"] == "s7" and ctx.row("data", "zz") is None
+
+def test_index_is_reused_until_the_data_changes(ctx):
+    first = ctx.index("data")
+    assert app.DataContext().index("data") is first  # next rerun, same version
+    assert app.save_db("data", updates={"s7": {"Status": "Active"}})
+    again = app.DataContext()
+    assert again.index("data") is not first
+    assert "s7" in list(again.active_shifts()["Shift_ID"])
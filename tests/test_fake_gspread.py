@@ -0,0 +1,49 @@
+import gspread
+import pytest
+
+import app
+import fake_gspread
+
+@pytest.fixture
+def ws():
+    client = fake_gspread.FakeClient(fake_gspread.FakeAPI(seed=1))
+    client.seed("book", "log", [["ID", "Name", "Amount"], ["a", "Usman", 10], ["b", "", ""]])
+    return client.open("book").worksheet("log")
+
+def test_values_come_back_as_trimmed_text(ws):
+    assert ws.get_values() == [["ID", "Name", "Amount"], ["a", "Usman", "10"], ["b", "", ""]]
+    assert ws.batch_get(["A3:C3", "B2"]) == [[["b"]], [["Usman"]]]  # trailing blanks trimmed
+    assert ws.col_values(1) == ["ID", "a", "b"]
+
+def test_writes_outside_the_grid_fail(ws):
+    with pytest.raises(gspread.exceptions.APIError):
+        ws.update(values=[["x"]], range_name="AA1")
+    ws.add_cols(1)
+    ws.update(values=[["x"]], range_name="AA1")
+    assert ws.row_values(1)[26] == "x"
+
+def test_calls_and_cells_are_counted(ws):
+    ws.api.reset()
+    ws.get_values()
+    ws.append_rows([["c", "Saood", 5]])
+    stats = ws.api.stats()
+    assert (stats["reads"], stats["writes"]) == (1, 1)
+    assert stats["calls"] == {"get_values": 1, "append_rows": 1}
+    assert stats["cells_written"] == 3
+
+def test_quota_faults_look_like_the_real_api(ws):
+    ws.api.fail_next(1)
+    with pytest.raises(gspread.exceptions.APIError) as err:
+        ws.get_values()
+    assert app.is_quota_error(err.value)
+    ws.get_values()  # next one goes through
+
+def test_per_minute_limit():
+    api = fake_gspread.FakeAPI(read_per_min=2)
+    client = fake_gspread.FakeClient(api)
+    client.seed("book", "log", [["ID"]])
+    client.open("book")
+    client.open("book")
+    with pytest.raises(gspread.exceptions.APIError):
+        client.open("book")
+    assert api.stats()["faults"] == 1
@@ -0,0 +1,62 @@
+import pytest
+
+import app
+
+class Flaky:
+    # Answers 429 for the first `fails` calls, then "ok"
+    def __init__(self, fails):
+        self.fails = fails
+        self.calls = 0
+        self.__name__ = "flaky"
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.fails:
+            raise Exception("APIError: [429]: Quota exceeded for quota metric 'Read requests'")
+        return "ok"
+
+@pytest.fixture
+def slept(monkeypatch):
+    # Record waits instead of sleeping; backoff jitter pinned to its upper bound
+    waits = []
+    monkeypatch.setattr(app.time, "sleep", waits.append)
+    monkeypatch.setattr(app.random, "uniform", lambda a, b: b)
+    return waits
+
+def test_429_backs_off_and_retries(slept):
+    gov = app.QuotaGovernor(read_per_min=600, write_per_min=600)
+    fn = Flaky(2)
+    assert gov.call("read", fn) == "ok"
+    assert fn.calls == 3
+    # strike 1 -> 2s cooldown, strike 2 -> 4s (+ the emptied bucket's next slot)
+    assert slept == [pytest.approx(2, abs=0.25), pytest.approx(4, abs=0.25)]
+    assert gov.strikes == 0  # reset by the successful call
+
+def test_quota_exhausted_after_retries(slept):
+    gov = app.QuotaGovernor(retries=3)
+    fn = Flaky(99)
+    with pytest.raises(app.QuotaExhausted):
+        gov.call("write", fn)
+    assert fn.calls == 3
+
+def test_other_errors_are_not_retried(slept):
+    gov = app.QuotaGovernor()
+    def broken():
+        raise ValueError("bad range")
+    with pytest.raises(ValueError):
+        gov.call("read", broken)
+
+def test_cooldown_sheds_reads_that_cannot_wait(slept):
+    gov = app.QuotaGovernor(read_per_min=600)
+    gov._penalise()  # someone hit a 429: whole process cools down
+    assert gov.status()["degraded"]
+    with pytest.raises(app.QuotaExhausted):
+        gov.call("read", Flaky(0), max_wait=0)
+    assert gov.shed == 1
+
+def test_token_bucket_paces_writes():
+    gov = app.QuotaGovernor(read_per_min=60, write_per_min=2)
+    assert gov._reserve("write", None) == 0 and gov._reserve("write", None) == 0
+    assert gov._reserve("write", None) == pytest.approx(30, abs=1)  # third write waits half a minute
+    with pytest.raises(app.QuotaExhausted):
+        gov._reserve("write", 5)
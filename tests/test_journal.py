@@ -0,0 +1,125 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+import app
+from test_storage import shift
+
+def wait_for(cond, timeout=5.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if cond(): return True
+        time.sleep(0.02)
+    return cond()
+
+def entry(seq, inserts=(), updates=None, deletes=()):
+    return {"seq": seq, "key": "data", "inserts": list(inserts), "updates": updates or {}, "deletes": list(deletes)}
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = app.SQLiteBackend(str(tmp_path / "fleet.db"))
+    backend.apply("data", [shift("s1"), shift("s2"), shift("s3", "Active")], {}, [])
+    return backend
+
+def journal(tmp_path, pid=None, host=None):
+    # Per-process journal next to the configured pending_writes.jsonl
+    return tmp_path / f"pending_writes.{host or socket.gethostname()}.{pid or os.getpid()}.jsonl"
+
+def dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+def ids(backend):
+    return [rid for m in backend.months("data") for rid in backend.load("data", m)["Shift_ID"]]
+
+def test_coalesce_writes_nets_rows():
+    entries = [
+        {"key": "data", "inserts": [shift("s4")]},
+        {"key": "data", "updates": {"s4": {"Status": "Active"}, "s1": {"Car": "x"}}},
+        {"key": "data", "updates": {"s1": {"Driver": "Saood"}}, "expect": {"s1": {"Rev": 1}}},
+        {"key": "data", "inserts": [shift("s5")]},
+        {"key": "data", "deletes": ["s5", "s2"]},
+    ]
+    ins, upd, dels, exp = app.coalesce_writes(entries)["data"]
+    assert [r["Shift_ID"] for r in ins] == ["s4"] and ins[0]["Status"] == "Active"
+    assert upd == {"s1": {"Car": "x", "Driver": "Saood"}}
+    assert dels == ["s2"]
+    assert exp == {"s1": {"Rev": 1}}
+
+def test_journal_replay_and_compaction(backend, tmp_path):
+    path = journal(tmp_path)
+    lines = [
+        entry(1, inserts=[shift("s9")]),
+        {"ack": [1]},  # already synced before the crash -> never replayed
+        entry(2, inserts=[shift("s4")]),
+        entry(3, updates={"s1": {"Car": app.CARS[1]}}, deletes=["s2"]),
+    ]
+    path.write_text("".join(json.dumps(l) + "\n" for l in lines) + '{"seq": 4, "key": "da')  # torn last line
+    writer = app.WriteBehindQueue(backend, str(tmp_path / "pending_writes.jsonl"), app.DataVersions(60))
+    assert writer.path == str(path) and writer.seq == 3
+    assert wait_for(lambda: writer.status()["pending"] == 0)
+    assert wait_for(lambda: path.read_text() == "")  # everything acked -> journal truncated
+    assert ids(backend) == ["s1", "s3", "s4"]
+    assert backend.load("data", app.this_month()).set_index("Shift_ID").at["s1", "Car"] == app.CARS[1]
+
+def test_flush_conflict_is_dropped_and_kept(backend, tmp_path):
+    stale = dict(entry(1, updates={"s3": {"Status": "Completed"}}), expect={"s3": {"Status": "Pending_End", "Rev": 0}}, by="Usman")
+    journal(tmp_path).write_text(json.dumps(stale) + "\n")
+    writer = app.WriteBehindQueue(backend, str(tmp_path / "pending_writes.jsonl"), app.DataVersions(60))
+    assert wait_for(lambda: writer.status()["pending"] == 0)
+    assert [(c["id"], c["outcome"], c["by"]) for c in writer.status()["conflicts"]] == [("s3", "conflict", "Usman")]
+    assert wait_for(lambda: journal(tmp_path).read_text() == "")  # dropped, not retried forever
+    assert backend.load("data", app.this_month()).set_index("Shift_ID").at["s3", "Status"] == "Active"
+    assert [c["id"] for c in writer.take_conflicts("Usman")] == ["s3"]
+    assert writer.take_conflicts("Usman") == [] and writer.take_conflicts("Saood") == []  # shown once, to its author
+
+def test_orphaned_journals_are_claimed(backend, tmp_path):
+    (tmp_path / "pending_writes.jsonl").write_text(json.dumps(entry(7, inserts=[shift("s4")])) + "\n")  # old shared file
+    journal(tmp_path, dead_pid()).write_text(json.dumps(entry(7, deletes=["s1"])) + "\n")  # same seq, other process
+    live = journal(tmp_path, os.getppid())
+    other_box = journal(tmp_path, dead_pid(), host="elsewhere")
+    for path in (live, other_box): path.write_text(json.dumps(entry(1, deletes=["s2"])) + "\n")
+    writer = app.WriteBehindQueue(backend, str(tmp_path / "pending_writes.jsonl"), app.DataVersions(60))
+    assert wait_for(lambda: writer.status()["pending"] == 0)
+    assert ids(backend) == ["s2", "s3", "s4"]  # both orphans replayed, live / remote journals left alone
+    assert sorted(p.name for p in tmp_path.glob("pending_writes*")) == sorted([journal(tmp_path).name, live.name, other_box.name])
+
+def test_submit_is_journaled_then_synced(backend, tmp_path):
+    path = tmp_path / "pending_writes.jsonl"
+    writer = app.WriteBehindQueue(backend, str(path), app.DataVersions(60))
+    assert writer.submit("data", [shift("s4")], {}, ["s1"]) == 1
+    assert wait_for(lambda: writer.status()["pending"] == 0)
+    assert ids(backend) == ["s2", "s3", "s4"]
+
+def test_save_db_reads_its_own_queued_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(app.WriteBehindQueue, "_run", lambda self: None)  # worker never syncs
+    monkeypatch.setenv("FLEET_BACKEND", "sqlite")
+    monkeypatch.setenv("FLEET_SQLITE_PATH", str(tmp_path / "fleet.db"))
+    monkeypatch.setenv("FLEET_WRITE_BEHIND", "1")
+    monkeypatch.setenv("FLEET_JOURNAL_PATH", str(tmp_path / "pending_writes.jsonl"))
+    assert app.save_db("data", inserts=[shift("s1"), shift("s2")])
+    assert app.save_db("data", updates={"s2": {"Status": "Pending_End"}})
+    df = app.load_db("data").set_index("Shift_ID")
+    assert list(df.index) == ["s1", "s2"] and df.at["s2", "Status"] == "Pending_End"
+    assert len(journal(tmp_path).read_text().splitlines()) == 2
+
+def test_load_db_keeps_writes_synced_during_the_fetch(tmp_path, monkeypatch):
+    monkeypatch.setattr(app.WriteBehindQueue, "_run", lambda self: None)
+    monkeypatch.setenv("FLEET_BACKEND", "sqlite")
+    monkeypatch.setenv("FLEET_SQLITE_PATH", str(tmp_path / "fleet.db"))
+    monkeypatch.setenv("FLEET_WRITE_BEHIND", "1")
+    monkeypatch.setenv("FLEET_JOURNAL_PATH", str(tmp_path / "pending_writes.jsonl"))
+    assert app.save_db("data", inserts=[shift("s1")])
+    fetch = app.fetch_db
+    def stale_then_synced(*args):
+        df = fetch(*args)  # read before the worker got to it
+        app.get_writer()._flush()  # ...which lands now and empties the queue
+        return df
+    monkeypatch.setattr(app, "fetch_db", stale_then_synced)
+    assert list(app.load_db("data")["Shift_ID"]) == ["s1"]
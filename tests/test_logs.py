@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+
+import app
+
+@pytest.fixture
+def logs():
+    # 120 rows, oldest first
+    return pd.DataFrame({"Shift_ID": [f"s{i}" for i in range(120)],
+                         "Start_Time": pd.date_range("2026-01-01", periods=120, freq="h")})
+
+def on_page(monkeypatch, page):
+    monkeypatch.setattr(app.st, "number_input", lambda *a, **k: page)
+
+def test_first_page_is_newest_first(logs):
+    page = app.log_page(logs, "Start_Time", "t")
+    assert len(page) == app.LOG_PAGE_SIZE
+    assert list(page["Shift_ID"][:3]) == ["s119", "s118", "s117"]
+
+def test_last_page_holds_the_remainder(logs, monkeypatch):
+    on_page(monkeypatch, 3)
+    page = app.log_page(logs, "Start_Time", "t")
+    assert list(page["Shift_ID"]) == [f"s{i}" for i in range(19, -1, -1)]
+
+def test_equal_dates_keep_their_order(logs):
+    logs["Start_Time"] = pd.Timestamp("2026-01-01")
+    assert list(app.log_page(logs, "Start_Time", "t")["Shift_ID"][:3]) == ["s0", "s1", "s2"]
+
+def test_undated_rows_go_last(logs):
+    logs.loc[[5, 60], "Start_Time"] = pd.NaT
+    page = app.log_page(logs, "Start_Time", "t")
+    assert list(page["Shift_ID"][:2]) == ["s119", "s118"]
+    assert list(app.log_page(logs.head(8), "Start_Time", "t")["Shift_ID"][-2:]) == ["s0", "s5"]
+
+def test_empty_log():
+    empty = pd.DataFrame({"Shift_ID": [], "Start_Time": pd.Series(dtype="datetime64[ns]")})
+    assert app.log_page(empty, "Start_Time", "t").empty
@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+import app
+import metrics
+from test_storage import MONTH, sheets_backend, client
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    metrics.REGISTRY.reset()
+    yield
+    metrics.REGISTRY.reset()
+
+def test_counters_sum_over_matching_labels():
+    metrics.inc("sheets_calls_total", kind="read", method="get_values")
+    metrics.inc("sheets_calls_total", 2, kind="read", method="batch_get")
+    metrics.inc("sheets_calls_total", kind="write", method="append_rows")
+    assert metrics.total("sheets_calls_total") == 4
+    assert metrics.total("sheets_calls_total", kind="read") == 3
+    assert metrics.total("sheets_calls_total", kind="read", method="nope") == 0
+
+def test_histogram_quantiles_and_prometheus_buckets():
+    for ms in range(1, 101): metrics.observe("render_seconds", ms / 1000, fn="render_fleet")
+    hist = metrics.rows()[1][0]
+    assert hist["count"] == 100 and hist["max"] == 0.1
+    assert hist["p50"] == pytest.approx(0.051) and hist["p95"] == pytest.approx(0.096)
+    text = metrics.prometheus()
+    assert "# TYPE fleet_render_seconds histogram" in text
+    assert 'fleet_render_seconds_bucket{fn="render_fleet",le="0.01"} 10' in text  # cumulative
+    assert 'fleet_render_seconds_bucket{fn="render_fleet",le="+Inf"} 100' in text
+
+def test_timed_names_the_series_after_the_function():
+    @metrics.timed("render_seconds")
+    def render_thing(): return 7
+    assert render_thing() == 7
+    assert metrics.rows()[1][0]["labels"] == {"fn": "test_timed_names_the_series_after_the_function.<locals>.render_thing"}
+
+def test_export_writes_prom_and_appends_jsonl(tmp_path):
+    metrics.inc("version_polls_total")
+    metrics.export(str(tmp_path)); metrics.export(str(tmp_path))
+    assert "fleet_version_polls_total 1" in (tmp_path / "metrics.prom").read_text()
+    lines = (tmp_path / "metrics.jsonl").read_text().splitlines()
+    assert len(lines) == 2 and json.loads(lines[0])["counters"][0]["value"] == 1
+    assert sorted(os.listdir(tmp_path)) == ["metrics.jsonl", "metrics.prom"]  # no tmp file left
+
+def test_sheets_calls_are_counted(client):
+    backend = sheets_backend(client)
+    backend.load("data", MONTH)
+    assert metrics.total("sheets_calls_total", kind="read") == client.api.stats()["reads"]
+    assert metrics.total("sheets_bytes_total", kind="read") > 0
+
+def test_fetch_db_hits_and_misses(sqlite_db):
+    app.load_db("data"); app.load_db("data")
+    assert metrics.total("cache_lookups_total", cache="fetch_db", key="data") == 2
+    assert metrics.total("cache_misses_total", cache="fetch_db", key="data") == 1
+    assert app.hit_ratio("fetch_db") == 0.5
+
+def test_payload_bytes():
+    assert metrics.payload_bytes([["ab", 12], ["c", 3.5]]) == 2 + 2 + 1 + 3
+    assert metrics.payload_bytes({"values": [["x"]], "n": 10}) == 3
+    assert metrics.payload_bytes(None) == 0
+
+def test_large_ranges_are_sampled():
+    values = [[f"s{i}", "Usman", "x" * (i % 7), i] for i in range(100_000)]
+    exact = sum(len(str(c)) for r in values for c in r)
+    assert metrics.payload_bytes(values) == pytest.approx(exact, rel=0.01)
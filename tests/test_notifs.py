@@ -0,0 +1,45 @@
+import streamlit as st
+
+import app
+from test_rollups import shift, trans
+
+def seed():
+    assert app.save_db("data", inserts=[
+        shift("start", "Usman", "Pending_Start", "Pending"), shift("end", "Ijaz", "Pending_End", "Pending", earn=300),
+        shift("done", "Saood")])
+    assert app.save_db("trans", inserts=[trans("t1", "Usman", "Advance", 50, "Pending"),
+                                         trans("t2", "Ijaz", "Expense", 20, "Pending")])
+    st.cache_data.clear()
+    ctx = app.DataContext()
+    return ctx.pending_shifts(), ctx.pending_trans()
+
+def counted_saves(monkeypatch):
+    keys = []
+    real = app.save_db
+    monkeypatch.setattr(app, "save_db", lambda key, **kw: keys.append(key) or real(key, **kw))
+    return keys
+
+def test_approve_batch_is_one_write_per_table(sqlite_db, monkeypatch):
+    shifts, trs = seed()
+    keys = counted_saves(monkeypatch)
+    assert app.notif_batch(shifts, trs, approve=True) == {"ok": 4, "failed": []}
+    assert keys == ["data", "trans"]
+    st.cache_data.clear()
+    df = app.load_db("data").set_index("Shift_ID")
+    assert (df.at["start", "Status"], df.at["end", "Status"]) == ("Active", "Completed")
+    assert set(app.load_db("trans")["Approval_Status"]) == {"Approved"}
+
+def test_reject_batch_reverts_ends_and_deletes_starts(sqlite_db):
+    shifts, trs = seed()
+    assert app.notif_batch(shifts, trs, approve=False)["ok"] == 4
+    st.cache_data.clear()
+    df = app.load_db("data").set_index("Shift_ID")
+    assert sorted(df.index) == ["done", "end"]
+    assert (df.at["end", "Status"], df.at["end", "Total_Earnings"]) == ("Active", 0)
+    assert app.load_db("trans").empty
+
+def test_rows_changed_meanwhile_are_reported(sqlite_db):
+    shifts, trs = seed()
+    assert app.save_db("data", updates={"end": {"Status": "Active"}})  # another admin got there first
+    out = app.notif_batch(shifts, trs.iloc[0:0], approve=True)
+    assert out == {"ok": 1, "failed": [("Ijaz (end)", "conflict")]}
@@ -0,0 +1,63 @@
+import io
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+import app
+import receipts
+from test_rollups import shift, trans, LAST
+from test_receipts import VALUES, empty_cache
+
+@pytest.fixture
+def ctx(sqlite_db):
+    assert app.save_db("data", inserts=[
+        dict(shift("s1", "Usman", earn=300), Duration=7.5), dict(shift("s2", "Usman", day=6), Duration=2.0),
+        dict(shift("s3", "Ijaz"), Duration=5.0), shift("s4", "Ijaz", "Active", "Pending"),
+        dict(shift("s5", "Ijaz", month=LAST), Duration=9.0)])
+    assert app.save_db("trans", inserts=[trans("t1", "Usman", "Advance", 50), trans("t2", "Ijaz", "Challan", 20),
+                                         trans("t3", "Ijaz", "Advance", 99, "Pending")])
+    return app.DataContext()
+
+def test_monthly_reports_for_every_driver(ctx):
+    reports, comp, trs, title = app.monthly_reports(ctx)
+    assert list(reports.index) == app.DRIVERS and title.startswith("MONTHLY REPORT | ")
+    assert reports.loc["Usman"].to_dict() == {"shifts": 2, "revenue": 500.0, "hours": 9.5,
+                                              "advance": 50.0, "fines": 0.0, "net": 500.0}
+    assert reports.loc["Ijaz"].to_dict() == {"shifts": 1, "revenue": 200.0, "hours": 5.0,
+                                             "advance": 0.0, "fines": 20.0, "net": 180.0}
+    assert reports.loc["Azeem", "shifts"] == 0
+
+def test_payroll_pack_zip(ctx):
+    data, name = app.payroll_pack(ctx)
+    z = zipfile.ZipFile(io.BytesIO(data))
+    folder = name[len("Payroll_Pack_"):-len(".zip")]
+    files = set(z.namelist())
+    assert f"payroll_{folder}/summary.csv" in files
+    for d in app.DRIVERS:
+        assert {f"payroll_{folder}/{d}/{f}" for f in ("receipt.png", "shifts.csv", "transactions.csv")} <= files
+    summary = pd.read_csv(z.open(f"payroll_{folder}/summary.csv"), index_col="Driver")
+    assert summary.loc["Usman", "Shifts"] == 2 and summary.loc["Usman", "Hours"] == 9.5
+    assert summary.loc["Ijaz", "Net_Payable"] == round(app.payroll(ctx.totals("month", app.DRIVERS)).loc["Ijaz", "payable"], 2)
+    shifts = pd.read_csv(z.open(f"payroll_{folder}/Usman/shifts.csv"))
+    assert sorted(shifts["Shift_ID"]) == ["s1", "s2"] and shifts["Total_Earnings"].sum() == 500
+
+def test_receipt_pngs_use_cache_then_pool():
+    jobs = [(f"R{i}", "ALL", VALUES) for i in range(6)]
+    cached = receipts.receipt_png(*jobs[0])
+    with ThreadPoolExecutor(2) as pool:
+        out = receipts.receipt_pngs(jobs, pool)
+    assert out[0] is cached and all(png.startswith(b"\x89PNG") for png in out)
+    assert receipts.receipt_pngs(jobs, None) == out  # all hits now
+
+def test_broken_pool_renders_in_process():
+    class Broken:
+        def map(self, fn, jobs): raise RuntimeError("pool died")
+    out = receipts.receipt_pngs([(f"R{i}", "ALL", VALUES) for i in range(5)], Broken())
+    assert len(out) == 5 and all(out)
+
+def test_this_month_reports_follow_the_riyadh_month(ctx):
+    assert app.month_name("2026-01") == "January 2026"
+    title = app.monthly_reports(ctx)[3]
+    assert title == f"MONTHLY REPORT | {app.month_name(app.this_month())}"
@@ -0,0 +1,41 @@
+import pytest
+
+import app
+from test_rollups import shift, trans, LAST
+
+def old_salary_rows(df, tdf):
+    # the per-driver loop render_salary used before payroll() (amounts in SAR)
+    comp = df[(df['Status'] == 'Completed') & (df['Approval_Status'] == 'Approved')]
+    adv_df = tdf[(tdf['Type'] == 'Advance') & (tdf['Approval_Status'] == 'Approved')]
+    fine_df = tdf[tdf['Type'] == 'Challan']
+    rows = {}
+    for driver in app.DRIVERS:
+        driver_shifts = comp[comp['Driver'] == driver]
+        rev = app.sar(driver_shifts['Total_Earnings'].sum())
+        ratio = min(rev / app.MONTHLY_TARGET, 1.0) if app.MONTHLY_TARGET > 0 else 0
+        sal = app.BASE_SALARY * ratio
+        taken = app.sar(adv_df[adv_df['Driver'] == driver]['Amount'].sum())
+        penalties = app.sar(fine_df[fine_df['Driver'] == driver]['Amount'].sum())
+        shift_count = len(driver_shifts)
+        rows[driver] = {"shifts": shift_count, "revenue": rev, "ratio": ratio, "salary": sal,
+                        "advances": taken, "fines": penalties, "payable": sal - taken - penalties,
+                        "avg_shift": rev / shift_count if shift_count > 0 else 0}
+    return rows
+
+def test_payroll_matches_per_driver_loop(sqlite_db):
+    shifts = [shift(f"s{i}", app.DRIVERS[i % 5], ["Completed", "Active"][i % 7 == 0],
+                    ["Approved", "Pending"][i % 4 == 0], day=1 + i % 20, earn=150 + 37 * i) for i in range(60)]
+    shifts.append(shift("old", "Usman", earn=9999, month=LAST))  # other month: not this payroll
+    assert app.save_db("data", inserts=shifts)
+    assert app.save_db("trans", inserts=[
+        trans(f"t{i}", app.DRIVERS[i % 6], ["Advance", "Challan", "Expense"][i % 3], 25 + 11 * i,
+              ["Approved", "Pending"][i % 5 == 0]) for i in range(30)])
+    old = old_salary_rows(app.load_db("data", "month"), app.load_db("trans", "month"))
+    pay = app.payroll(app.get_rollups().view("month", app.DRIVERS))
+    assert list(pay.index) == app.DRIVERS
+    for driver, want in old.items():
+        got = pay.loc[driver]
+        for col, val in want.items():
+            assert got[col] == pytest.approx(val), (driver, col)
+    assert pay["payable"].sum() == pytest.approx(sum(r["payable"] for r in old.values()))
+    assert pay.loc["Azeem", "avg_shift"] == 0  # no shifts: no division by zero
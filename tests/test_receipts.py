@@ -0,0 +1,36 @@
+import io
+
+import pytest
+from PIL import Image
+
+import receipts
+
+VALUES = {"shifts": 12, "hours": "96:30", "revenue": 4200.0, "fines": 150.0, "advance": 300.0, "net": 3750.0}
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    receipts._cache.clear()
+    yield
+    receipts._cache.clear()
+
+def test_render_is_a_png_of_the_template_size():
+    img = Image.open(io.BytesIO(receipts.render("MONTHLY REPORT", "USMAN", VALUES)))
+    assert img.format == "PNG" and img.size == (receipts.WIDTH, receipts.HEIGHT)
+
+def test_same_content_is_served_from_cache(monkeypatch):
+    first = receipts.receipt_png("MONTHLY REPORT", "USMAN", VALUES)
+    monkeypatch.setattr(receipts, "render", lambda *a: pytest.fail("rendered twice"))
+    assert receipts.receipt_png("MONTHLY REPORT", "USMAN", dict(VALUES)) is first
+
+def test_changed_values_render_again():
+    first = receipts.receipt_png("MONTHLY REPORT", "USMAN", VALUES)
+    assert receipts.receipt_png("MONTHLY REPORT", "USMAN", dict(VALUES, net=1.0)) != first
+    assert len(receipts._cache) == 2
+
+def test_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(receipts, "CACHE_SIZE", 3)
+    monkeypatch.setattr(receipts, "render", lambda title, label, values: title.encode())
+    for i in range(5): receipts.receipt_png(f"R{i}", "ALL", VALUES)
+    receipts.receipt_png("R2", "ALL", VALUES)  # touched -> most recent
+    receipts.receipt_png("R5", "ALL", VALUES)
+    assert [v.decode() for v in receipts._cache.values()] == ["R4", "R2", "R5"]
@@ -0,0 +1,71 @@
+import pandas as pd
+import streamlit as st
+
+import app
+
+MONTH = app.this_month()
+LAST = app.add_months(MONTH, -1)
+
+def shift(rid, driver, status="Completed", approval="Approved", month=MONTH, day=5, earn=200):
+    return {"Shift_ID": rid, "Driver": driver, "Car": app.CARS[0], "Status": status,
+            "Approval_Status": approval, "Start_Time": f"{month}-{day:02d} 08:00:00", "Total_Earnings": earn}
+
+def trans(rid, driver, kind, amount, approval="Approved", month=MONTH, source="Driver"):
+    return {"Trans_ID": rid, "Date": f"{month}-06", "Driver": driver, "Type": kind, "Amount": amount,
+            "Approval_Status": approval, "Source": source}
+
+def recompute(scope):
+    # what a cold start would build from the stored rows
+    st.cache_data.clear()
+    return app.RollupStore().view(scope, app.DRIVERS)
+
+def assert_live_matches_recompute():
+    for scope in ("all", "month", "hot"):
+        pd.testing.assert_frame_equal(app.get_rollups().view(scope, app.DRIVERS), recompute(scope))
+
+def test_rollups_follow_saves(sqlite_db):
+    app.get_rollups().view("all")  # built (empty) up front: every save below is applied as a delta
+    assert app.save_db("data", inserts=[
+        shift("s1", "Usman"), shift("s2", "Usman", day=6, earn=300), shift("s3", "Ijaz", month=LAST),
+        shift("s4", "Ijaz", "Pending_End", "Pending"), shift("s5", "Usman", "Active", "Pending", day=6)])
+    assert app.save_db("trans", inserts=[
+        trans("t1", "Usman", "Advance", 50), trans("t2", "Ijaz", "Challan", 20, "Pending"),
+        trans("t3", "Ijaz", "Expense", 70, "Pending", month=LAST),
+        trans("t4", "Usman", "CEO_Transfer", 500, source="Manager")])
+    assert_live_matches_recompute()
+    usman = app.get_rollups().view("month").loc["Usman"]
+    assert (usman["revenue"], usman["shifts"], usman["days"], usman["advances"]) == (500 * app.HALALA, 2, 2, 50 * app.HALALA)
+
+    # approve: shift + expense move into the totals
+    assert app.save_db("data", updates={"s4": {"Status": "Completed", "Approval_Status": "Approved"}})
+    assert app.save_db("trans", updates={"t3": {"Approval_Status": "Approved"}})
+    assert_live_matches_recompute()
+    assert app.get_rollups().view("month").at["Ijaz", "revenue"] == 200 * app.HALALA  # money is kept in halalas
+
+    # revert: back out of the totals, day count drops with the last shift of that day
+    assert app.save_db("data", updates={"s2": {"Approval_Status": "Rejected"}, "s4": {"Approval_Status": "Pending"}})
+    assert app.save_db("trans", updates={"t3": {"Approval_Status": "Pending"}})
+    assert_live_matches_recompute()
+    assert app.get_rollups().view("month").at["Usman", "days"] == 1
+
+    # edits that move a row between drivers / months, and deletes
+    assert app.save_db("data", updates={"s1": {"Driver": "Saood"}, "s3": {"Start_Time": f"{MONTH}-02 08:00:00"}},
+                       deletes=["s5"])
+    assert app.save_db("trans", deletes=["t1"])
+    assert_live_matches_recompute()
+
+def test_rollups_pick_up_another_process_write(sqlite_db):
+    assert app.save_db("data", inserts=[shift("s1", "Usman")])
+    assert app.get_rollups().view("month").at["Usman", "shifts"] == 1
+    app.SQLiteBackend(str(sqlite_db)).apply("data", [shift("s2", "Usman", day=7)], {}, [])  # another process
+    app.get_versions().polled = -1e9  # next poll is due
+    assert app.get_rollups().view("month").at["Usman", "shifts"] == 2
+    assert_live_matches_recompute()
+
+def test_save_of_rows_never_loaded_patches_nothing(sqlite_db):
+    assert app.save_db("data", inserts=[shift("s1", "Usman")])
+    before = app.get_rollups().view("all", app.DRIVERS)
+    result = app.WriteResult()
+    result["s9"] = "ok"  # e.g. a row outside the loaded months
+    app.get_rollups().on_save("data", app.load_db("data").iloc[0:0], [], {"s9": {"Status": "Completed"}}, [], result)
+    pd.testing.assert_frame_equal(app.get_rollups().view("all", app.DRIVERS), before)
@@ -0,0 +1,31 @@
+import pandas as pd
+
+import app
+
+def test_normalise_shifts():
+    raw = pd.DataFrame({
+        "Shift_ID": ["s1", "s2", "s3"],
+        "Driver": ["Usman", "Saood", "Usman"],
+        "Start_Time": ["2026-10-05 08:00:00", "2026-10-05 08:00", ""],
+        "Duration": ["7.5", "7:30:00", ""],
+        "Total_Earnings": ["1,234.50", "200", ""],
+        "Start_Fuel": ["80", "", "abc"],
+    })
+    df = app.normalise_frame("data", raw)
+    assert list(df["Total_Earnings"]) == [123450, 20000, 0]  # halala
+    assert df["Total_Earnings"].dtype == "int64"
+    assert list(df["Duration"]) == [7.5, 7.5, 0.0]
+    assert list(df["Start_Fuel"]) == [80, 0, 0] and df["Start_Fuel"].dtype == "int16"
+    assert df["Start_Time"].iloc[1] == pd.Timestamp("2026-10-05 08:00") and pd.isna(df["Start_Time"].iloc[2])
+    assert isinstance(df["Driver"].dtype, pd.CategoricalDtype)
+    assert set(app.REQ_COLS["data"]) <= set(df.columns)  # missing columns added
+
+def test_money_round_trips_through_to_cell():
+    df = app.normalise_frame("trans", pd.DataFrame({"Amount": ["19.99"]}))
+    assert df["Amount"].iloc[0] == 1999
+    assert app.sar(df["Amount"].iloc[0]) == 19.99
+
+def test_to_cell():
+    assert app.to_cell(pd.Timestamp("2026-10-05 08:00")) == "2026-10-05 08:00:00"
+    assert app.to_cell(pd.NaT) == "" and app.to_cell(None) == ""
+    assert type(app.to_cell(pd.Series([3]).iloc[0])) is int
@@ -0,0 +1,49 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import app
+
+@pytest.fixture
+def store(tmp_path):
+    return app.SessionStore(str(tmp_path / "sessions.db"))
+
+def test_create_get_revoke(store):
+    token = store.create("usman")
+    assert store.get(token) == "usman"
+    assert store.get("nope") is None
+    store.revoke(token)
+    assert store.get(token) is None
+
+def test_other_process_sees_revoke_after_cache_ttl(store, tmp_path, monkeypatch):
+    token = store.create("usman")
+    other = app.SessionStore(str(tmp_path / "sessions.db"))
+    assert other.get(token) == "usman"  # one primary-key lookup, then cached
+    store.revoke(token)
+    assert other.get(token) == "usman"
+    monkeypatch.setattr(app, "SESSION_CACHE_TTL", 0)
+    assert other.get(token) is None
+
+def test_expired_tokens_are_refused_and_collected(store):
+    old = store.create("usman", hours=-1)
+    live = store.create("ijaz")
+    assert store.get(old) is None
+    assert store.gc() == 1
+    assert store.get(live) == "ijaz"
+    assert old not in store.cache
+
+def test_legacy_json_is_imported_once(tmp_path):
+    legacy = tmp_path / "active_sessions.json"
+    fmt = "%Y-%m-%d %H:%M:%S"
+    legacy.write_text(json.dumps({
+        "live": {"username": "usman", "expiry": (datetime.now() + timedelta(hours=2)).strftime(fmt)},
+        "dead": {"username": "ijaz", "expiry": (datetime.now() - timedelta(hours=2)).strftime(fmt)},
+        "junk": {"username": "x"}}))
+    store = app.SessionStore(str(tmp_path / "sessions.db"), legacy=str(legacy))
+    assert store.get("live") == "usman" and store.get("dead") is None and store.get("junk") is None
+    assert not legacy.exists() and os.path.exists(str(legacy) + ".imported")
+    store.revoke("live")
+    again = app.SessionStore(str(tmp_path / "sessions.db"), legacy=str(legacy))  # restart
+    assert again.get("live") is None
@@ -0,0 +1,268 @@
+import os
+import time
+import threading
+
+import pandas as pd
+import pytest
+import streamlit as st
+
+import app
+import fake_gspread
+
+SHEET = "FLEET_DB_V15"
+MONTH = app.this_month()  # hot partition
+
+def shift(rid, status="Completed", month=MONTH):
+    return {"Shift_ID": rid, "Driver": "Usman", "Car": app.CARS[0], "Status": status,
+            "Approval_Status": "Approved", "Start_Time": f"{month}-05 08:00:00", "Total_Earnings": 200}
+
+def row(r):
+    r = dict({app.REV_COL: 1}, **r)  # rows already in the sheet are at revision 1
+    return [r.get(c, "") for c in app.REQ_COLS["data"]]
+
+@pytest.fixture
+def client(monkeypatch):
+    # Sheets emulator with this month's partition seeded; save_db / load_db go through it
+    client = fake_gspread.FakeClient(fake_gspread.FakeAPI(seed=1))
+    client.seed(SHEET, app.part_title("data", MONTH),
+                [app.REQ_COLS["data"]] + [row(r) for r in (shift("s1"), shift("s2"), shift("s3", "Active"))])
+    monkeypatch.setattr(app, "get_google_sheet_client", lambda: client)
+    monkeypatch.setenv("FLEET_WRITE_BEHIND", "0")
+    monkeypatch.setenv("FLEET_SNAPSHOT_DIR", "")
+    monkeypatch.setattr(app.time, "sleep", lambda s: None)
+    return client
+
+def sheets_backend(client, **kwargs):
+    return app.SheetsBackend(client, SHEET, app.QuotaGovernor(6000, 6000), **kwargs)
+
+def worksheet(client, month=MONTH):
+    title = app.part_title("data", month)
+    return next(ws for ws in client.files[SHEET].sheets if ws.title == title)  # no API call counted
+
+def rows(client, month=MONTH):
+    cells = worksheet(client, month).cells
+    return {r[0]: dict(zip(cells[0], r)) for r in cells[1:]}
+
+def calls(client):
+    return client.api.stats()["calls"]
+
+def test_update_patches_only_changed_cells(client):
+    assert app.save_db("data", updates={"s3": {"Status": "Pending_End"}})
+    assert calls(client)["batch_update"] == 1
+    assert "get_all_records" not in calls(client) and "append_rows" not in calls(client)
+    assert rows(client)["s3"]["Status"] == "Pending_End"
+    assert rows(client)["s1"]["Status"] == "Completed"
+
+def test_insert_is_one_append(client):
+    assert app.save_db("data", inserts=[shift("s4"), shift("s5")])
+    assert calls(client)["append_rows"] == 1 and "batch_update" not in calls(client)
+    assert list(rows(client)) == ["s1", "s2", "s3", "s4", "s5"]
+
+def test_deletes_go_bottom_up_in_one_request(client):
+    assert app.save_db("data", deletes=["s1", "s3"])
+    assert calls(client)["spreadsheet_batch_update"] == 1
+    assert list(rows(client)) == ["s2"]
+
+def test_quota_retry_does_not_append_twice(client, monkeypatch):
+    monkeypatch.setenv("FLEET_READ_MAX_WAIT", "60")  # wait the cooldown out instead of shedding
+    client.api.fail_next(1)  # first call answers 429
+    assert app.save_db("data", inserts=[shift("s4")], deletes=["s1"])
+    assert calls(client)["append_rows"] == 1
+    assert list(rows(client)) == ["s2", "s3", "s4"]
+
+def test_nothing_to_save():
+    assert app.save_db("data") is False
+
+# ---------- incremental (tail) loads ----------
+
+def test_tail_load_reads_only_new_and_open_rows(client):
+    backend = sheets_backend(client)
+    assert list(backend.load("data", MONTH)["Shift_ID"]) == ["s1", "s2", "s3"]
+    worksheet(client).cells.append(row(shift("s4")))
+    worksheet(client).cells[3][app.REQ_COLS["data"].index("Status")] = "Pending_End"  # s3 was open
+    client.api.reset()
+    df = backend.load("data", MONTH).set_index("Shift_ID")
+    assert "get_values" not in calls(client) and calls(client)["batch_get"] == 1
+    assert list(df.index) == ["s1", "s2", "s3", "s4"]
+    assert df.at["s3", "Status"] == "Pending_End"
+
+def test_moved_rows_fall_back_to_full_load(client):
+    backend = sheets_backend(client)
+    backend.load("data", MONTH)
+    del worksheet(client).cells[1]  # s1 deleted upstream -> row numbers shifted
+    client.api.reset()
+    assert list(backend.load("data", MONTH)["Shift_ID"]) == ["s2", "s3"]
+    assert calls(client)["get_values"] == 1
+
+# ---------- warm start from Arrow snapshots ----------
+
+def test_warm_start_serves_the_snapshot(client, tmp_path):
+    store = app.SnapshotStore(str(tmp_path / "snap"))
+    first = sheets_backend(client, snapshots=store).load("data", MONTH)
+    deadline = time.monotonic() + 5
+    while not any(f.endswith(".arrow") for f in os.listdir(store.folder)) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    again = sheets_backend(client, snapshots=store).load("data", MONTH)  # fresh process, same box
+    pd.testing.assert_frame_equal(again, first)
+
+def test_broken_snapshot_is_ignored(client, tmp_path):
+    store = app.SnapshotStore(str(tmp_path / "snap"))
+    for name in (app.part_title("data", MONTH) + ".arrow", "shifts_log.arrow"):
+        (tmp_path / "snap" / name).write_bytes(b"not arrow")
+    assert list(sheets_backend(client, snapshots=store).load("data", MONTH)["Shift_ID"]) == ["s1", "s2", "s3"]
+
+def test_warm_loads_do_not_wait_behind_a_reconcile(client, tmp_path):
+    last = app.add_months(MONTH, -1)
+    client.seed(SHEET, app.part_title("data", last), [app.REQ_COLS["data"]] + [row(shift("s9", month=last))])
+    store = app.SnapshotStore(str(tmp_path / "snap"))
+    warm = sheets_backend(client, snapshots=store)
+    warm.load("data", MONTH); warm.load("data", last)
+    deadline = time.monotonic() + 5
+    while len([f for f in os.listdir(store.folder) if f.endswith(".arrow")]) < 2 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    hit = client.api.hit
+    client.api.hit = lambda *a: threading.Event().wait(0.5) or hit(*a)  # slow Sheets (time.sleep is stubbed)
+    backend = sheets_backend(client, snapshots=store)  # restart
+    start = time.monotonic()
+    assert list(backend.load("data", MONTH)["Shift_ID"]) == ["s1", "s2", "s3"]
+    assert list(backend.load("data", last)["Shift_ID"]) == ["s9"]
+    assert list(backend.load("data", MONTH)["Shift_ID"]) == ["s1", "s2", "s3"]  # its reconcile still running
+    assert time.monotonic() - start < 0.4
+
+def test_page_reads_do_not_wait_out_a_cooldown(client):
+    backend = sheets_backend(client)  # default: read_max_wait=0
+    first = backend.load("data", MONTH)
+    backend.gov._penalise()
+    client.api.reset()
+    again = backend.load("data", MONTH)  # served from the last good copy
+    assert client.api.stats()["reads"] == 0
+    pd.testing.assert_frame_equal(again, first)
+    assert backend.gov.shed >= 1
+
+# ---------- compare-and-set (expect_row / WriteResult) ----------
+
+def test_row_matches():
+    current = {"Status": "Pending_End", "Rev": 4}
+    assert app.row_matches(current, {"Status": ["Active", "Pending_End"], "Rev": 2})
+    assert not app.row_matches(current, {"Status": "Active", "Rev": 2})
+    assert app.row_matches(current, {"Status": "Active", "Rev": 4})  # same Rev = nothing changed
+    assert not app.row_matches(current, {"Rev": 3})
+
+def test_conflicting_update_is_refused(client):
+    mine = sheets_backend(client)
+    seen = mine.load("data", MONTH).set_index("Shift_ID").loc["s3"].to_dict()
+    assert sheets_backend(client).apply("data", [], {"s3": {"Status": "Pending_End"}}, [])  # second process
+    client.api.reset()
+    result = mine.apply("data", [], {"s3": {"Status": "Completed"}}, [], {"s3": app.expect_row(seen, "Status")})
+    assert not result
+    assert result["s3"] == "conflict" and result.failed() == ["s3"]
+    assert "batch_update" not in calls(client)
+    assert rows(client)["s3"]["Status"] == "Pending_End"
+
+def test_unrelated_change_merges(client):
+    mine = sheets_backend(client)
+    seen = mine.load("data", MONTH).set_index("Shift_ID").loc["s3"].to_dict()
+    assert sheets_backend(client).apply("data", [], {"s3": {"Start_Fuel": 80}}, [])
+    # Rev moved, but the asserted field is unchanged -> still ok
+    assert mine.apply("data", [], {"s3": {"Status": "Pending_End"}}, [], {"s3": app.expect_row(seen, "Status")})
+    row = rows(client)["s3"]
+    assert (row["Status"], row["Start_Fuel"], row["Rev"]) == ("Pending_End", "80", "3")
+
+def test_missing_row(client):
+    result = sheets_backend(client).apply("data", [], {"zz": {"Status": "Completed"}}, [])
+    assert not result and result["zz"] == "missing"
+
+def test_sqlite_compare_and_set(tmp_path):
+    backend = app.SQLiteBackend(str(tmp_path / "fleet.db"))
+    backend.apply("data", [shift("s1", "Active")], {}, [])
+    stale = {"s1": {"Status": "Active", "Rev": 1}}
+    assert backend.apply("data", [], {"s1": {"Status": "Pending_End"}}, [], stale)
+    result = backend.apply("data", [], {"s1": {"Status": "Completed"}}, [], stale)
+    assert result["s1"] == "conflict"
+    assert backend.apply("data", [], {}, ["s1"], {"s1": {"Status": "Pending_End"}})  # field still matches
+    assert backend.load("data", MONTH).empty
+
+def test_save_db_warns_on_conflict(sqlite_db):
+    assert app.save_db("data", inserts=[shift("s1", "Active")])
+    assert app.save_db("data", updates={"s1": {"Status": "Pending_End"}}, expect={"s1": {"Status": "Active"}})
+    result = app.save_db("data", updates={"s1": {"Status": "Completed"}}, expect={"s1": {"Status": "Active"}})
+    assert not result and result["s1"] == "conflict"
+
+# ---------- monthly partitions ----------
+
+def test_rows_land_in_their_month(client):
+    old = app.add_months(MONTH, -3)
+    assert app.save_db("data", inserts=[shift("s7", month=old)])
+    assert app.part_title("data", old) in [ws.title for ws in client.files[SHEET].sheets]  # new partition
+    assert "s7" not in rows(client)
+    assert app.save_db("data", updates={"s7": {"Car": app.CARS[1]}})  # found in its own month
+
+def test_scoped_loads(sqlite_db):
+    old = app.add_months(MONTH, -3)
+    assert app.save_db("data", inserts=[shift("s1"), shift("s2", month=old)])
+    st.cache_data.clear()
+    assert list(app.load_db("data", "hot")["Shift_ID"]) == ["s1"]
+    assert list(app.load_db("data", old)["Shift_ID"]) == ["s2"]
+    assert sorted(app.load_db("data")["Shift_ID"]) == ["s1", "s2"]
+
+def old_open_rows_stay_live():
+    old = app.add_months(MONTH, -3)
+    assert app.save_db("data", inserts=[shift("s7", "Active", month=old), shift("s8", month=old)])
+    assert app.save_db("trans", inserts=[{"Trans_ID": "t1", "Date": f"{old}-02", "Driver": "Usman",
+                                          "Type": "Advance", "Amount": 5, "Approval_Status": "Pending"}])
+    ctx = app.DataContext()
+    assert "s7" in list(ctx.active_shifts()["Shift_ID"])
+    assert "s8" not in list(ctx.shifts("hot")["Shift_ID"])  # closed rows of old months stay out
+    assert list(ctx.pending_trans()["Trans_ID"]) == ["t1"]
+
+def test_open_rows_of_old_months_on_sqlite(sqlite_db):
+    old_open_rows_stay_live()
+
+def test_open_rows_of_old_months_on_sheets(client):
+    old_open_rows_stay_live()
+
+def seed_cold(client, title, shifts):
+    client.seed(SHEET, title, [app.REQ_COLS["data"]] + [row(r) for r in shifts])
+
+def test_cold_months_are_scanned_not_downloaded(client):
+    old = app.add_months(MONTH, -3)
+    seed_cold(client, app.part_title("data", old),
+              [shift(f"o{i}", month=old) for i in range(50)] + [shift("o50", "Active", month=old)])
+    client.api.reset()
+    assert list(app.load_db("data", "hot")["Shift_ID"]) == ["s1", "s2", "s3", "o50"]
+    assert calls(client)["get_values"] == 1  # the hot month only
+    assert client.api.stats()["cells_read"] < 150  # status column + one row, not 51 full rows
+
+def test_legacy_sheet_gives_wanted_months_and_open_rows(client):
+    old = app.add_months(MONTH, -3)
+    seed_cold(client, "shifts_log", [shift("l1"), shift("l2", month=old), shift("l3", "Pending_End", month=old)])
+    client.api.reset()
+    assert sorted(app.load_db("data", "hot")["Shift_ID"]) == ["l1", "l3", "s1", "s2", "s3"]
+    assert calls(client)["get_values"] == 1  # the hot month only
+
+def test_scanned_open_row_is_updated_in_place(client):
+    old = app.add_months(MONTH, -3)
+    seed_cold(client, app.part_title("data", old), [shift("o1", month=old), shift("o2", "Active", month=old)])
+    backend = sheets_backend(client)
+    backend.load("data", MONTH)
+    assert list(backend.open_rows("data", [old])["Shift_ID"]) == ["o2"]
+    client.api.reset()
+    assert backend.apply("data", [], {"o2": {"Status": "Pending_End"}}, [])
+    assert calls(client)["col_values"] == 1  # straight to its month, no search of the others
+    assert rows(client, old)["o2"]["Status"] == "Pending_End"
+    assert list(backend.open_rows("data", [old])["Status"]) == ["Pending_End"]  # own write re-scans
+
+# ---------- SQLite backend ----------
+
+def test_sqlite_round_trip(sqlite_db):
+    assert app.save_db("data", inserts=[shift("s1"), shift("s2"), shift("s3", "Active")])
+    assert app.save_db("data", updates={"s3": {"Status": "Pending_End"}}, deletes=["s1"])
+    st.cache_data.clear()
+    df = app.load_db("data")
+    assert list(df["Shift_ID"]) == ["s2", "s3"]
+    assert df.set_index("Shift_ID").at["s3", "Status"] == "Pending_End"
+
+def test_sqlite_adds_new_columns(sqlite_db):
+    assert app.save_db("trans", inserts=[{"Trans_ID": "t1", "Driver": "Usman", "Amount": 50, "Extra": "x"}])
+    st.cache_data.clear()
+    assert app.load_db("trans").iloc[0]["Extra"] == "x"
@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+import streamlit as st
+
+import app
+from test_storage import shift, sheets_backend, client
+
+def test_sqlite_write_bumps_only_its_table(tmp_path):
+    backend = app.SQLiteBackend(str(tmp_path / "fleet.db"))
+    before = backend.versions()
+    result = backend.apply("data", [shift("s1")], {}, [])
+    after = backend.versions()
+    assert result.version == after["data"] > before.get("data", 0)
+    assert after.get("trans", 0) == before.get("trans", 0)
+    assert backend.apply("data", [], {"zz": {"Car": app.CARS[1]}}, []).version is None  # nothing changed
+    assert backend.versions() == after
+
+def test_sheets_write_bumps_meta_version(client):
+    backend = sheets_backend(client)
+    before = backend.versions().get("data", 0)
+    result = backend.apply("data", [], {"s1": {"Car": app.CARS[1]}}, [])
+    assert result.version > before and backend.versions()["data"] == result.version
+
+def test_other_process_write_shows_after_one_poll(sqlite_db):
+    assert app.save_db("data", inserts=[shift("s1")])
+    assert list(app.load_db("data")["Shift_ID"]) == ["s1"]
+    app.SQLiteBackend(str(sqlite_db)).apply("data", [shift("s2")], {}, [])  # another process
+    assert list(app.load_db("data")["Shift_ID"]) == ["s1"]  # within the poll interval: cached copy
+    app.get_versions().polled = -1e9
+    assert list(app.load_db("data")["Shift_ID"]) == ["s1", "s2"]
+
+def test_saving_one_table_keeps_the_other_cached(sqlite_db, monkeypatch):
+    assert app.save_db("data", inserts=[shift("s1")])
+    app.load_db("data"); app.load_db("trans")
+    loads = []
+    real = app.SQLiteBackend.load
+    monkeypatch.setattr(app.SQLiteBackend, "load", lambda self, key, *a: loads.append(key) or real(self, key, *a))
+    assert app.save_db("trans", inserts=[{"Trans_ID": "t1", "Driver": "Usman", "Type": "Advance", "Amount": 5}])
+    app.load_db("data"); app.load_db("trans")
+    assert "data" not in loads and "trans" in loads
+
+def test_frame_cache_keeps_only_the_latest_version():
+    frames = app.FrameCache()
+    first = frames.get("data", "all", 1, lambda: "v1")
+    assert frames.get("data", "all", 1, lambda: pytest.fail("reloaded")) == first
+    assert frames.get("data", "all", 2, lambda: "v2") == "v2"
+    frames.get("data", "hot", 2, lambda: "hot")
+    assert frames.frames == {("data", "all"): (2, "v2"), ("data", "hot"): (2, "hot")}
+
+def test_concurrent_misses_share_one_load():
+    frames, loads, gate = app.FrameCache(), [], threading.Event()
+    def load():
+        loads.append(1); gate.wait(1); return "df"
+    threads = [threading.Thread(target=frames.get, args=("data", "all", 1, load)) for _ in range(4)]
+    for t in threads: t.start()
+    time.sleep(0.1); gate.set()
+    for t in threads: t.join()
+    assert len(loads) == 1
+
+def test_queued_writes_overlay_a_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(app.WriteBehindQueue, "_run", lambda self: None)  # worker never syncs
+    monkeypatch.setenv("FLEET_BACKEND", "sqlite")
+    monkeypatch.setenv("FLEET_SQLITE_PATH", str(tmp_path / "fleet.db"))
+    monkeypatch.setenv("FLEET_WRITE_BEHIND", "1")
+    monkeypatch.setenv("FLEET_JOURNAL_PATH", str(tmp_path / "pending_writes.jsonl"))
+    app.SQLiteBackend(str(tmp_path / "fleet.db")).apply("data", [shift("s1")], {}, [])
+    assert app.save_db("data", updates={"s1": {"Status": "Pending_End"}})
+    assert app.load_db("data").at[0, "Status"] == "Pending_End"
+    cached = app.get_frames().frames[("data", "all")][1]
+    assert cached.at[0, "Status"] == "Completed"  # shared frame untouched